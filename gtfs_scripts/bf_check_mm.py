@@ -1,5 +1,10 @@
 # This script builds PostGIS geometries of the results of BMW Car IT's Barefoot Map-matching algorithm on GTFS bus routes.
+# The merged route of each shape and the points of shapes and stops are projected once into indexed tables, distances and indicators are then computed
+# from these tables by several connections (mapmatching.check.connections), each one for a range of shape IDs.
 
+import sys
+import math
+import threading
 import psycopg2
 import os
 from configobj import ConfigObj
@@ -7,6 +12,63 @@ from configobj import ConfigObj
 conn = None
 cur = None
 
+# Condition that selects the shapes of a range, the bounds are passed as the parameters low and high (None for the last range)
+def in_range(alias):
+	return "{0}.shape_id >= %(low)s AND (%(high)s IS NULL OR {0}.shape_id < %(high)s)".format(alias)
+
+# Splits the shape IDs returned by query into at most n ranges of about the same number of shapes. Returns the list of (low, high) bounds.
+def shape_ranges(cur, query, n):
+	cur.execute(query)
+	shape_ids = [r[0] for r in cur.fetchall()]
+	size = max(int(math.ceil(len(shape_ids) / float(n))), 1)
+	lows = shape_ids[::size]
+	return [(low, lows[i + 1] if i + 1 < len(lows) else None) for (i, low) in enumerate(lows)]
+
+# Creates an empty table for the rows of query, or with incremental deletes the rows of new, changed and removed shapes from the existing table. Returns True if the table was created.
+def prepare_table(schema, table, query):
+	cur.execute("""SELECT 1 FROM pg_tables WHERE schemaname = %s AND tablename = %s;""", (schema, table))
+	if incremental and cur.fetchone() is not None:
+		cur.execute("""
+			DELETE FROM {0}.{1} d
+			USING {2}.{3} c
+			WHERE d.shape_id = c.shape_id;
+		""".format(schema, table, gtfs_schema, changes_table))
+		return False
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(schema, table))
+	cur.execute("""CREATE TABLE {0}.{1} AS {2} WITH NO DATA;""".format(schema, table, query), {'low': '', 'high': None})
+	return True
+
+# Runs the statements for the shapes of a range, on its own connection
+def check_range(statements, low, high, errors):
+	range_conn = None
+	range_cur = None
+	try:
+		range_conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+		range_cur = range_conn.cursor()
+		for statement in statements:
+			range_cur.execute(statement, {'low': low, 'high': high})
+		range_conn.commit()
+	except Exception as e:
+		errors.append((low, e))
+	finally:
+		if range_cur is not None:
+			range_cur.close()
+		if range_conn is not None:
+			range_conn.close()
+
+# Runs the statements for all ranges concurrently, exits if any range failed
+def run_ranges(statements, ranges):
+	errors = []
+	checkers = [threading.Thread(target=check_range, args=(statements, low, high, errors)) for (low, high) in ranges]
+	for checker in checkers:
+		checker.start()
+	for checker in checkers:
+		checker.join()
+	for (low, e) in errors:
+		print('Check of the shapes from {0} failed. ({1})'.format(low, e))
+	if len(errors) > 0:
+		sys.exit(1)
+
 try:
 	config = ConfigObj('../config/busmatching.properties')
 	db_name = config.get('database.name')
@@ -22,8 +84,14 @@ try:
 	road_sequence_table = config.get('mapmatching.table.road-sequence')
 	shape_stops_table = config.get('gtfs.derived-table.shape-stops')
 	mm_errors_table = config.get('mapmatching.table.shape-errors')
+	changes_table = config.get('gtfs.derived-table.shape-changes')
+	sequences_table = config.get('gtfs.derived-table.shape-sequences')
+	incremental = config.get('gtfs.incremental') == 'true'
 	
 	distances_table = config.get('mapmatching.table.distances')
+	routes_table = config.get('mapmatching.table.routes')
+	points_table = config.get('gtfs.derived-table.shape-points')
+	check_connections = int(config.get('mapmatching.check.connections') or 4)
 	indicators_table = config.get('mapmatching.table.indicators')
 	close_threshold = config.get('mapmatching.indicators.close_threshold')
 	mid_threshold = config.get('mapmatching.indicators.mid_threshold')
@@ -36,57 +104,93 @@ try:
 	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
 	cur = conn.cursor()
 	
+	if incremental: # Only shapes listed as new or changed by bf_convert_shapes.py are checked again
+		changed_filter = "AND {{0}}.shape_id IN (SELECT shape_id FROM {0}.{1} WHERE change <> 'removed')".format(gtfs_schema, changes_table)
+	else:
+		changed_filter = ""
+	
+	# Creates a table that contains the merged route of each map-matched shape, projected once to the coordinate system of mapmatching.coordinates.epsg
+	changed_ranges = shape_ranges(cur, """SELECT DISTINCT r.shape_id FROM {0}.{1} r WHERE TRUE {2} ORDER BY r.shape_id;""".format(mapmatching_schema, road_sequence_table, changed_filter.format('r')), check_connections)
+	routes_query = """
+		SELECT
+			r.shape_id,
+			ST_Transform(ST_Union(r.segment_geom), {2}) AS geom
+		FROM {0}.{1} r
+		WHERE {3} {4}
+		GROUP BY r.shape_id
+	""".format(mapmatching_schema, road_sequence_table, epsg, in_range('r'), changed_filter.format('r'))
+	if prepare_table(mapmatching_schema, routes_table, routes_query):
+		cur.execute("""ALTER TABLE {0}.{1} ADD PRIMARY KEY (shape_id);""".format(mapmatching_schema, routes_table))
+		cur.execute("""CREATE INDEX ON {0}.{1} USING GIST (geom);""".format(mapmatching_schema, routes_table))
+	
+	# Creates a table that contains the points from the shapes.txt GTFS file of all map-matched shapes, with their projected geometry
+	points_query = """
+		SELECT
+			s.shape_id,
+			s.shape_pt_sequence,
+			ST_SetSRID(ST_MakePoint(s.shape_pt_lon,s.shape_pt_lat),4326) AS geom,
+			ST_Transform(ST_SetSRID(ST_MakePoint(s.shape_pt_lon,s.shape_pt_lat),4326), {3}) AS geom_projected
+		FROM {0}.shapes s INNER JOIN {1}.{2} r
+			ON s.shape_id = r.shape_id
+		WHERE {4} {5}
+	""".format(gtfs_schema, mapmatching_schema, routes_table, epsg, in_range('s'), changed_filter.format('s'))
+	if prepare_table(gtfs_schema, points_table, points_query):
+		cur.execute("""CREATE INDEX ON {0}.{1} (shape_id, shape_pt_sequence);""".format(gtfs_schema, points_table))
+	
 	# Creates a table that contains the distance between each point from the shapes.txt GTFS file and the map-matched route based on the GTFS stops.
-	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, distances_table))
-	cur.execute("""
-		CREATE TABLE {0}.{2} AS
-			WITH mm_shapes AS (
-				SELECT
-					shape_id,
-					ST_Union(segment_geom) AS shape
-				FROM {0}.{3}
-				GROUP BY shape_id
-			)
-			SELECT
-				gs.shape_id,
-				gs.shape_pt_sequence,
-				ST_SetSRID(ST_MakePoint(gs.shape_pt_lon,gs.shape_pt_lat),4326) AS geom,
-				ST_Distance(ST_Transform(ST_SetSRID(ST_MakePoint(gs.shape_pt_lon,gs.shape_pt_lat),4326), {4}), ST_Transform(ms.shape, {4})) AS distance_meters
-			FROM {1}.shapes gs INNER JOIN mm_shapes ms
-				ON gs.shape_id = ms.shape_id::bigint;
-	""".format(mapmatching_schema, gtfs_schema, distances_table, road_sequence_table, epsg))
+	# With gtfs.incremental=true only distances of new and changed shapes are computed again, those of removed shapes are deleted.
+	distances_query = """
+		SELECT
+			p.shape_id,
+			p.shape_pt_sequence,
+			p.geom,
+			ST_Distance(p.geom_projected, r.geom) AS distance_meters
+		FROM {0}.{1} p INNER JOIN {2}.{3} r
+			ON p.shape_id = r.shape_id
+		WHERE {4} {5}
+	""".format(gtfs_schema, points_table, mapmatching_schema, routes_table, in_range('p'), changed_filter.format('p'))
+	if prepare_table(mapmatching_schema, distances_table, distances_query):
+		cur.execute("""CREATE INDEX ON {0}.{1} (shape_id);""".format(mapmatching_schema, distances_table))
+	conn.commit()
 	
+	run_ranges([
+		"""INSERT INTO {0}.{1} {2};""".format(mapmatching_schema, routes_table, routes_query),
+		"""INSERT INTO {0}.{1} {2};""".format(gtfs_schema, points_table, points_query),
+		"""INSERT INTO {0}.{1} {2};""".format(mapmatching_schema, distances_table, distances_query)
+	], changed_ranges)
+	for table in ['{0}.{1}'.format(mapmatching_schema, routes_table), '{0}.{1}'.format(gtfs_schema, points_table), '{0}.{1}'.format(mapmatching_schema, distances_table)]:
+		cur.execute("""ANALYZE {0};""".format(table))
 	conn.commit()
+	print("Generated table {0}.{1}, containing the projected map-matched route of each shape.".format(mapmatching_schema, routes_table))
 	print("Generated table {0}.{1}, containing distances between each point from the shapes.txt GTFS file and the map-matched route based on the GTFS stops.".format(mapmatching_schema, distances_table))
 	
-	try:
-		cur.execute("""
-			ALTER TABLE {0}.{1}
-			ADD COLUMN distance_meters double precision;
-		""".format(gtfs_schema, shape_stops_table))
-	except psycopg2.errors.DuplicateColumn:
-		pass
-	conn.commit()
-
-	cur.execute("""
-		WITH mm_shapes AS (
-			SELECT
-				shape_id,
-				ST_Union(segment_geom) AS shape
-			FROM {0}.{1}
-			GROUP BY shape_id
-		)
-		UPDATE {2}.{3} AS gs
-		SET distance_meters = ST_Distance(ST_Transform(gs.geom, {4}), ST_Transform(ms.shape, {4}))
-		FROM mm_shapes AS ms
-		WHERE gs.shape_id = ms.shape_id::bigint;
-	""".format(mapmatching_schema, road_sequence_table, gtfs_schema, shape_stops_table, epsg))
-	conn.commit()
+	# Shape stops are created again by bf_convert_shapes.py, so the distances of the stops of all shapes are computed
+	for column in ['geom_projected geometry', 'distance_meters double precision']: # Each column is added in its own transaction, as a failed statement aborts it
+		try:
+			cur.execute("""
+				ALTER TABLE {0}.{1}
+				ADD COLUMN {2};
+			""".format(gtfs_schema, shape_stops_table, column))
+		except psycopg2.errors.DuplicateColumn:
+			pass
+		conn.commit()
+	all_ranges = shape_ranges(cur, """SELECT shape_id FROM {0}.{1} ORDER BY shape_id;""".format(mapmatching_schema, routes_table), check_connections)
+	run_ranges([
+		"""
+			UPDATE {0}.{1} AS gs
+			SET geom_projected = ST_Transform(gs.geom, {2})
+			WHERE {3};
+		""".format(gtfs_schema, shape_stops_table, epsg, in_range('gs')),
+		"""
+			UPDATE {0}.{1} AS gs
+			SET distance_meters = ST_Distance(gs.geom_projected, r.geom)
+			FROM {2}.{3} AS r
+			WHERE gs.shape_id = r.shape_id AND {4};
+		""".format(gtfs_schema, shape_stops_table, mapmatching_schema, routes_table, in_range('gs'))
+	], all_ranges)
 	print("Added column to table {0}.{1} to contain distance between each stop from the stops.txt GTFS file and map-matched routes that make a corresponding stop.".format(gtfs_schema, shape_stops_table))
 	
-	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, indicators_table))
-	cur.execute("""
-		CREATE TABLE {0}.{1} AS
+	indicators_query = """
 			WITH route_point_counts AS (
 				SELECT
 					shape_id,
@@ -96,7 +200,8 @@ try:
 					COUNT(CASE WHEN distance_meters >= {6} THEN shape_id END) AS far,
 					AVG(distance_meters) AS avg_distance,
 					MAX(distance_meters) AS max_distance
-				FROM {0}.{2}
+				FROM {0}.{2} d
+				WHERE {7}
 				GROUP BY shape_id
 			), stops_point_counts AS (
 				SELECT
@@ -107,7 +212,8 @@ try:
 					COUNT(CASE WHEN distance_meters >= {6} THEN shape_id END) AS far,
 					AVG(distance_meters) AS avg_distance,
 					MAX(distance_meters) AS max_distance
-				FROM {3}.{4}
+				FROM {3}.{4} gs
+				WHERE {8}
 				GROUP BY shape_id
 			)
 			SELECT
@@ -130,7 +236,12 @@ try:
 				s.max_distance AS stops_max_distance
 			FROM route_point_counts r LEFT JOIN stops_point_counts s
 				ON r.shape_id = s.shape_id
-	""".format(mapmatching_schema, indicators_table, distances_table, gtfs_schema, shape_stops_table, close_threshold, mid_threshold))
+	""".format(mapmatching_schema, indicators_table, distances_table, gtfs_schema, shape_stops_table, close_threshold, mid_threshold, in_range('d'), in_range('gs'))
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, indicators_table))
+	cur.execute("""CREATE TABLE {0}.{1} AS {2} WITH NO DATA;""".format(mapmatching_schema, indicators_table, indicators_query), {'low': '', 'high': None})
+	cur.execute("""ALTER TABLE {0}.{1} ADD PRIMARY KEY (shape_id);""".format(mapmatching_schema, indicators_table))
+	conn.commit()
+	run_ranges(["""INSERT INTO {0}.{1} {2};""".format(mapmatching_schema, indicators_table, indicators_query)], all_ranges)
 	
 	conn.commit()
 	print("Generated table {0}.{1}, containing indicators for how close the map-matching result is to the GTFS shapes and stops.".format(mapmatching_schema, indicators_table))
@@ -238,20 +349,38 @@ try:
 	for r in cur.fetchall():
 		print("{0}|{1}|{2}|{3}|{4}|{5}|{6}|{7}|{8}".format(str(r[0]).ljust(14), str(r[1]).ljust(6), str(r[2]).ljust(6), str(r[3]).ljust(6), str(r[4]).ljust(6), str(round(r[5], 4)).ljust(9), str(round(r[6], 4)).ljust(9), str(round(r[7], 2)).ljust(13), round(r[8], 2)))
 		
-	cur.execute("""DROP TABLE IF EXISTS {0}.{1}""".format(mapmatching_schema, mm_errors_table))
-	cur.execute("""CREATE TABLE {0}.{1} (shape_id bigint);""".format(mapmatching_schema, mm_errors_table))
-	file_list = os.listdir(mapmatched_directory)
 	mm_error_count = 0
 	mm_error_list = ''
-	for file_name in file_list:
-		with open(mapmatched_directory + '/' + file_name, 'r') as mm_file:
-			if mm_file.readline().startswith('ERROR'): # There was an error during the map-matching of this shape
-				mm_error_count += 1
-				shape_id = file_name[len(mapmatched_prefix) : file_name.index('.')]
-				mm_error_list += ' ' + shape_id
-				cur.execute("""
-					INSERT INTO {0}.{1} (shape_id) VALUES ({2})
-				""".format(mapmatching_schema, mm_errors_table, shape_id))
+	if os.path.isdir(mapmatched_directory): # Errors are found in the result files of bf_mapmatching.py
+		cur.execute("""DROP TABLE IF EXISTS {0}.{1}""".format(mapmatching_schema, mm_errors_table))
+		cur.execute("""CREATE TABLE {0}.{1} (shape_id varchar);""".format(mapmatching_schema, mm_errors_table))
+		file_list = os.listdir(mapmatched_directory)
+		for file_name in file_list:
+			with open(mapmatched_directory + '/' + file_name, 'r') as mm_file:
+				if mm_file.readline().startswith('ERROR'): # There was an error during the map-matching of this shape
+					mm_error_count += 1
+					shape_id = file_name[len(mapmatched_prefix) : file_name.index('.')]
+					mm_error_list += ' ' + shape_id
+					cur.execute("""
+						INSERT INTO {0}.{1} (shape_id) VALUES ('{2}')
+					""".format(mapmatching_schema, mm_errors_table, shape_id))
+		# Shapes with the same stop sequence as a failed shape were not map-matched on their own
+		cur.execute("""
+			INSERT INTO {0}.{1} (shape_id)
+			SELECT q.shape_id
+			FROM {2}.{3} q INNER JOIN {0}.{1} e
+				ON q.representative = e.shape_id
+			WHERE q.shape_id <> q.representative;
+		""".format(mapmatching_schema, mm_errors_table, gtfs_schema, sequences_table))
+		cur.execute("""SELECT shape_id FROM {0}.{1} ORDER BY shape_id;""".format(mapmatching_schema, mm_errors_table))
+		mm_error_list = ''.join(' ' + r[0] for r in cur.fetchall())
+		mm_error_count = cur.rowcount
+	else: # bf_pipeline.py writes no result files, but stores errors in the table directly
+		cur.execute("""CREATE TABLE IF NOT EXISTS {0}.{1} (shape_id varchar);""".format(mapmatching_schema, mm_errors_table))
+		cur.execute("""SELECT shape_id FROM {0}.{1} ORDER BY shape_id;""".format(mapmatching_schema, mm_errors_table))
+		for r in cur.fetchall():
+			mm_error_count += 1
+			mm_error_list += ' ' + r[0]
 	conn.commit()
 	if mm_error_count > 0:
 		print("\nThe following {0} shapes, also listed in the {1}.{2} table, caused an error and could not be map-matched:{3}".format(mm_error_count, mapmatching_schema, mm_errors_table, mm_error_list))
@@ -0,0 +1,108 @@
+# This script checks that consecutive roads of the map-matched road sequences (written by bf_road_sequence.py) are connected in the road graph.
+# The road graph is loaded once from the bfmap table into CSR adjacency arrays (and cached in the file mapmatching.adjacency.file), then all sequences are validated in a single vectorized pass.
+# The cached graph is read again from the table when the map has been imported again, see adjacency.version.
+
+import sys
+import os
+import psycopg2
+from configobj import ConfigObj
+import numpy
+import io
+
+sys.path.append('../map/tools')
+import adjacency
+
+conn = None
+cur = None
+
+try:
+	config = ConfigObj('../config/busmatching.properties')
+	db_name = config.get('database.name')
+	db_user = config.get('database.user')
+	db_password = config.get('database.password')
+	db_host = config.get('database.host')
+	db_port = config.get('database.port')
+	bf_ways_table = config.get('database.table')
+	mapmatching_schema = config.get('mapmatching.schema')
+	road_sequence_table = config.get('mapmatching.table.road-sequence')
+	sequence_checks_table = config.get('mapmatching.table.sequence-checks')
+	adjacency_file = config.get('mapmatching.adjacency.file')
+	select_limit = config.get('mapmatching.indicators.limit')
+
+	map_version = adjacency.version(db_host, db_port, db_name, bf_ways_table, db_user, db_password)
+	graph = None
+	if adjacency_file and os.path.exists(adjacency_file):
+		graph = adjacency.load(adjacency_file)
+		if str(graph.get('version', '')) == map_version:
+			print("Road graph loaded from {0}.".format(adjacency_file))
+		else:
+			print("Road graph of {0} is outdated, table {1} has changed.".format(adjacency_file, bf_ways_table))
+			graph = None
+	if graph is None:
+		graph = adjacency.export(db_host, db_port, db_name, bf_ways_table, db_user, db_password)
+		graph['version'] = numpy.array(map_version)
+		print("Road graph loaded from table {0}.".format(bf_ways_table))
+		if adjacency_file:
+			adjacency.save(adjacency_file, graph)
+			print("Road graph saved to {0}.".format(adjacency_file))
+	print("{0} roads, {1} nodes, {2} directed edges.".format(len(graph['gid']), len(graph['nodes']), len(graph['edges'])))
+
+	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+	cur = conn.cursor()
+
+	# Reads all road sequences at once, ordered by shape and sequence
+	cur.execute("""
+		SELECT shape_id, segment_id, heading = 'forward', segment_sequence
+		FROM {0}.{1}
+		ORDER BY shape_id, segment_sequence;
+	""".format(mapmatching_schema, road_sequence_table))
+	rows = cur.fetchall()
+	print("{0} road sequence steps read.".format(len(rows)))
+
+	if len(rows) > 0:
+		(shape_ids, shapes) = numpy.unique([r[0] for r in rows], return_inverse=True)
+		roads = numpy.array([r[1] for r in rows], dtype='int64')
+		forwards = numpy.array([r[2] for r in rows], dtype=bool)
+		segment_sequences = numpy.array([r[3] for r in rows], dtype='int64')
+		(hops, status) = adjacency.validate(graph, roads, forwards, shapes)
+	else:
+		(shape_ids, shapes, segment_sequences) = ([], numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype='int64'))
+		(hops, status) = (numpy.zeros(0, dtype='int64'), numpy.zeros(0, dtype='int8'))
+
+	# Stores all hops that are not connected
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, sequence_checks_table))
+	cur.execute("""
+		CREATE TABLE {0}.{1} (
+			shape_id varchar,
+			segment_sequence integer,
+			status varchar,
+			PRIMARY KEY (shape_id,segment_sequence)
+		);""".format(mapmatching_schema, sequence_checks_table))
+	issues = numpy.nonzero(status != adjacency.CONNECTED)[0]
+	lines = ["{0}\t{1}\t{2}\n".format(shape_ids[shapes[hops[i]]], segment_sequences[hops[i]], adjacency.STATUS[status[i]]) for i in issues]
+	cur.copy_from(io.BytesIO("".join(lines).encode('utf-8')), '{0}.{1}'.format(mapmatching_schema, sequence_checks_table), columns=('shape_id', 'segment_sequence', 'status'))
+	conn.commit()
+	print("Generated table {0}.{1}, containing all hops between consecutive roads that are not connected in the road graph.".format(mapmatching_schema, sequence_checks_table))
+
+	counts = numpy.bincount(status, minlength=len(adjacency.STATUS))
+	print("\n{0} hops between consecutive roads of {1} shapes checked:".format(len(hops), len(shape_ids)))
+	for code in range(len(adjacency.STATUS)):
+		print("{0}: {1}".format(adjacency.STATUS[code].ljust(13), counts[code]))
+
+	per_shape = numpy.bincount(shapes[hops[issues]], minlength=len(shape_ids))
+	print("\n{0} shapes have at least one hop that is not connected.".format(numpy.count_nonzero(per_shape)))
+	worst = [s for s in numpy.argsort(-per_shape, kind='mergesort')[:int(select_limit)] if per_shape[s] > 0]
+	if len(worst) > 0:
+		print("\nHere are the {0} shapes with most hops that are not connected:".format(len(worst)))
+		print("{0}|{1}".format('shape_id'.ljust(14), 'hops'))
+		for s in worst:
+			print("{0}|{1}".format(str(shape_ids[s]).ljust(14), per_shape[s]))
+
+finally:
+	if cur is not None:
+		cur.close()
+		del cur
+
+	if conn is not None:
+		conn.close()
+		del conn
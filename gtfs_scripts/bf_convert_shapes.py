@@ -1,17 +1,28 @@
 # This script takes the GTFS-format shapes of the bus routes and converts them into a format fit for BMW Car IT's Barefoot map-matching algorithm to be applied.
-# Output files will be generated as .json files and saved inside a dedicated folder.
+# Output files will be generated as .json files and saved inside a dedicated folder, or as a single NDJSON file with one shape per line if mapmatching.input.file is set.
+# With mapmatching.input.source=shapes, each shape is converted into a trace along its shapes.txt polyline, with a sample at least every mapmatching.input.spacing meters
+# and timestamps interpolated between stop times (see traces.py). The matcher then has to route only short gaps between samples.
+# Shapes with identical stop sequences (coordinates and times) are converted once, as the shape with the lowest ID of them; see the shape sequences table.
+# Stops of all shapes are read with a single streamed query and grouped by shape on the client, JSON files are written by a small pool of threads.
+# Each shape is fingerprinted by its representative trip and the stops, coordinates and times of that trip. With gtfs.incremental=true only new or changed shapes are converted,
+# their previous map-matching results are deleted so that bf_mapmatching.py matches them again, and files of removed shapes are deleted. Changes are listed in the shape changes table.
+# Fingerprints are stored by bf_road_sequence.py once the road sequences of a shape are stored, so shapes that failed or were not matched yet are listed as changed again.
 
 import sys
 import os
+import threading
+import Queue
 import psycopg2
 from configobj import ConfigObj
 import json
+import busmatching
+import traces
+
+writers = 4 # Number of threads writing JSON files
 
 conn = None
 cur = None
 
-shape_id = ''
-shape_number = 0
 try:
 	config = ConfigObj('../config/busmatching.properties')
 	db_name = config.get('database.name')
@@ -23,87 +34,92 @@ try:
 	shape_stops_table = config.get('gtfs.derived-table.shape-stops')
 	shapes_directory = config.get('mapmatching.input.directory')
 	shapes_prefix = config.get('mapmatching.input.prefix')
+	shapes_file = config.get('mapmatching.input.file')
+	mapmatched_directory = config.get('mapmatching.output.directory')
+	mapmatched_prefix = config.get('mapmatching.output.prefix')
+	fingerprints_table = config.get('gtfs.derived-table.shape-fingerprints')
+	changes_table = config.get('gtfs.derived-table.shape-changes')
+	sequences_table = config.get('gtfs.derived-table.shape-sequences')
+	incremental = config.get('gtfs.incremental') == 'true'
+	shape_points = config.get('mapmatching.input.source') == 'shapes' # Matcher input built from shapes.txt instead of stops, see traces.py
+	trace_spacing = float(config.get('mapmatching.input.spacing') or 100)
+	trace_tolerance = float(config.get('mapmatching.input.tolerance') or 5)
+	trace_options = traces.options(trace_spacing, trace_tolerance) if shape_points else None
 	
 	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
 	cur = conn.cursor()
 	
-	# Creates a table that lists all stops for each shape ID
-	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(gtfs_schema, shape_stops_table))
-	cur.execute("""
-		CREATE TABLE {0}.{1} AS
-		WITH trip_shapes AS (
-			SELECT
-				t.shape_id,
-				MIN(t.trip_id) AS trip_id
-			FROM {0}.trips t INNER JOIN {0}.stop_times st
-				ON t.trip_id = st.trip_id
-			GROUP BY shape_id
-		)
-		SELECT
-			ts.shape_id,
-			ts.trip_id,
-			st.stop_id,
-			st.stop_sequence,
-			s.stop_lat,
-			s.stop_lon,
-			ST_SetSRID(ST_MakePoint(stop_lon,stop_lat),4326) AS geom
-		FROM trip_shapes ts 
-			LEFT JOIN {0}.stop_times st
-				ON ts.trip_id = st.trip_id
-			LEFT JOIN {0}.stops s
-				ON st.stop_id = s.stop_id;
-	""".format(gtfs_schema, shape_stops_table))
-	cur.execute("""CREATE INDEX ON {0}.{1} (shape_id);""".format(gtfs_schema, shape_stops_table))
+	busmatching.create_shape_stops(cur, gtfs_schema, shape_stops_table)
+	(changes, total) = busmatching.create_shape_changes(cur, gtfs_schema, shape_stops_table, fingerprints_table, changes_table, incremental, trace_options)
+	distinct = busmatching.create_shape_sequences(cur, gtfs_schema, shape_stops_table, changes_table, sequences_table, trace_options)
+	duplicates = busmatching.shape_duplicates(cur, gtfs_schema, changes_table, sequences_table)
 	conn.commit()
 	
-	# Retrieves the list of all shape IDs
-	cur.execute("""
-		SELECT DISTINCT shape_id
-		FROM {0}.{1};
-	""".format(gtfs_schema, shape_stops_table))
-	shape_ids_tab = cur.fetchall()
-	n_of_shapes = len(shape_ids_tab) # Total number of shapes
-	print(str(n_of_shapes) + ' shapes found.')
+	for (shape_id, change) in changes: # Previous files of changed and removed shapes are outdated
+		outdated = ["{0}/{1}{2}.json".format(mapmatched_directory, mapmatched_prefix, shape_id)]
+		if change == 'removed':
+			outdated.append("{0}/{1}{2}.json".format(shapes_directory, shapes_prefix, shape_id))
+		for path in outdated:
+			if os.path.exists(path):
+				os.remove(path)
+	for (representative, shape_ids) in duplicates.items(): # Shapes that share the result of their representative are not map-matched, previous input files would be matched again
+		for shape_id in shape_ids:
+			if shape_id == representative:
+				continue
+			path = "{0}/{1}{2}.json".format(shapes_directory, shapes_prefix, shape_id)
+			if os.path.exists(path):
+				os.remove(path)
+	counts = dict((change, sum(1 for c in changes if c[1] == change)) for change in ['new', 'changed', 'removed'])
+	print("{0} shapes found: {1} new, {2} changed, {3} removed.".format(total, counts['new'], counts['changed'], counts['removed']))
+	n_of_shapes = distinct # Only one shape of each distinct stop sequence is converted and map-matched, see bf_road_sequence.py
+	print("{0} new and changed shapes have {1} distinct stop sequences, {2} matcher calls saved.".format(counts['new'] + counts['changed'], distinct, counts['new'] + counts['changed'] - distinct))
 	
 	if not os.path.exists(shapes_directory):
 		os.makedirs(shapes_directory)
 	
-	print('Converting each shape into a JSON file...')
-	for i in range(n_of_shapes):
-		shape_id = shape_ids_tab[i][0] # Shape ID
-		print("Converting {0} ({1}/{2})...".format(shape_id, i+1, n_of_shapes))
-		# Longitude, latitude, and a timestamp are necessary for BMW Car IT's Barefoot map-matching algorithm to work.
-		# Timestamps are built by taking the time from GTFS
-		cur.execute("""
-			SELECT
-				curr.stop_lon,
-				curr.stop_lat,
-				'2018-01-01 ' || st.arrival_time || '+00:00' AS timestamp
-			FROM {0}.{1} curr
-				LEFT JOIN {0}.{1} prev
-					ON curr.shape_id = prev.shape_id AND curr.stop_sequence = (prev.stop_sequence + 1)
-				LEFT JOIN {0}.stop_times st
-					ON curr.trip_id = st.trip_id AND curr.stop_id = st.stop_id
-			WHERE curr.shape_id = '{2}'
-			ORDER BY curr.stop_sequence;
-		""".format(gtfs_schema, shape_stops_table, shape_id))
-		shape_tab = cur.fetchall()
-		
-		shape_file = open("{0}/{1}{2}.json".format(shapes_directory, shapes_prefix, shape_id), 'w+') # Output file will be written in the shapes directory
-		for j in range(len(shape_tab)): # Writes the file in the format required by the map-matching algorithm
-			prefix = '{"point":"POINT('
-			mid = ')","time":"'
-			last_char = ','
-			if j == 0:
-				prefix = '[' + prefix
-			if j == len(shape_tab) - 1:
-				last_char = ']'
-			suffix = '","id":"' + str(j) + '"}' + last_char + '\n'
-		
-			shape_file.write(prefix + str(shape_tab[j][0]) + ' ' + str(shape_tab[j][1]) + mid + str(shape_tab[j][2]) + suffix)
-		shape_file.close() # The file for this shape is complete, continues to the next shape
-		
-	print('Shapes have been converted into JSON files. You can find them in the ' + shapes_directory + ' folder.')
+	pending = Queue.Queue(100)
+	def write_shapes():
+		while True:
+			shape = pending.get()
+			if shape is None:
+				break
+			with open("{0}/{1}{2}.json".format(shapes_directory, shapes_prefix, shape[0]), 'w+') as shape_file: # Output file will be written in the shapes directory
+				shape_file.write('[' + ',\n'.join(shape[1]) + ']\n') # One sample per line, in the format required by the map-matching algorithm
+	
+	if shapes_file:
+		print('Converting each shape into a line of {0}...'.format(shapes_file))
+		ndjson_file = open(shapes_file, 'w+')
+		workers = []
+	else:
+		print('Converting each shape into a JSON file...')
+		workers = [threading.Thread(target=write_shapes) for i in range(writers)]
+		for worker in workers:
+			worker.start()
+	
+	try:
+		i = 0
+		for shape in busmatching.shape_rows(conn, gtfs_schema, shape_stops_table, changes_table, sequences_table, shape_points): # Stops of all shapes to convert are streamed in a single query
+			shape_id = shape[0]
+			rows = traces.trace(shape[1], shape[2], trace_spacing, trace_tolerance) if shape_points else shape[1]
+			i += 1
+			print("Converting {0} ({1}/{2}, {3} samples)...".format(shape_id, i, n_of_shapes, len(rows)))
+			samples = [busmatching.shape_sample(j, row) for (j, row) in enumerate(rows)]
+			if shapes_file:
+				ndjson_file.write('{"id":' + json.dumps(shapes_prefix + str(shape_id)) + ',"request":[' + ','.join(samples) + ']}\n')
+			else:
+				pending.put((shape_id, samples))
+	finally:
+		for worker in workers:
+			pending.put(None)
+		for worker in workers:
+			worker.join()
+		if shapes_file:
+			ndjson_file.close()
+	
+	if shapes_file:
+		print('Shapes have been converted into ' + shapes_file + '.')
+	else:
+		print('Shapes have been converted into JSON files. You can find them in the ' + shapes_directory + ' folder.')
 
 finally:
 	if cur is not None:
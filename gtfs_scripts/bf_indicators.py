@@ -0,0 +1,88 @@
+# This script computes the quality indicators of bf_check_mm.py without PostGIS: the projected map-matched routes, shapes.txt points and stops (written by bf_check_mm.py)
+# are loaded once into arrays, then distances of all points to the segments of their route and the indicators are computed with NumPy.
+# If mapmatching.indicators.file is set, the arrays are cached in that file; delete it after map-matching again.
+# Thresholds are read from the configuration or given as arguments, e.g. python bf_indicators.py 5 15, so that they can be tried out without running bf_check_mm.py again.
+
+import sys
+import os
+import time
+import io
+import psycopg2
+from configobj import ConfigObj
+import numpy
+
+sys.path.append('../map/tools')
+import indicators
+
+conn = None
+cur = None
+
+try:
+	config = ConfigObj('../config/busmatching.properties')
+	db_name = config.get('database.name')
+	db_user = config.get('database.user')
+	db_password = config.get('database.password')
+	db_host = config.get('database.host')
+	db_port = config.get('database.port')
+	gtfs_schema = config.get('gtfs.schema')
+	shape_stops_table = config.get('gtfs.derived-table.shape-stops')
+	points_table = config.get('gtfs.derived-table.shape-points')
+	mapmatching_schema = config.get('mapmatching.schema')
+	routes_table = config.get('mapmatching.table.routes')
+	indicators_table = config.get('mapmatching.table.indicators')
+	indicators_file = config.get('mapmatching.indicators.file')
+	close_threshold = float(sys.argv[1] if len(sys.argv) > 1 else config.get('mapmatching.indicators.close_threshold'))
+	mid_threshold = float(sys.argv[2] if len(sys.argv) > 2 else config.get('mapmatching.indicators.mid_threshold'))
+
+	if indicators_file and os.path.exists(indicators_file):
+		data = indicators.load(indicators_file)
+		print("Routes and points loaded from {0}.".format(indicators_file))
+	else:
+		data = indicators.export(db_host, db_port, db_name, db_user, db_password, '{0}.{1}'.format(mapmatching_schema, routes_table),
+			"""SELECT shape_id, ST_X(geom_projected), ST_Y(geom_projected) FROM {0}.{1} ORDER BY shape_id, shape_pt_sequence;""".format(gtfs_schema, points_table),
+			"""SELECT shape_id, ST_X(geom_projected), ST_Y(geom_projected) FROM {0}.{1} ORDER BY shape_id, stop_sequence;""".format(gtfs_schema, shape_stops_table))
+		print("Routes and points loaded from tables {0}.{1}, {2}.{3} and {2}.{4}.".format(mapmatching_schema, routes_table, gtfs_schema, points_table, shape_stops_table))
+		if indicators_file:
+			indicators.save(indicators_file, data)
+			print("Routes and points saved to {0}.".format(indicators_file))
+	print("{0} shapes, {1} route vertices, {2} shapes.txt points, {3} stops.".format(len(data['shape_id']), len(data['route_x']), len(data['point_x']), len(data['stop_x'])))
+
+	start = time.time()
+	result = indicators.evaluate(data, close_threshold, mid_threshold)
+	print("Indicators computed in {0:.2f} s with close_threshold {1} and mid_threshold {2}.".format(time.time() - start, close_threshold, mid_threshold))
+
+	# Stores the indicators of all shapes with shapes.txt points, as bf_check_mm.py does
+	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+	cur = conn.cursor()
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, indicators_table))
+	cur.execute("""
+		CREATE TABLE {0}.{1} (
+			shape_id varchar PRIMARY KEY,
+			route_total bigint, route_close bigint, route_mid bigint, route_far bigint,
+			route_mid_rate numeric, route_far_rate numeric, route_avg_distance double precision, route_max_distance double precision,
+			stops_total bigint, stops_close bigint, stops_mid bigint, stops_far bigint,
+			stops_mid_rate numeric, stops_far_rate numeric, stops_avg_distance double precision, stops_max_distance double precision
+		);""".format(mapmatching_schema, indicators_table))
+	def field(value):
+		return '\\N' if numpy.isnan(value) else repr(float(value)) if isinstance(value, float) else str(value)
+	shapes = numpy.nonzero(result['point']['total'] > 0)[0]
+	lines = []
+	for s in shapes:
+		route = [field(result['point'][column][s]) for column in indicators.COLUMNS]
+		stops = [field(result['stop'][column][s]) for column in indicators.COLUMNS] if result['stop']['total'][s] > 0 else ['\\N'] * len(indicators.COLUMNS)
+		lines.append('\t'.join([data['shape_id'][s]] + route + stops) + '\n')
+	cur.copy_from(io.BytesIO(''.join(lines)), '{0}.{1}'.format(mapmatching_schema, indicators_table))
+	conn.commit()
+	print("Generated table {0}.{1}, containing indicators for how close the map-matching result is to the GTFS shapes and stops.".format(mapmatching_schema, indicators_table))
+
+	route = result['point']
+	print("\n{0} shapes checked: {1} close, {2} mid and {3} far shapes.txt points.".format(len(shapes), route['close'].sum(), route['mid'].sum(), route['far'].sum()))
+
+finally:
+	if cur is not None:
+		cur.close()
+		del cur
+
+	if conn is not None:
+		conn.close()
+		del conn
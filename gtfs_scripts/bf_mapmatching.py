@@ -1,32 +1,42 @@
 # This script executes BMW Car IT's Barefoot Map-matching algorithm on all bus routes.
 
 # Parameters are as follows:
-# host: Host the matcher server is running on.
-# port: Port to access the matcher server.
+# endpoints: Matcher server instances (host:port), from mapmatching.matcher.endpoints.
+# retries: Number of retries of failed requests on other instances, from mapmatching.matcher.retries.
 # format: Desired output format. Use "debug" to make it compatible with the script that converts it into a sequence of road IDs.
 # input_file_name: Input file to map-match
 # output_file_name: Name to give to the map-matched files.
 
+# All input files (or all lines of the NDJSON file mapmatching.input.file, if set) are submitted at once with multibatch.py, which keeps up to server.connections (see config/server.properties) requests in flight.
 # Note that batch.py has been edited so that the output of the map-matching algorithm will be saved as a JSON file, inside a new directory, with a name that follows this structure: <prefix><shp_id_value>.json
 
 import os
 from configobj import ConfigObj
+import busmatching
 
 config = ConfigObj('../config/busmatching.properties')
 input_directory = config.get('mapmatching.input.directory')
 output_directory = config.get('mapmatching.output.directory')
 input_prefix = config.get('mapmatching.input.prefix')
+input_file = config.get('mapmatching.input.file')
 output_prefix = config.get('mapmatching.output.prefix')
+cache_directory = config.get('mapmatching.cache.directory')
+incremental = config.get('gtfs.incremental') == 'true'
+matcher_endpoints = busmatching.config_list(config.get('mapmatching.matcher.endpoints'))
+matcher_retries = config.get('mapmatching.matcher.retries')
 
 if not os.path.exists(output_directory):
     os.makedirs(output_directory)
 
-i = 1
-file_list = os.listdir(input_directory)
-n_files = len(file_list)
-for file in file_list:
-	shape_id = file[len(input_prefix) : file.index('.')]
-	print("Map-matching file {0} ({1}/{2})...".format(file, i, n_files))
-	command = "python ../util/submit/batch.py --host localhost --port 1234 --format=debug --input_file_name {0}/{1}{2}.json --output_file_name {3}/{4}{2}.json".format(input_directory, input_prefix, shape_id, output_directory, output_prefix)
-	os.system(command)
-	i += 1
\ No newline at end of file
+command = "python ../util/submit/multibatch.py --endpoints {0} --retries {1} --format=debug --properties ../config/server.properties --input_prefix {2} --output_directory {3} --output_prefix {4} {5}".format(matcher_endpoints, matcher_retries, input_prefix, output_directory, output_prefix, input_file or input_directory)
+if cache_directory:
+    # Responses of unchanged shapes are read from cache, as long as road map and matcher settings are unchanged
+    command += " --cache {0} --map ../config/busmatching.properties".format(cache_directory)
+if incremental:
+    # Only shapes without a successful result are matched, bf_convert_shapes.py deletes results of new and changed shapes
+    command += " --skip_existing"
+if input_file:
+    print("Map-matching shapes of {0}...".format(input_file))
+else:
+    print("Map-matching {0} files...".format(len(os.listdir(input_directory))))
+os.system(command)
\ No newline at end of file
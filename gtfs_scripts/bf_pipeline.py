@@ -0,0 +1,198 @@
+# This script converts, map-matches and extracts the road sequences of all bus routes in a single process, without intermediate files.
+# It replaces bf_convert_shapes.py, bf_mapmatching.py and bf_road_sequence.py: shapes are streamed from the DB to a pool of concurrent requests to the matcher
+# servers of mapmatching.matcher.endpoints, road sequences are extracted from the results and inserted into the DB in batches with COPY, with road geometries looked up by gid.
+# The stages are connected by bounded queues, so reading, map-matching and inserting overlap. Requests that failed with a connection failure or socket timeout
+# are retried up to attempts times (on other matcher servers, if mapmatching.matcher.retries is set), shapes with an ERROR response are retried by the next run.
+# With mapmatching.input.source=shapes, traces are built from the shapes.txt polylines as in bf_convert_shapes.py.
+# Shapes with identical stop sequences (coordinates and times) are map-matched once and the result is stored for all of them.
+# Shapes that could not be map-matched are stored in the shape errors table. Like the other scripts, gtfs.incremental=true processes only new or changed shapes.
+# Previous rows of a shape are replaced in the transaction that stores its new rows and its fingerprint, so an interrupted or failed run keeps them,
+# and shapes that could not be map-matched or were not stored are processed again by the next run.
+
+import sys
+import io
+import socket
+import time
+import threading
+import Queue
+import psycopg2
+from configobj import ConfigObj
+import busmatching
+import traces
+
+sys.path.append('../util/submit')
+import client
+import endpoints
+
+batch_size = 100 # Number of shapes inserted per COPY
+attempts = 3 # Number of attempts to map-match a shape after connection failures or socket timeouts
+
+conn = None
+cur = None
+
+try:
+	config = ConfigObj('../config/busmatching.properties')
+	db_name = config.get('database.name')
+	db_user = config.get('database.user')
+	db_password = config.get('database.password')
+	db_host = config.get('database.host')
+	db_port = config.get('database.port')
+	bf_ways_table = config.get('database.table')
+	gtfs_schema = config.get('gtfs.schema')
+	shape_stops_table = config.get('gtfs.derived-table.shape-stops')
+	fingerprints_table = config.get('gtfs.derived-table.shape-fingerprints')
+	changes_table = config.get('gtfs.derived-table.shape-changes')
+	sequences_table = config.get('gtfs.derived-table.shape-sequences')
+	incremental = config.get('gtfs.incremental') == 'true'
+	shape_points = config.get('mapmatching.input.source') == 'shapes' # Matcher input built from shapes.txt instead of stops, see traces.py
+	trace_spacing = float(config.get('mapmatching.input.spacing') or 100)
+	trace_tolerance = float(config.get('mapmatching.input.tolerance') or 5)
+	trace_options = traces.options(trace_spacing, trace_tolerance) if shape_points else None
+	mapmatching_schema = config.get('mapmatching.schema')
+	road_sequence_table = config.get('mapmatching.table.road-sequence')
+	mm_errors_table = config.get('mapmatching.table.shape-errors')
+	matcher_endpoints = endpoints.addresses(busmatching.config_list(config.get('mapmatching.matcher.endpoints')))
+	matcher_retries = int(config.get('mapmatching.matcher.retries') or 0)
+	matcher_connections = int(config.get('mapmatching.matcher.connections') or client.properties('../config/server.properties').get('server.connections', 20))
+
+	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+	cur = conn.cursor()
+
+	busmatching.create_shape_stops(cur, gtfs_schema, shape_stops_table)
+	(changes, total) = busmatching.create_shape_changes(cur, gtfs_schema, shape_stops_table, fingerprints_table, changes_table, incremental, trace_options)
+	distinct = busmatching.create_shape_sequences(cur, gtfs_schema, shape_stops_table, changes_table, sequences_table, trace_options)
+	duplicates = busmatching.shape_duplicates(cur, gtfs_schema, changes_table, sequences_table)
+	busmatching.create_road_sequence(cur, mapmatching_schema, road_sequence_table, not incremental)
+	busmatching.create_ways_index(cur, bf_ways_table)
+	if not incremental:
+		cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, mm_errors_table))
+	cur.execute("""CREATE TABLE IF NOT EXISTS {0}.{1} (shape_id varchar);""".format(mapmatching_schema, mm_errors_table))
+	removed = [c[0] for c in changes if c[1] == 'removed'] # Rows of new and changed shapes are replaced when their results are stored
+	busmatching.delete_shapes(cur, mapmatching_schema, road_sequence_table, removed)
+	busmatching.delete_shapes(cur, mapmatching_schema, mm_errors_table, removed)
+	busmatching.delete_removed_fingerprints(cur, gtfs_schema, fingerprints_table, changes_table)
+	conn.commit()
+
+	changed = len(changes) - sum(1 for c in changes if c[1] == 'removed') # Number of new and changed shapes
+	n_of_shapes = distinct # Number of shapes to map-match, one of each distinct stop sequence
+	print("{0} shapes found, {1} new or changed with {2} distinct stop sequences, {3} matcher calls saved.".format(total, changed, distinct, changed - distinct))
+	print("Map-matching {0} shapes with {1} concurrent requests to {2}.".format(n_of_shapes, matcher_connections, ', '.join('{0}:{1}'.format(h, p) for (h, p) in matcher_endpoints)))
+
+	matcher = endpoints.Endpoints(matcher_endpoints, 'least', matcher_retries)
+	matching = Queue.Queue(2 * matcher_connections) # Shapes to map-match
+	storing = Queue.Queue(2 * matcher_connections) # Road sequences to insert, None if the shape could not be map-matched
+
+	# Map-matches shapes and extracts their road sequences
+	def match():
+		while True:
+			shape = matching.get()
+			if shape is None:
+				break
+			start = time.time()
+			shape_id = shape[0]
+			road_heading_sequence = None
+			try: # Any failure of a shape is stored as such, so that the other stages finish
+				rows = traces.trace(shape[1], shape[2], trace_spacing, trace_tolerance) if shape_points else shape[1]
+				samples = [{'point': 'POINT({0} {1})'.format(row[0], row[1]), 'time': str(row[2]), 'id': str(j)} for (j, row) in enumerate(rows)]
+				for attempt in range(1, attempts + 1):
+					response = io.BytesIO()
+					try:
+						if matcher.request(samples, 'debug', response):
+							response.seek(0)
+							road_heading_sequence = busmatching.road_sequence(busmatching.debug_candidates(response))
+						break
+					except socket.error as e: # Connection failures and socket timeouts are retried, ERROR responses of the matcher are not
+						if attempt == attempts:
+							raise
+						print("Map-matching of {0} failed, attempt {1} of {2}. ({3})".format(shape_id, attempt, attempts, e))
+						time.sleep(attempt)
+			except Exception as e:
+				print("Map-matching of {0} failed. ({1})".format(shape_id, e))
+			storing.put((shape_id, road_heading_sequence, time.time() - start))
+
+	# Inserts road sequences in batches, on its own connection. Previous rows of the shapes of a batch are deleted and the fingerprints of
+	# map-matched shapes are stored in the same transaction.
+	progress = {'stored': 0, 'failed': 0, 'roads': 0, 'error': None}
+	def store():
+		store_conn = None
+		store_cur = None
+		(rows, errors, stored, matched, shapes) = ([], [], [], [], 0)
+		while True:
+			result = storing.get()
+			if progress['error'] is not None: # Results are discarded after a failed transaction, so that the other stages finish
+				if result is None:
+					break
+				continue
+			try:
+				if store_conn is None:
+					store_conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+					store_cur = store_conn.cursor()
+				if result is not None:
+					(shape_id, road_heading_sequence, latency) = result
+					done = progress['stored'] + progress['failed'] + 1
+					stored.extend(duplicates.get(shape_id, [shape_id]))
+					if road_heading_sequence is None:
+						errors.extend(u"{0}\n".format(duplicate_id) for duplicate_id in duplicates.get(shape_id, [shape_id]))
+						progress['failed'] += 1
+						print("Shape {0} could not be map-matched ({1}/{2}).".format(shape_id, done, n_of_shapes))
+					else:
+						for duplicate_id in duplicates.get(shape_id, [shape_id]): # All shapes with the same stop sequence share the result
+							for (segment_sequence, segment) in enumerate(road_heading_sequence, 1):
+								rows.append((duplicate_id, int(segment[0]), segment_sequence, segment[1]))
+							matched.append(duplicate_id)
+						progress['stored'] += 1
+						progress['roads'] += len(road_heading_sequence)
+						print("Shape {0} map-matched in {1:.1f} s, {2} roads ({3}/{4}).".format(shape_id, latency, len(road_heading_sequence), done, n_of_shapes))
+					shapes += 1
+				if shapes >= batch_size or (result is None and shapes > 0):
+					busmatching.delete_shapes(store_cur, mapmatching_schema, road_sequence_table, stored)
+					busmatching.delete_shapes(store_cur, mapmatching_schema, mm_errors_table, stored)
+					busmatching.insert_road_sequences(store_cur, mapmatching_schema, road_sequence_table, bf_ways_table, rows)
+					store_cur.copy_from(io.BytesIO(u"".join(errors).encode('utf-8')), '{0}.{1}'.format(mapmatching_schema, mm_errors_table), columns=('shape_id',))
+					busmatching.store_fingerprints(store_cur, gtfs_schema, fingerprints_table, changes_table, matched)
+					store_conn.commit()
+					(rows, errors, stored, matched, shapes) = ([], [], [], [], 0)
+			except Exception as e:
+				progress['error'] = e
+				print("Database transaction failed. ({0})".format(e))
+			if result is None:
+				break
+		if store_cur is not None:
+			store_cur.close()
+		if store_conn is not None:
+			store_conn.close()
+
+	start = time.time()
+	workers = [threading.Thread(target=match) for i in range(matcher_connections)]
+	writer = threading.Thread(target=store)
+	for thread in workers + [writer]:
+		thread.daemon = True
+		thread.start()
+
+	for shape in busmatching.shape_rows(conn, gtfs_schema, shape_stops_table, changes_table, sequences_table, shape_points):
+		matching.put(shape)
+	for worker in workers:
+		matching.put(None)
+	for worker in workers:
+		worker.join()
+	storing.put(None)
+	writer.join()
+
+	if progress['error'] is not None:
+		sys.exit(1)
+
+	elapsed = time.time() - start
+	print("{0} shapes map-matched ({1} roads), {2} failed in {3:.1f} s ({4:.2f} shapes/s), results stored for {5} shapes.".format(progress['stored'], progress['roads'], progress['failed'], elapsed, (progress['stored'] + progress['failed']) / max(elapsed, 1e-9), changed))
+	if len(matcher_endpoints) > 1:
+		print(matcher.report())
+	if progress['failed'] > 0:
+		print("Shapes that could not be map-matched are listed in the {0}.{1} table.".format(mapmatching_schema, mm_errors_table))
+
+finally:
+	if cur is not None:
+		cur.close()
+		del cur
+
+	if conn is not None:
+		conn.close()
+		del conn
@@ -1,14 +1,97 @@
 # This script reads GTFS files and stores their data into a Postgres DB.
+# Each file is streamed with COPY on its own connection, the four files are loaded concurrently. Only the columns used by the other scripts are stored, with explicit types.
 
 import sys
+import csv
+import threading
 import psycopg2
 from configobj import ConfigObj
-import pandas as pd
-from sqlalchemy import create_engine
+
+# Used columns and their types of each GTFS file; stops additionally get a point geometry
+gtfs_tables = [
+	('shapes', [('shape_id', 'varchar'), ('shape_pt_lat', 'double precision'), ('shape_pt_lon', 'double precision'), ('shape_pt_sequence', 'integer')]),
+	('stop_times', [('trip_id', 'varchar'), ('arrival_time', 'varchar'), ('stop_id', 'varchar'), ('stop_sequence', 'integer')]),
+	('stops', [('stop_id', 'varchar'), ('stop_lat', 'double precision'), ('stop_lon', 'double precision')]),
+	('trips', [('trip_id', 'varchar'), ('shape_id', 'varchar')])
+]
+# Key indexes, built right after loading
+gtfs_indexes = {
+	'shapes': ["(shape_id, shape_pt_sequence)"],
+	'stop_times': ["(trip_id, stop_sequence)", "(stop_id)"],
+	'stops': ["(stop_id)", "USING GIST (geom)"],
+	'trips': ["(trip_id)", "(shape_id, trip_id)"]
+}
+copy_size = 1048576
 
 conn = None
 cur = None
 
+# File-like object that feeds rows of selected columns as CSV to COPY, so the file is never held in memory as a whole
+class CopySource(object):
+	def __init__(self, rows, indexes, geometry):
+		self.rows = rows
+		self.indexes = indexes
+		self.geometry = geometry # Column indexes of longitude and latitude, if a point geometry is appended
+		self.buffer = ''
+		self.count = 0
+
+	def field(self, value):
+		value = value.strip()
+		if any(c in value for c in ',"\r\n'):
+			return '"' + value.replace('"', '""') + '"'
+		return value # Empty values are NULL
+
+	def read(self, size=-1):
+		lines = []
+		length = len(self.buffer)
+		while size < 0 or length < size:
+			row = next(self.rows, None)
+			if row is None:
+				break
+			if len(row) == 0:
+				continue
+			fields = [self.field(row[i]) for i in self.indexes]
+			if self.geometry is not None:
+				(lon, lat) = (row[self.geometry[0]].strip(), row[self.geometry[1]].strip())
+				fields.append('SRID=4326;POINT({0} {1})'.format(lon, lat) if lon and lat else '')
+			line = ','.join(fields) + '\n'
+			lines.append(line)
+			length += len(line)
+			self.count += 1
+		self.buffer += ''.join(lines)
+		if size < 0:
+			(data, self.buffer) = (self.buffer, '')
+		else:
+			(data, self.buffer) = (self.buffer[:size], self.buffer[size:])
+		return data
+
+def load(table, columns, errors):
+	load_conn = None
+	load_cur = None
+	try:
+		load_conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
+		load_cur = load_conn.cursor()
+		with open('{0}/{1}.txt'.format(gtfs_path, table), 'rb') as gtfs_file:
+			rows = csv.reader(gtfs_file)
+			header = [name.strip().lstrip('\xef\xbb\xbf') for name in next(rows)] # Removes the UTF-8 byte order mark, if any
+			indexes = [header.index(name) for (name, type) in columns]
+			geometry = (header.index('stop_lon'), header.index('stop_lat')) if table == 'stops' else None
+			source = CopySource(rows, indexes, geometry)
+			copy_columns = [name for (name, type) in columns] + (['geom'] if geometry is not None else [])
+			load_cur.copy_expert("""COPY {0}.{1} ({2}) FROM STDIN WITH (FORMAT csv);""".format(gtfs_schema, table, ', '.join(copy_columns)), source, copy_size)
+		for index in gtfs_indexes[table]:
+			load_cur.execute("""CREATE INDEX ON {0}.{1} {2};""".format(gtfs_schema, table, index))
+		load_cur.execute("""ANALYZE {0}.{1};""".format(gtfs_schema, table))
+		load_conn.commit()
+		print('GTFS {0} table stored into DB as {1}.{0} ({2} rows).'.format(table, gtfs_schema, source.count))
+	except Exception as e:
+		errors.append((table, e))
+	finally:
+		if load_cur is not None:
+			load_cur.close()
+		if load_conn is not None:
+			load_conn.close()
+
 try:
 	config = ConfigObj('../config/busmatching.properties')
 	db_name = config.get('database.name')
@@ -18,44 +101,36 @@ try:
 	db_port = config.get('database.port')
 	gtfs_schema = config.get('gtfs.schema')
 	gtfs_path = config.get('gtfs.path')
-	
+
 	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
 	cur = conn.cursor()
-	
+
 	cur.execute("""CREATE SCHEMA IF NOT EXISTS {0};""".format(gtfs_schema))
-	cur.execute("""DROP TABLE IF EXISTS {0}.shapes;""".format(gtfs_schema))
-	cur.execute("""DROP TABLE IF EXISTS {0}.stop_times;""".format(gtfs_schema))
-	cur.execute("""DROP TABLE IF EXISTS {0}.stops;""".format(gtfs_schema))
-	cur.execute("""DROP TABLE IF EXISTS {0}.trips;""".format(gtfs_schema))
+	for (table, columns) in gtfs_tables:
+		cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(gtfs_schema, table))
+		definitions = ['{0} {1}'.format(name, type) for (name, type) in columns]
+		if table == 'stops':
+			definitions.append('geom geometry(Point,4326)')
+		cur.execute("""CREATE TABLE {0}.{1} ({2});""".format(gtfs_schema, table, ', '.join(definitions)))
 	conn.commit()
-	
-	engine = create_engine("postgresql://{0}:{1}@{2}:{3}/{4}".format(db_user, db_password, db_host, db_port, db_name))
-	
-	df_shapes = pd.read_csv(gtfs_path + '/shapes.txt')
-	df_shapes.to_sql('shapes', engine, schema=gtfs_schema)
-	print('GTFS shapes table stored into DB as {0}.shapes.'.format(gtfs_schema))
-	
-	df_stop_times = pd.read_csv(gtfs_path + '/stop_times.txt')
-	df_stop_times.to_sql('stop_times', engine, schema=gtfs_schema)
-	print('GTFS stop times table stored into DB as {0}.stop_times.'.format(gtfs_schema))
-	
-	df_stops = pd.read_csv(gtfs_path + '/stops.txt')
-	df_stops.to_sql('stops', engine, schema=gtfs_schema)
-	print('GTFS stops table stored into DB as {0}.stops.'.format(gtfs_schema))
-	
-	df_trips = pd.read_csv(gtfs_path + '/trips.txt')
-	df_trips.to_sql('trips', engine, schema=gtfs_schema)
-	print('GTFS trips table stored into DB as {0}.trips.'.format(gtfs_schema))
-	
-except SystemExit:
-	pass
-	
+
+	errors = []
+	loaders = [threading.Thread(target=load, args=(table, columns, errors)) for (table, columns) in gtfs_tables]
+	for loader in loaders:
+		loader.start()
+	for loader in loaders:
+		loader.join()
+
+	for (table, e) in errors:
+		print('GTFS {0} table could not be stored. ({1})'.format(table, e))
+	if len(errors) > 0:
+		sys.exit(1)
 
 finally:
 	if cur is not None:
 		cur.close()
 		del cur
-		
+
 	if conn is not None:
 		conn.close()
-		del conn
\ No newline at end of file
+		del conn
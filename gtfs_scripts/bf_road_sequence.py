@@ -1,10 +1,16 @@
 # This script reads the map-matched routes files from the input folder, and writes the sequence of roads each route goes through in the <schema>.<table> table.
+# Shapes with identical stop sequences are map-matched once (see bf_convert_shapes.py), the road sequence of each result file is stored for all of them.
+# Road sequences are inserted in batches with COPY, the geometry of each road is looked up by gid in the ways table in the same step.
+# With gtfs.incremental=true only shapes listed as new or changed by bf_convert_shapes.py are read again, rows of changed and removed shapes are replaced or deleted.
+# The fingerprints of shapes are stored with their road sequences, shapes without a map-matching result are listed as changed again by the next run of bf_convert_shapes.py.
 
 import sys
 import psycopg2
 import os
 from configobj import ConfigObj
-import json
+import busmatching
+
+batch_size = 1000 # Number of files whose road sequences are inserted per COPY
 
 conn = None
 cur = None
@@ -16,88 +22,59 @@ try:
 	db_password = config.get('database.password')
 	db_host = config.get('database.host')
 	db_port = config.get('database.port')
+	bf_ways_table = config.get('database.table')
 	mapmatching_schema = config.get('mapmatching.schema')
 	mapmatched_directory = config.get('mapmatching.output.directory')
 	mapmatched_prefix = config.get('mapmatching.output.prefix')
 	road_sequence_table = config.get('mapmatching.table.road-sequence')
+	gtfs_schema = config.get('gtfs.schema')
+	fingerprints_table = config.get('gtfs.derived-table.shape-fingerprints')
+	changes_table = config.get('gtfs.derived-table.shape-changes')
+	sequences_table = config.get('gtfs.derived-table.shape-sequences')
+	incremental = config.get('gtfs.incremental') == 'true'
 	
 	conn = psycopg2.connect(database=db_name, user=db_user, password=db_password, host=db_host, port=db_port)
 	
 	cur = conn.cursor()
-	cur.execute("""CREATE SCHEMA IF NOT EXISTS {0};""".format(mapmatching_schema))
-	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, road_sequence_table))
-	cur.execute("""
-		CREATE TABLE {0}.{1} (
-			shape_id varchar,
-			segment_id	varchar,
-			segment_sequence integer,
-			heading varchar,
-			segment_geom geometry,
-			PRIMARY KEY (shape_id,segment_sequence)
-		) WITH ( OIDS=FALSE );""".format(mapmatching_schema, road_sequence_table))
-	conn.commit()
+	busmatching.create_road_sequence(cur, mapmatching_schema, road_sequence_table, not incremental)
+	busmatching.create_ways_index(cur, bf_ways_table)
 	file_list = os.listdir(mapmatched_directory) # Lists all files within the directory
+	if incremental: # Removes rows of new, changed and removed shapes, and reads only files of new and changed shapes
+		busmatching.delete_changed_shapes(cur, mapmatching_schema, road_sequence_table, gtfs_schema, changes_table)
+		busmatching.delete_removed_fingerprints(cur, gtfs_schema, fingerprints_table, changes_table)
+		cur.execute("""SELECT shape_id FROM {0}.{1} WHERE change <> 'removed';""".format(gtfs_schema, changes_table))
+		changed_files = set('{0}{1}.json'.format(mapmatched_prefix, r[0]) for r in cur.fetchall())
+		file_list = [file_name for file_name in file_list if file_name in changed_files]
+		print("{0} new or changed shapes to extract.".format(len(file_list)))
+	duplicates = busmatching.shape_duplicates(cur, gtfs_schema, changes_table, sequences_table)
+	shared = set(shape_id for (representative, shape_ids) in duplicates.items() for shape_id in shape_ids if shape_id != representative)
+	file_list = [file_name for file_name in file_list if file_name[len(mapmatched_prefix) : file_name.index('.')] not in shared] # Results of shapes that are not representatives are outdated, the representative's result is stored for them
+	conn.commit()
 	progress = 1 # Not necessary to the algorithm, it's just a counter to display the script's progress
+	rows = [] # Rows of (shape_id, road, segment_sequence, heading) of the current batch
+	matched = [] # Shapes of the current batch with a map-matching result
 	for file_name in file_list: # Each file, which represents a bus route, is processed
 		shape_id = file_name[len(mapmatched_prefix) : file_name.index('.')] # Extracts the shape ID
 		
 		print('Extracting road sequence from ' + file_name +  ' (' + str(progress) + '/' + str(len(file_list)) + ')...')
-		mm_result = None
-		for line in open(mapmatched_directory + '/' + file_name, 'r'):
-			if line.startswith('[{"seqprob"'): # Line that contains the information necessary to build a sequence of way IDs
-				mm_result = json.loads(line)
+		with open(mapmatched_directory + '/' + file_name, 'r') as mm_file: # Candidates of the line that contains the information necessary to build a sequence of way IDs are streamed
+			road_heading_sequence = busmatching.road_sequence(busmatching.debug_candidates(mm_file))
 		
-		if not mm_result: # File is invalid: no map-matching result found
+		if len(road_heading_sequence) > 0: # Otherwise the file is invalid: no map-matching result found
+			for duplicate_id in duplicates.get(shape_id, [shape_id]): # All shapes with the same stop sequence share the result
+				for (segment_sequence, segment) in enumerate(road_heading_sequence, 1):
+					rows.append((duplicate_id, int(segment[0]), segment_sequence, segment[1]))
+				matched.append(duplicate_id)
+		else:
 			print("No map-matching information found in {0}, skipping.".format(file_name))
-			progress += 1
-			continue
 		
-		road_heading_sequence = []
-		previous_road = None # Used to avoid duplicates
-		previous_heading = None # Used to avoid situations where a (wrong) road is entered and exited immediately
-		rh = None
-		for element in mm_result: # This for loop builds the road sequence
-			found_roads = False # "roads" is a field that contains a sequence of way IDs traversed to move from one point to another
-			transition = element.get('transition')
-			if transition != None: # Only the first element should lack a "transition" field
-				route = transition.get('route')
-				if route != None:
-					roads = route.get('roads')
-					if roads != None: # Contains a sequence of way IDs
-						for r in roads:
-							found_roads = True
-							route_road = r['road']
-							heading = r['heading']
-							if (route_road != previous_road) or ((previous_heading == 'forward' and heading == 'backward') or (previous_heading == 'backward' and heading == 'forward')): # Checks that the road is different, or the same in opposite direction
-								rh = [route_road, heading]
-								road_heading_sequence.append(rh)
-								previous_road = route_road
-								previous_heading = heading
-			if not found_roads: # The first element lacks a "transition" field, so instead it takes "point.road" for the first road
-				road = element['point']['road']
-				heading = element['point']['heading']
-				if (road != None and road != previous_road) or ((road == previous_road) and ((previous_heading == 'forward' and heading == 'backward') or (previous_heading == 'backward' and heading == 'forward'))): # Probably an unnecessary check, but it's safer this way
-					rh = [road, heading]
-					road_heading_sequence.append(rh)
-					previous_road = road
-					previous_heading = heading
-		segment_sequence = 1
-		for segment in road_heading_sequence: # Inserts the sequence of way IDs into the database
-			cur.execute("""
-				INSERT INTO {0}.{1} (shape_id, segment_id, segment_sequence, heading)
-					VALUES ('{2}', '{3}', {4}, '{5}');
-			""".format(mapmatching_schema, road_sequence_table, shape_id, segment[0], segment_sequence, segment[1]))
-			segment_sequence += 1
-		conn.commit()
+		if progress % batch_size == 0 or progress == len(file_list): # Inserts the sequences of way IDs of the batch into the database, together with the fingerprints of their shapes
+			busmatching.insert_road_sequences(cur, mapmatching_schema, road_sequence_table, bf_ways_table, rows)
+			busmatching.store_fingerprints(cur, gtfs_schema, fingerprints_table, changes_table, matched)
+			conn.commit()
+			(rows, matched) = ([], [])
 		progress += 1 # 1 more route has been processed; this counter is only used to display the script's progress
 	
-	cur.execute("""
-		UPDATE {0}.{1} r
-		SET segment_geom = b.geom
-		FROM bfmap_ways b
-		WHERE TRIM(LEADING '0' FROM r.segment_id) = CAST(b.gid AS varchar);
-	""".format(mapmatching_schema, road_sequence_table))
-	conn.commit()
 	print("All bus routes have been handled.")
 
 finally:
@@ -0,0 +1,353 @@
+# Functions shared by the scripts that prepare GTFS shapes, map-match them and store the matched road sequences.
+
+import re
+import io
+import json
+
+candidates_prefix = '[{"seqprob"' # Start of the line of debug output that lists the candidates of the map-matching result
+chunk_size = 65536
+separators = re.compile(r'[\s,]*')
+
+# Comma separated property value as string, ConfigObj reads comma separated values as lists
+def config_list(value):
+	return ','.join(value) if isinstance(value, list) else value
+
+# Creates a table that lists all stops and arrival times of the representative trip (lowest trip ID that has stop times) of each shape ID
+def create_shape_stops(cur, gtfs_schema, shape_stops_table):
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(gtfs_schema, shape_stops_table))
+	cur.execute("""
+		CREATE TABLE {0}.{1} AS
+		WITH trip_shapes AS (
+			SELECT DISTINCT ON (t.shape_id)
+				t.shape_id,
+				t.trip_id
+			FROM {0}.trips t
+			WHERE EXISTS (SELECT 1 FROM {0}.stop_times st WHERE st.trip_id = t.trip_id)
+			ORDER BY t.shape_id, t.trip_id
+		)
+		SELECT
+			ts.shape_id,
+			ts.trip_id,
+			st.stop_id,
+			st.stop_sequence,
+			st.arrival_time,
+			s.stop_lat,
+			s.stop_lon,
+			ST_SetSRID(ST_MakePoint(stop_lon,stop_lat),4326) AS geom
+		FROM trip_shapes ts
+			LEFT JOIN {0}.stop_times st
+				ON ts.trip_id = st.trip_id
+			LEFT JOIN {0}.stops s
+				ON st.stop_id = s.stop_id;
+	""".format(gtfs_schema, shape_stops_table))
+	cur.execute("""CREATE INDEX ON {0}.{1} (shape_id, stop_sequence);""".format(gtfs_schema, shape_stops_table))
+
+# Fingerprints each shape by its representative trip and the stops, coordinates and times of that trip, and lists new, changed and removed shapes with their current fingerprint in the changes table.
+# If trace is set (the options of traces built from shapes.txt, see traces.py), the shapes.txt points and the options are part of the fingerprint.
+# Fingerprints are stored only once the results of a shape are stored (see store_fingerprints), so shapes that failed or were not processed are listed again by the next run.
+# Without incremental all shapes are listed as new. Returns the list of (shape_id, change) and the total number of shapes.
+def create_shape_changes(cur, gtfs_schema, shape_stops_table, fingerprints_table, changes_table, incremental, trace=None):
+	cur.execute("""
+		CREATE TEMPORARY TABLE current_fingerprints AS
+		SELECT
+			ss.shape_id,
+			md5(string_agg(concat_ws(',', ss.trip_id, ss.stop_id, ss.stop_sequence, ss.stop_lat, ss.stop_lon, ss.arrival_time), ';' ORDER BY ss.stop_sequence)) AS fingerprint
+		FROM {0}.{1} ss
+		GROUP BY ss.shape_id;
+	""".format(gtfs_schema, shape_stops_table))
+	if trace is not None:
+		add_point_hashes(cur, gtfs_schema, 'current_fingerprints', 'fingerprint', trace)
+	cur.execute("""CREATE TABLE IF NOT EXISTS {0}.{1} (shape_id varchar PRIMARY KEY, fingerprint varchar);""".format(gtfs_schema, fingerprints_table))
+	if not incremental: # All shapes are converted again
+		cur.execute("""DELETE FROM {0}.{1};""".format(gtfs_schema, fingerprints_table))
+
+	# Lists new, changed and removed shapes
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(gtfs_schema, changes_table))
+	cur.execute("""
+		CREATE TABLE {0}.{1} AS
+		SELECT
+			COALESCE(c.shape_id, p.shape_id) AS shape_id,
+			CASE WHEN p.shape_id IS NULL THEN 'new' WHEN c.shape_id IS NULL THEN 'removed' ELSE 'changed' END AS change,
+			c.fingerprint
+		FROM current_fingerprints c FULL OUTER JOIN {0}.{2} p
+			ON c.shape_id = p.shape_id
+		WHERE c.fingerprint IS DISTINCT FROM p.fingerprint;
+	""".format(gtfs_schema, changes_table, fingerprints_table))
+	cur.execute("""CREATE INDEX ON {0}.{1} (shape_id);""".format(gtfs_schema, changes_table))
+	cur.execute("""SELECT COUNT(*) FROM current_fingerprints;""")
+	total = cur.fetchone()[0]
+	cur.execute("""DROP TABLE current_fingerprints;""")
+	cur.execute("""SELECT shape_id, change FROM {0}.{1};""".format(gtfs_schema, changes_table))
+	return (cur.fetchall(), total)
+
+# Stores the current fingerprints (from the changes table) of the given new and changed shapes, in the transaction that stores their results
+def store_fingerprints(cur, gtfs_schema, fingerprints_table, changes_table, shape_ids):
+	cur.execute("""DELETE FROM {0}.{1} WHERE shape_id = ANY(%s);""".format(gtfs_schema, fingerprints_table), (list(shape_ids),))
+	cur.execute("""
+		INSERT INTO {0}.{1} (shape_id, fingerprint)
+		SELECT shape_id, fingerprint
+		FROM {0}.{2}
+		WHERE shape_id = ANY(%s) AND change <> 'removed';
+	""".format(gtfs_schema, fingerprints_table, changes_table), (list(shape_ids),))
+
+# Deletes the fingerprints of removed shapes, in the transaction that deletes their results
+def delete_removed_fingerprints(cur, gtfs_schema, fingerprints_table, changes_table):
+	cur.execute("""
+		DELETE FROM {0}.{1} f
+		USING {0}.{2} c
+		WHERE f.shape_id = c.shape_id AND c.change = 'removed';
+	""".format(gtfs_schema, fingerprints_table, changes_table))
+
+# Mixes the hash of the shapes.txt points of each shape and the trace options into the hash column of a table of shapes
+def add_point_hashes(cur, gtfs_schema, table, column, trace):
+	cur.execute("""
+		UPDATE {1} h
+		SET {2} = md5(h.{2} || COALESCE((
+			SELECT md5(string_agg(concat_ws(',', s.shape_pt_lon, s.shape_pt_lat), ';' ORDER BY s.shape_pt_sequence))
+			FROM {0}.shapes s
+			WHERE s.shape_id = h.shape_id
+		), '') || %s);
+	""".format(gtfs_schema, table, column), (trace,))
+
+# Hashes the matcher input of each shape (its sequence of stop coordinates and times), shapes with the same hash have the same map-matching result.
+# Of all new and changed shapes with the same hash, only the representative (lowest shape ID) is map-matched and its result is used for all of them.
+# If trace is set, matcher input is built from shapes.txt, so the shapes.txt points and the trace options are part of the hash.
+# Returns the number of distinct sequences of new and changed shapes.
+def create_shape_sequences(cur, gtfs_schema, shape_stops_table, changes_table, sequences_table, trace=None):
+	cur.execute("""
+		CREATE TEMPORARY TABLE sequence_hashes AS
+		SELECT
+			shape_id,
+			md5(string_agg(concat_ws(',', stop_lon, stop_lat, arrival_time), ';' ORDER BY stop_sequence)) AS sequence_hash
+		FROM {0}.{1}
+		GROUP BY shape_id;
+	""".format(gtfs_schema, shape_stops_table))
+	if trace is not None:
+		add_point_hashes(cur, gtfs_schema, 'sequence_hashes', 'sequence_hash', trace)
+	cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(gtfs_schema, sequences_table))
+	cur.execute("""
+		CREATE TABLE {0}.{1} AS
+		SELECT
+			h.shape_id,
+			h.sequence_hash,
+			CASE WHEN c.shape_id IS NULL THEN h.shape_id ELSE MIN(h.shape_id) OVER (PARTITION BY h.sequence_hash, c.shape_id IS NULL) END AS representative
+		FROM sequence_hashes h LEFT JOIN {0}.{2} c
+			ON h.shape_id = c.shape_id AND c.change <> 'removed';
+	""".format(gtfs_schema, sequences_table, changes_table))
+	cur.execute("""DROP TABLE sequence_hashes;""")
+	cur.execute("""CREATE INDEX ON {0}.{1} (representative);""".format(gtfs_schema, sequences_table))
+	cur.execute("""
+		SELECT COUNT(DISTINCT q.representative)
+		FROM {0}.{1} q INNER JOIN {0}.{2} c
+			ON q.shape_id = c.shape_id
+		WHERE c.change <> 'removed';
+	""".format(gtfs_schema, sequences_table, changes_table))
+	return cur.fetchone()[0]
+
+# Returns the new and changed shapes that share the result of each representative
+def shape_duplicates(cur, gtfs_schema, changes_table, sequences_table):
+	cur.execute("""
+		SELECT q.representative, q.shape_id
+		FROM {0}.{1} q INNER JOIN {0}.{2} c
+			ON q.shape_id = c.shape_id
+		WHERE c.change <> 'removed'
+		ORDER BY q.shape_id;
+	""".format(gtfs_schema, sequences_table, changes_table))
+	duplicates = {}
+	for (representative, shape_id) in cur.fetchall():
+		duplicates.setdefault(representative, []).append(shape_id)
+	return duplicates
+
+# Streams the stops of all new and changed shapes that are representatives of their stop sequence in a single query, ordered by shape. Yields (shape_id, rows) with rows of (longitude, latitude, timestamp).
+# Longitude, latitude, and a timestamp are necessary for BMW Car IT's Barefoot map-matching algorithm to work. Timestamps are built by taking the time from GTFS.
+# With points, the shapes.txt points of each shape are streamed by the same query and (shape_id, rows, points) is yielded with points of (longitude, latitude).
+def shape_rows(conn, gtfs_schema, shape_stops_table, changes_table, sequences_table, points=False):
+	export_cur = conn.cursor('shape_export') # Server-side cursor, rows are fetched in batches
+	query = """
+		SELECT
+			ss.shape_id,
+			0 AS kind,
+			ss.stop_sequence AS sequence,
+			ss.stop_lon,
+			ss.stop_lat,
+			'2018-01-01 ' || ss.arrival_time || '+00:00' AS timestamp
+		FROM {0}.{1} ss INNER JOIN {0}.{2} c
+				ON ss.shape_id = c.shape_id
+			INNER JOIN {0}.{3} q
+				ON ss.shape_id = q.shape_id
+		WHERE c.change <> 'removed' AND q.representative = q.shape_id
+	"""
+	if points:
+		query += """
+		UNION ALL
+		SELECT
+			s.shape_id,
+			1 AS kind,
+			s.shape_pt_sequence AS sequence,
+			s.shape_pt_lon,
+			s.shape_pt_lat,
+			NULL AS timestamp
+		FROM {0}.shapes s INNER JOIN {0}.{2} c
+				ON s.shape_id = c.shape_id
+			INNER JOIN {0}.{3} q
+				ON s.shape_id = q.shape_id
+		WHERE c.change <> 'removed' AND q.representative = q.shape_id
+		"""
+	export_cur.execute((query + """
+		ORDER BY shape_id, kind, sequence;
+	""").format(gtfs_schema, shape_stops_table, changes_table, sequences_table))
+	try:
+		shape_id = None
+		rows = ([], [])
+		for row in export_cur:
+			if row[0] != shape_id:
+				if len(rows[0]) > 0:
+					yield (shape_id, rows[0], rows[1]) if points else (shape_id, rows[0])
+				rows = ([], [])
+			shape_id = row[0]
+			if row[1] == 0:
+				rows[0].append(row[3:])
+			else:
+				rows[1].append(row[3:5])
+		if len(rows[0]) > 0:
+			yield (shape_id, rows[0], rows[1]) if points else (shape_id, rows[0])
+	finally:
+		export_cur.close()
+
+# Sample j of a shape as JSON, in the format required by the map-matching algorithm
+def shape_sample(j, row):
+	return '{"point":"POINT(' + str(row[0]) + ' ' + str(row[1]) + ')","time":"' + str(row[2]) + '","id":"' + str(j) + '"}'
+
+# Creates the table of road sequences, if drop is set an existing table is replaced. Roads are stored by their numeric ID, the gid of the ways table.
+def create_road_sequence(cur, mapmatching_schema, road_sequence_table, drop):
+	cur.execute("""CREATE SCHEMA IF NOT EXISTS {0};""".format(mapmatching_schema))
+	if drop:
+		cur.execute("""DROP TABLE IF EXISTS {0}.{1};""".format(mapmatching_schema, road_sequence_table))
+	cur.execute("""
+		CREATE TABLE IF NOT EXISTS {0}.{1} (
+			shape_id varchar,
+			segment_id	bigint,
+			segment_sequence integer,
+			heading varchar,
+			segment_geom geometry,
+			PRIMARY KEY (shape_id,segment_sequence)
+		) WITH ( OIDS=FALSE );""".format(mapmatching_schema, road_sequence_table))
+	cur.execute("""
+		SELECT data_type FROM information_schema.columns
+		WHERE table_schema = %s AND table_name = %s AND column_name = 'segment_id';
+	""", (mapmatching_schema, road_sequence_table))
+	if cur.fetchone()[0] != 'bigint': # Tables of previous versions stored road IDs as text
+		cur.execute("""ALTER TABLE {0}.{1} ALTER COLUMN segment_id TYPE bigint USING CAST(segment_id AS bigint);""".format(mapmatching_schema, road_sequence_table))
+
+# Creates the index on gid of the ways table (Barefoot creates none), so that road geometries are looked up by key
+def create_ways_index(cur, ways_table):
+	index = 'idx_{0}_gid'.format(ways_table.split('.')[-1]) # Named as the geometry index of bfmap.py
+	cur.execute("""SELECT 1 FROM pg_indexes WHERE indexname = %s;""", (index,))
+	if cur.fetchone() is None:
+		cur.execute("""CREATE INDEX {0} ON {1} (gid);""".format(index, ways_table))
+
+# Inserts rows of (shape_id, road, segment_sequence, heading) into the table of road sequences with COPY into a temporary table,
+# the geometry of each road is joined from the ways table by gid in the same statement
+def insert_road_sequences(cur, mapmatching_schema, road_sequence_table, ways_table, rows):
+	cur.execute("""
+		CREATE TEMPORARY TABLE IF NOT EXISTS road_sequence_rows (
+			shape_id varchar,
+			segment_id bigint,
+			segment_sequence integer,
+			heading varchar
+		);""")
+	cur.copy_from(io.BytesIO(u"".join(u"{0}\t{1}\t{2}\t{3}\n".format(*row) for row in rows).encode('utf-8')), 'road_sequence_rows')
+	cur.execute("""
+		INSERT INTO {0}.{1} (shape_id, segment_id, segment_sequence, heading, segment_geom)
+		SELECT r.shape_id, r.segment_id, r.segment_sequence, r.heading, b.geom
+		FROM road_sequence_rows r LEFT JOIN {2} b
+			ON b.gid = r.segment_id;
+	""".format(mapmatching_schema, road_sequence_table, ways_table))
+	cur.execute("""TRUNCATE road_sequence_rows;""")
+
+# Deletes the rows of new, changed and removed shapes listed in the changes table from a table of results
+def delete_changed_shapes(cur, mapmatching_schema, table, gtfs_schema, changes_table):
+	cur.execute("""
+		DELETE FROM {0}.{1} r
+		USING {2}.{3} c
+		WHERE r.shape_id = c.shape_id;
+	""".format(mapmatching_schema, table, gtfs_schema, changes_table))
+
+# Deletes the rows of the given shapes from a table of results
+def delete_shapes(cur, mapmatching_schema, table, shape_ids):
+	cur.execute("""DELETE FROM {0}.{1} WHERE shape_id = ANY(%s);""".format(mapmatching_schema, table), (list(shape_ids),))
+
+# Streams the candidates of the map-matching result (the line of debug output that starts with candidates_prefix) from a file-like object, one at a time.
+# The file is read in chunks, other lines are skipped without decoding them and each candidate is decoded on its own, so the whole result is never held in memory.
+def debug_candidates(result_file, size=chunk_size):
+	decoder = json.JSONDecoder()
+	(buffer, position, skipping) = ('', 0, False)
+	while True: # Finds the line of the candidates
+		if skipping:
+			newline = buffer.find('\n', position)
+			if newline < 0:
+				(buffer, position) = (result_file.read(size), 0)
+				if not buffer:
+					return
+				continue
+			(position, skipping) = (newline + 1, False)
+		head = buffer[position:position + len(candidates_prefix)]
+		if head == candidates_prefix:
+			break
+		if len(head) == len(candidates_prefix) or '\n' in head: # Another line
+			skipping = True
+			continue
+		chunk = result_file.read(size)
+		if not chunk:
+			return
+		(buffer, position) = (buffer[position:] + chunk, 0)
+	position += 1 # Opening bracket of the list of candidates
+	while True:
+		position = separators.match(buffer, position).end()
+		if position < len(buffer) and buffer[position] == ']':
+			return
+		try:
+			(candidate, end) = decoder.raw_decode(buffer, position)
+		except ValueError: # Candidate continues in the next chunk
+			chunk = result_file.read(size)
+			if not chunk:
+				raise
+			(buffer, position) = (buffer[position:] + chunk, 0)
+			continue
+		yield candidate
+		position = end
+		if position > size:
+			(buffer, position) = (buffer[position:], 0)
+
+# Builds the sequence of [road, heading] a route goes through from the candidates of the map-matching result (second line of debug output), a list or a stream of debug_candidates
+def road_sequence(mm_result):
+	road_heading_sequence = []
+	previous_road = None # Used to avoid duplicates
+	previous_heading = None # Used to avoid situations where a (wrong) road is entered and exited immediately
+	rh = None
+	for element in mm_result: # This for loop builds the road sequence
+		found_roads = False # "roads" is a field that contains a sequence of way IDs traversed to move from one point to another
+		transition = element.get('transition')
+		if transition != None: # Only the first element should lack a "transition" field
+			route = transition.get('route')
+			if route != None:
+				roads = route.get('roads')
+				if roads != None: # Contains a sequence of way IDs
+					for r in roads:
+						found_roads = True
+						route_road = r['road']
+						heading = r['heading']
+						if (route_road != previous_road) or ((previous_heading == 'forward' and heading == 'backward') or (previous_heading == 'backward' and heading == 'forward')): # Checks that the road is different, or the same in opposite direction
+							rh = [route_road, heading]
+							road_heading_sequence.append(rh)
+							previous_road = route_road
+							previous_heading = heading
+		if not found_roads: # The first element lacks a "transition" field, so instead it takes "point.road" for the first road
+			road = element['point']['road']
+			heading = element['point']['heading']
+			if (road != None and road != previous_road) or ((road == previous_road) and ((previous_heading == 'forward' and heading == 'backward') or (previous_heading == 'backward' and heading == 'forward'))): # Probably an unnecessary check, but it's safer this way
+				rh = [road, heading]
+				road_heading_sequence.append(rh)
+				previous_road = road
+				previous_heading = heading
+	return road_heading_sequence
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+set -o errexit -o nounset
+
+cd "$(dirname "$0")"
+export PYTHONPATH=..
+
+echo "Run GTFS scripts test ..."
+python -m unittest test_traces test_busmatching
@@ -0,0 +1,50 @@
+# Tests of the streamed candidates of the map-matching debug output (busmatching.py). Run with run.sh.
+
+import io
+import json
+import unittest
+from collections import OrderedDict
+import busmatching
+
+def candidate(i, roads):
+	point = OrderedDict([('road', i), ('heading', 'forward'), ('name', 'Via "{0}", [a], {{b}}\\'.format(i))])
+	transition = OrderedDict([('route', OrderedDict([('roads', [OrderedDict([('road', r), ('heading', 'backward')]) for r in roads])]))])
+	return OrderedDict([('seqprob', -0.5 * i), ('filtprob', 1.0), ('point', point)] + ([('transition', transition)] if roads else []))
+
+def debug_output(candidates):
+	samples = json.dumps([{'id': 1, 'time': 1514764800, 'point': 'POINT(0 0)'}])
+	return 'SUCCESS\n{0}\n{1}\n'.format(samples, json.dumps(candidates, separators=(',', ':')))
+
+class TestDebugCandidates(unittest.TestCase):
+
+	def test_candidates(self):
+		candidates = [candidate(i, range(i, i + 3) if i else []) for i in range(20)]
+		body = debug_output(candidates)
+		line = body.split('\n')[2]
+		self.assertTrue(line.startswith(busmatching.candidates_prefix))
+
+		for size in [1, 2, 3, 7, 64, busmatching.chunk_size]:
+			self.assertEquals(json.loads(line), list(busmatching.debug_candidates(io.BytesIO(body), size)))
+
+	def test_whitespace(self):
+		candidates = [candidate(i, [i]) for i in range(3)]
+		body = 'SUCCESS\n[]\n[{"seqprob" : 0.0}, \n  ' + ' ,  '.join(json.dumps(c) for c in candidates) + ' ]\n'
+
+		for size in [1, 5, busmatching.chunk_size]:
+			self.assertEquals([{'seqprob': 0.0}] + json.loads(json.dumps(candidates)), list(busmatching.debug_candidates(io.BytesIO(body), size)))
+
+	def test_empty(self):
+		for size in [1, 4, busmatching.chunk_size]:
+			# Empty list of candidates, and no line of candidates
+			self.assertEquals([], list(busmatching.debug_candidates(io.BytesIO('SUCCESS\n[]\n[]\n'), size)))
+			self.assertEquals([], list(busmatching.debug_candidates(io.BytesIO('SUCCESS\n[]\n'), size)))
+			self.assertEquals([], list(busmatching.debug_candidates(io.BytesIO(''), size)))
+
+	def test_truncated(self):
+		body = debug_output([candidate(i, [i]) for i in range(3)])
+		for size in [1, 7, busmatching.chunk_size]:
+			with self.assertRaises(ValueError):
+				list(busmatching.debug_candidates(io.BytesIO(body[:-20]), size))
+
+if __name__ == '__main__':
+	unittest.main()
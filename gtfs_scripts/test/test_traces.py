@@ -0,0 +1,91 @@
+# Tests of the traces built from shapes.txt polylines (traces.py). Run with run.sh.
+
+import unittest
+import numpy
+import traces
+
+# Longitude difference of 100 meters at the equator
+STEP = 100.0 / (numpy.radians(1.0) * traces.EARTH_RADIUS)
+
+def stop(lon, lat, time):
+	return (lon, lat, '2018-01-01 {0}+00:00'.format(time) if time is not None else None)
+
+def meters(rows, lat0=0.0):
+	(x, y) = traces.project(numpy.array([r[0] for r in rows]), numpy.array([r[1] for r in rows]), lat0)
+	return numpy.hypot(numpy.diff(x), numpy.diff(y))
+
+def seconds(rows):
+	return [traces.seconds(r[2]) for r in rows]
+
+class TestTraces(unittest.TestCase):
+
+	def test_seconds(self):
+		self.assertEquals(8 * 3600 + 5 * 60 + 3, traces.seconds('2018-01-01 08:05:03+00:00'))
+		self.assertEquals(8 * 3600, traces.seconds('2018-01-01 8:00:00+00:00'))
+		self.assertEquals(25 * 3600 + 600, traces.seconds('2018-01-01 25:10:00+00:00'))
+		self.assertEquals(None, traces.seconds('2018-01-01 +00:00'))
+		self.assertEquals(None, traces.seconds(None))
+		self.assertEquals('2018-01-02 01:10:00+00:00', traces.timestamp(25 * 3600 + 600))
+
+	def test_densify(self):
+		points = numpy.array([[0.0, 0.0], [250.0, 0.0], [260.0, 0.0]])
+		dense = traces.densify(points, 100.0)
+		self.assertEquals([0.0, 250.0 / 3, 500.0 / 3, 250.0, 260.0], list(dense[:, 0]))
+
+	def test_simplify(self):
+		x = numpy.array([0.0, 10.0, 20.0, 30.0, 40.0, 40.0, 40.0])
+		y = numpy.array([0.0, 0.1, 0.0, 0.2, 0.0, 20.0, 40.0])
+		along = numpy.concatenate([[0.0], numpy.cumsum(numpy.hypot(numpy.diff(x), numpy.diff(y)))])
+		# Collinear points are dropped, the corner is kept.
+		self.assertEquals([0, 4, 6], list(traces.simplify(x, y, along, 1.0, 1000.0)))
+		# Parts longer than spacing are split.
+		self.assertTrue(numpy.all(numpy.diff(along[traces.simplify(x, y, along, 1.0, 25.0)]) <= 25.0))
+
+	def test_spacing(self):
+		# L-shaped route of 2 km and 1 km with stops at its ends and corner
+		points = [(0.0, 0.0), (20 * STEP, 0.0), (20 * STEP, 10 * STEP)]
+		rows = [stop(0.0, 0.0, '08:00:00'), stop(20 * STEP, 0.0, '08:04:00'), stop(20 * STEP, 10 * STEP, '08:06:00')]
+
+		for spacing in [50.0, 100.0, 300.0]:
+			result = traces.trace(rows, points, spacing, 5.0)
+			self.assertTrue(meters(result).max() <= spacing + 1e-6)
+			self.assertAlmostEquals(3000.0, meters(result).sum(), places=3)
+			self.assertEquals(8 * 3600, seconds(result)[0])
+			self.assertEquals(8 * 3600 + 360, seconds(result)[-1])
+		# Corner at the second stop, after two thirds of the route and four of six minutes
+		result = traces.trace(rows, points, 100.0, 5.0)
+		corner = [i for (i, r) in enumerate(result) if abs(r[0] - 20 * STEP) < 1e-12 and r[1] == 0.0][0]
+		self.assertEquals(8 * 3600 + 240, seconds(result)[corner])
+
+	def test_monotonic(self):
+		# Stops with the same or decreasing times
+		points = [(0.0, 0.0), (10 * STEP, 0.0)]
+		rows = [stop(0.0, 0.0, '08:00:00'), stop(5 * STEP, 0.0, '08:00:00'), stop(7 * STEP, 0.0, '07:59:00'), stop(10 * STEP, 0.0, '08:00:02')]
+
+		times = seconds(traces.trace(rows, points, 100.0, 5.0))
+
+		self.assertEquals(11, len(times))
+		self.assertTrue(numpy.all(numpy.diff(times) >= 1))
+		self.assertEquals(8 * 3600, times[0])
+
+	def test_after_midnight(self):
+		points = [(0.0, 0.0), (5 * STEP, 0.0)]
+		rows = [stop(0.0, 0.0, '23:59:00'), stop(5 * STEP, 0.0, '24:01:00')]
+
+		result = traces.trace(rows, points, 100.0, 5.0)
+
+		# Times past 24:00 continue on the next day
+		self.assertEquals(['2018-01-01 23:59:00+00:00', '2018-01-01 23:59:24+00:00', '2018-01-01 23:59:48+00:00',
+			'2018-01-02 00:00:12+00:00', '2018-01-02 00:00:36+00:00', '2018-01-02 00:01:00+00:00'], [r[2] for r in result])
+
+	def test_fallback(self):
+		rows = [stop(0.0, 0.0, '08:00:00'), stop(STEP, 0.0, '08:01:00')]
+		# Less than two shapes.txt points
+		self.assertEquals(rows, traces.trace(rows, [], 100.0, 5.0))
+		self.assertEquals(rows, traces.trace(rows, [(0.0, 0.0)], 100.0, 5.0))
+		# No stop with coordinates and arrival time
+		rows = [stop(0.0, 0.0, None), stop(None, None, '08:01:00')]
+		self.assertEquals(rows, traces.trace(rows, [(0.0, 0.0), (STEP, 0.0)], 100.0, 5.0))
+
+if __name__ == '__main__':
+	unittest.main()
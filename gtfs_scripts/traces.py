@@ -0,0 +1,104 @@
+# Builds the matcher input of a shape from its shapes.txt polyline instead of its stops only.
+# The polyline is densified so that no step is longer than the spacing, then simplified with Douglas-Peucker: a part is split at its farthest point while that point
+# deviates more than the tolerance, and at its middle while it is longer than the spacing. All parts of a shape are split in the same vectorized pass, so a trace keeps
+# the curves of the route and has a sample at least every spacing meters. Timestamps are interpolated along the polyline between the arrival times of the stops.
+
+import re
+import datetime
+import numpy
+
+EARTH_RADIUS = 6371000.0
+DAY = datetime.datetime(2018, 1, 1) # Same day as the stop timestamps of busmatching.shape_rows
+TIME = re.compile(r'\s(\d+):(\d\d):(\d\d)')
+
+# Options of traces as a string, part of the shape fingerprints and sequence hashes (see busmatching.py), so that shapes are converted again when the options change
+def options(spacing, tolerance):
+	return 'shapes,{0},{1}'.format(spacing, tolerance)
+
+# Projects longitudes and latitudes on a plane in meters, precise enough for the extent of a bus route
+def project(lons, lats, lat0):
+	scale = numpy.radians(1.0) * EARTH_RADIUS
+	return (lons * scale * numpy.cos(numpy.radians(lat0)), lats * scale)
+
+# Seconds since the start of the day of a stop timestamp, None if the stop has no arrival time. GTFS times may exceed 24:00:00.
+def seconds(timestamp):
+	match = TIME.search(timestamp) if timestamp is not None else None
+	if match is None:
+		return None
+	return int(match.group(1)) * 3600 + int(match.group(2)) * 60 + int(match.group(3))
+
+# Timestamp of seconds since the start of the day, in the format of the stop timestamps
+def timestamp(second):
+	return (DAY + datetime.timedelta(seconds=int(second))).strftime('%Y-%m-%d %H:%M:%S') + '+00:00'
+
+# Inserts evenly spaced points into each step of the polyline (rows of x, y, lon, lat) longer than spacing
+def densify(points, spacing):
+	steps = numpy.hypot(numpy.diff(points[:, 0]), numpy.diff(points[:, 1]))
+	parts = numpy.maximum(numpy.ceil(steps / spacing), 1).astype('int64') # Number of parts each step is divided into
+	origins = numpy.repeat(numpy.arange(len(steps)), parts)
+	fractions = (numpy.arange(len(origins)) - numpy.repeat(numpy.cumsum(parts) - parts, parts)) / numpy.repeat(parts, parts).astype('float64')
+	dense = points[origins] + fractions[:, None] * (points[origins + 1] - points[origins])
+	return numpy.vstack([dense, points[-1:]])
+
+# Indexes of the points kept by Douglas-Peucker simplification with tolerance meters, parts longer than spacing meters along the polyline are split at their middle
+def simplify(x, y, along, tolerance, spacing):
+	n = len(x)
+	if n < 3:
+		return numpy.arange(n)
+	indexes = numpy.arange(n)
+	keep = numpy.zeros(n, dtype=bool)
+	keep[[0, n - 1]] = True
+	while True:
+		kept = numpy.nonzero(keep)[0]
+		parts = numpy.minimum(numpy.searchsorted(kept, indexes, side='right') - 1, len(kept) - 2) # Part of each point, from kept[p] to kept[p + 1]
+		(start, end) = (kept[parts], kept[parts + 1])
+		(dx, dy) = (x[end] - x[start], y[end] - y[start])
+		chords = numpy.hypot(dx, dy)
+		deviations = numpy.where(chords > 0, numpy.abs(dx * (y - y[start]) - dy * (x - x[start])) / numpy.maximum(chords, 1e-9), numpy.hypot(x - x[start], y - y[start]))
+		deviations[keep] = 0.0
+		order = numpy.lexsort((indexes, -deviations, parts)) # Points by part, farthest first
+		farthest = order[numpy.searchsorted(parts[order], numpy.arange(len(kept) - 1))]
+		deviating = deviations[farthest] > tolerance
+		long = (along[kept[1:]] - along[kept[:-1]] > spacing) & (numpy.diff(kept) > 1) & ~deviating
+		middles = numpy.clip(numpy.searchsorted(along, (along[kept[:-1]] + along[kept[1:]]) / 2.0), kept[:-1] + 1, kept[1:] - 1)
+		splits = numpy.concatenate([farthest[deviating], middles[long]])
+		if len(splits) == 0:
+			return kept
+		keep[splits] = True
+
+# Index of the polyline point nearest to each stop, in order of the stops. If the route passes a stop more than once, the first pass after the previous stop is taken:
+# a pass is a run of points less than spacing meters farther from the stop than the nearest point, and the nearest point of the first pass is taken.
+def locate(x, y, stop_x, stop_y, spacing):
+	located = numpy.zeros(len(stop_x), dtype='int64')
+	first = 0
+	for i in range(len(stop_x)):
+		distances = numpy.hypot(x[first:] - stop_x[i], y[first:] - stop_y[i])
+		near = distances <= distances.min() + spacing
+		start = int(numpy.argmax(near))
+		end = start + int(numpy.argmax(~near[start:])) if not near[start:].all() else len(near)
+		first += start + int(numpy.argmin(distances[start:end]))
+		located[i] = first
+	return located
+
+# Rows of (longitude, latitude, timestamp) of the trace of a shape from its stop rows of (longitude, latitude, timestamp) and shapes.txt points of (longitude, latitude).
+# Returns the stop rows if the shape has less than two points or no stop with coordinates and arrival time.
+def trace(rows, points, spacing, tolerance):
+	stops = [(row[0], row[1], seconds(row[2])) for row in rows if row[0] is not None and row[1] is not None and seconds(row[2]) is not None]
+	if len(points) < 2 or len(stops) == 0:
+		return rows
+	points = numpy.array(points, dtype='float64')
+	stops = numpy.array(stops, dtype='float64')
+	lat0 = numpy.mean(points[:, 1])
+	(x, y) = project(points[:, 0], points[:, 1], lat0)
+	dense = densify(numpy.column_stack([x, y, points]), spacing)
+	(x, y) = (dense[:, 0], dense[:, 1])
+	along = numpy.concatenate([[0.0], numpy.cumsum(numpy.hypot(numpy.diff(x), numpy.diff(y)))])
+
+	(stop_x, stop_y) = project(stops[:, 0], stops[:, 1], lat0)
+	stop_along = along[locate(x, y, stop_x, stop_y, spacing)]
+	stop_seconds = numpy.maximum.accumulate(stops[:, 2])
+	kept = simplify(x, y, along, tolerance, spacing)
+	times = numpy.round(numpy.interp(along[kept], stop_along, stop_seconds))
+	steps = numpy.arange(len(kept))
+	times = numpy.maximum.accumulate(times - steps) + steps # At least one second between samples, the matcher drops samples closer than matcher.interval.min (1000 ms by default)
+	return [(dense[k, 2], dense[k, 3], timestamp(t)) for (k, t) in zip(kept, times)]
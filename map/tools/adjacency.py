@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import numpy
+import psycopg2
+
+# Directed road graph in CSR layout
+#
+# As in the matcher's road map, each road (row r, sorted by gid) is split into a forward edge 2r
+# from source to target and, if it is not a one-way road (reverse >= 0), a backward edge 2r + 1
+# from target to source. Edges leaving node n are edges[indptr[n]:indptr[n + 1]].
+
+CONNECTED = 0
+UTURN = 1
+GAP = 2
+DISCONNECTED = 3
+UNKNOWN = 4
+STATUS = ["connected", "uturn", "gap", "disconnected", "unknown"]
+
+
+def build(gids, sources, targets, reverses):
+    order = numpy.argsort(gids, kind="mergesort")
+    gids = numpy.asarray(gids, dtype="int64")[order]
+    (nodes, inverse) = numpy.unique(numpy.concatenate(
+        (numpy.asarray(sources)[order], numpy.asarray(targets)[order])), return_inverse=True)
+    sources = inverse[:len(gids)]
+    targets = inverse[len(gids):]
+
+    begin = numpy.column_stack((sources, targets)).ravel()
+    end = numpy.column_stack((targets, sources)).ravel()
+    valid = numpy.column_stack((numpy.ones(len(gids), dtype=bool),
+                                numpy.asarray(reverses)[order] >= 0)).ravel()
+
+    edges = numpy.nonzero(valid)[0]
+    edges = edges[numpy.argsort(begin[edges], kind="mergesort")]
+    indptr = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(
+        begin[valid], minlength=len(nodes)))))
+
+    return {"gid": gids, "nodes": nodes, "begin": begin, "end": end, "valid": valid,
+            "indptr": indptr, "edges": edges}
+
+
+def save(path, graph):
+    numpy.savez(path, **graph)
+
+
+def load(path):
+    arrays = numpy.load(path)
+    return dict((name, arrays[name]) for name in arrays.files)
+
+# Read graph from table
+
+
+def export(host, port, database, table, user, password):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor("%s_adjacency_cursor" % table)
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute("SELECT gid,source,target,reverse FROM %s;" % table)
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(100000)
+        if len(rows) == 0:
+            break
+        chunks.append(numpy.array(rows, dtype="int64"))
+
+    cursor.close()
+    dbcon.close()
+
+    if len(chunks) == 0:
+        empty = numpy.zeros(0, dtype="int64")
+        return build(empty, empty, empty, empty)
+    rows = numpy.concatenate(chunks)
+    return build(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3])
+
+# Version of table content
+#
+# Identifies the content of the table by its OID and file node, which change when the map is
+# imported again, its number of rows and maximum gid, e.g. to invalidate a saved graph.
+
+
+def version(host, port, database, table, user, password):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute("SELECT %%s::regclass::oid, pg_relation_filenode(%%s::regclass), "
+                       "count(*), max(gid) FROM %s;" % table, (table, table))
+        row = cursor.fetchone()
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    cursor.close()
+    dbcon.close()
+
+    return ":".join(str(value) for value in row)
+
+# Validate road sequences
+#
+# Sequences are given concatenated as arrays of road ids (gid), headings (True if forward) and
+# sequence ids, where the steps of a sequence are contiguous and in order. Returns the index of
+# each hop's first step and the hop's status: CONNECTED, UTURN (same road in opposite heading),
+# GAP (connected by exactly one road missing in between), DISCONNECTED or UNKNOWN (road id not in
+# graph or heading not allowed).
+
+
+def validate(graph, roads, forwards, sequences):
+    roads = numpy.asarray(roads, dtype="int64")
+    forwards = numpy.asarray(forwards, dtype=bool)
+    sequences = numpy.asarray(sequences)
+
+    hops = numpy.nonzero(sequences[1:] == sequences[:-1])[0]
+    gids = graph["gid"]
+    if len(gids) == 0:  # No roads, no hop can be validated
+        return (hops, numpy.full(len(hops), UNKNOWN, dtype="int8"))
+
+    rows = numpy.minimum(numpy.searchsorted(gids, roads), len(gids) - 1)
+    edges = 2 * rows + numpy.where(forwards, 0, 1)
+    known = (gids[rows] == roads) & graph["valid"][edges]
+
+    (prev, following) = (hops, hops + 1)
+    status = numpy.full(len(hops), DISCONNECTED, dtype="int8")
+
+    valid = known[prev] & known[following]
+    ends = graph["end"][edges[prev]]
+    begins = graph["begin"][edges[following]]
+    status[ends == begins] = CONNECTED
+    status[(rows[prev] == rows[following]) & (forwards[prev] != forwards[following])] = UTURN
+
+    # One road missing: any edge leaving the previous road's end node reaches the next road.
+    candidates = numpy.nonzero(valid & (status == DISCONNECTED))[0]
+    firsts = graph["indptr"][ends[candidates]]
+    counts = graph["indptr"][ends[candidates] + 1] - firsts
+    pairs = numpy.repeat(numpy.arange(len(candidates)), counts)
+    offsets = numpy.repeat(firsts - (numpy.cumsum(counts) - counts), counts)
+    reached = graph["end"][graph["edges"][offsets + numpy.arange(len(pairs))]]
+    status[candidates[numpy.unique(pairs[reached == begins[candidates][pairs]])]] = GAP
+
+    status[~valid] = UNKNOWN
+    return (hops, status)
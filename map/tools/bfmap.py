@@ -22,6 +22,7 @@ import numpy
 import binascii
 import osgeo.ogr as ogr
 import json
+import StringIO
 
 # Import OSM (osmosis) to route
 
@@ -29,37 +30,23 @@ import json
 def ways2bfmap(src_host, src_port, src_database, src_table, src_user, src_password,
                tgt_host, tgt_port, tgt_database, tgt_table, tgt_user, tgt_password,
                config, printonly):
+    source = PostGISSource(src_host, src_port, src_database, src_table, src_user, src_password)
+    target = PostGISTarget(tgt_host, tgt_port, tgt_database, tgt_table, tgt_user, tgt_password,
+                           printonly)
+    process(source, target, config)
 
-   # Open database onnection
-    try:
-        src_con = psycopg2.connect(
-            host=src_host, port=src_port, database=src_database, user=src_user,
-            password=src_password)
-        src_cur = src_con.cursor("%s_cursor" % src_table)
-        tgt_con = psycopg2.connect(
-            host=tgt_host, port=tgt_port, database=tgt_database, user=tgt_user,
-            password=tgt_password)
-        tgt_cur = tgt_con.cursor()
-    except Exception as e:
-        print("Connection to database failed. %s" % e)
-        exit(1)
+# Segment ways of source and write segments to target
 
-    try:
-        src_cur.execute(
-            "SELECT way_id,tags,seq,nodes,counts,geoms FROM %s;" % src_table)
-    except Exception, e:
-        print("Database transaction failed. (%s)" % e.pgerror)
-        exit(1)
+
+def process(source, target, config):
+    source.open()
+    target.open()
 
     rowcount = 0
     roadcount = 0
 
     # Process chunks
-    while True:
-        rows = src_cur.fetchmany(10000)
-        if len(rows) == 0:
-            break
-
+    for rows in source.chunks(10000):
         segments = []
 
         for row in rows:
@@ -72,27 +59,177 @@ def ways2bfmap(src_host, src_port, src_database, src_table, src_user, src_passwo
 
         rowcount += len(rows)
 
+        target.write(segments)
+        print("%s segments from %s ways inserted." % (roadcount, rowcount))
+
+    print("%s segments from %s ways inserted and finished." % (roadcount, rowcount))
+
+    target.close()
+    source.close()
+
+# Sources of ways (rows of way_id, tags, seq, nodes, counts, geoms)
+
+
+class PostGISSource(object):
+
+    def __init__(self, host, port, database, table, user, password):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.table = table
+        self.user = user
+        self.password = password
+
+    def open(self):
         try:
-            query = """INSERT INTO %s (osm_id,class_id,source,target,length,reverse,
-                maxspeed_forward,maxspeed_backward,priority,geom) VALUES %s;""" % (
-                tgt_table, ",".join("""('%s','%s','%s','%s','%s','%s', %s, %s,'%s',
-                ST_GeomFromText('%s',4326))""" % segment for segment in segments))
-            if printonly == False:
-                tgt_cur.execute(query)
-            print("%s segments from %s ways inserted." % (roadcount, rowcount))
-        except Exception, e:
+            self.con = psycopg2.connect(
+                host=self.host, port=self.port, database=self.database, user=self.user,
+                password=self.password)
+            self.cur = self.con.cursor("%s_cursor" % self.table)
+        except Exception as e:
+            print("Connection to database failed. %s" % e)
+            exit(1)
+
+    def chunks(self, size):
+        try:
+            self.cur.execute(
+                "SELECT way_id,tags,seq,nodes,counts,geoms FROM %s;" % self.table)
+        except Exception as e:
             print("Database transaction failed. (%s)" % e.pgerror)
             exit(1)
 
-    print("%s segments from %s ways inserted and finished." % (roadcount, rowcount))
+        while True:
+            rows = self.cur.fetchmany(size)
+            if len(rows) == 0:
+                break
+            yield rows
+
+    def close(self):
+        self.cur.close()
+        self.con.close()
+
+
+class FileSource(object):
+    """Reads ways from a file with one JSON object per line, e.g. written with dump, where
+    tags are in hstore format and geoms are hex encoded WKB points."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        try:
+            self.file = open(self.path)
+        except IOError as e:
+            print("Opening file failed. (%s)" % e)
+            exit(1)
+
+    def chunks(self, size):
+        rows = []
+        for line in self.file:
+            if len(line.strip()) == 0:
+                continue
+            way = json.loads(line)
+            rows.append((way["way_id"], way["tags"].encode("utf-8"), way["seq"],
+                         way["nodes"], way["counts"],
+                         [binascii.unhexlify(x) for x in way["geoms"]]))
+            if len(rows) == size:
+                yield rows
+                rows = []
+        if len(rows) > 0:
+            yield rows
+
+    def close(self):
+        self.file.close()
+
+# Write ways of source to file (see FileSource)
+
+
+def dump(source, path):
+    source.open()
+    count = 0
+    with open(path, "w") as file:
+        for rows in source.chunks(10000):
+            for row in rows:
+                file.write(json.dumps({"way_id": row[0], "tags": row[1], "seq": row[2],
+                                       "nodes": row[3], "counts": row[4],
+                                       "geoms": [binascii.hexlify(x) for x in row[5]]}))
+                file.write("\n")
+            count += len(rows)
+            print("%s ways written." % count)
+    source.close()
+    return count
+
+# Targets of segments
+#
+# Segments are written in the text format of PostgreSQL's COPY, which avoids per statement
+# overhead in the database and makes files directly loadable with psql's \copy command.
+
+COLUMNS = ("osm_id", "class_id", "source", "target", "length", "reverse",
+           "maxspeed_forward", "maxspeed_backward", "priority", "geom")
+
+
+def copyline(segment):
+    fields = [str(value) for value in segment[0:6]]
+    fields += ["\\N" if speed == "null" else str(int(round(speed))) for speed in segment[6:8]]
+    fields += [str(segment[8]), "SRID=4326;%s" % segment[9]]
+    return "\t".join(fields) + "\n"
+
+
+class PostGISTarget(object):
+
+    def __init__(self, host, port, database, table, user, password, printonly):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.table = table
+        self.user = user
+        self.password = password
+        self.printonly = printonly
+
+    def open(self):
+        try:
+            self.con = psycopg2.connect(
+                host=self.host, port=self.port, database=self.database, user=self.user,
+                password=self.password)
+            self.cur = self.con.cursor()
+        except Exception as e:
+            print("Connection to database failed. %s" % e)
+            exit(1)
+
+    def write(self, segments):
+        if self.printonly == True or len(segments) == 0:
+            return
+        try:
+            self.cur.copy_from(StringIO.StringIO("".join(copyline(x) for x in segments)),
+                               self.table, columns=COLUMNS)
+        except Exception as e:
+            print("Database transaction failed. (%s)" % e.pgerror)
+            exit(1)
+
+    def close(self):
+        self.con.commit()
+        self.cur.close()
+        self.con.close()
+
+
+class FileTarget(object):
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.mode = "a" if append else "w"
+
+    def open(self):
+        try:
+            self.file = open(self.path, self.mode)
+        except IOError as e:
+            print("Opening file failed. (%s)" % e)
+            exit(1)
 
-    tgt_con.commit()
-    src_cur.close()
-    tgt_cur.close()
+    def write(self, segments):
+        self.file.writelines(copyline(x) for x in segments)
 
-    # Close connection
-    src_con.close()
-    tgt_con.close()
+    def close(self):
+        self.file.close()
 
 
 def waysort(row):
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import getpass
+import os
+import store
+
+parser = optparse.OptionParser("bfmap2store.py [options]")
+parser.add_option("--host", dest="host", help="Hostname of the database.")
+parser.add_option("--port", dest="port", help="Port of the database.")
+parser.add_option("--database", dest="database", help="Name of the database.")
+parser.add_option("--table", dest="table", help="Name of the (bfmap) table.")
+parser.add_option("--user", dest="user", help="User of the database.")
+parser.add_option("--password", dest="password", help="User password.")
+parser.add_option("--store", dest="store", help="Directory of the columnar road store.")
+parser.add_option("--capacity", type="int", dest="capacity", default=store.CAPACITY,
+                  help="Node capacity of the spatial index. (default: %s)" % store.CAPACITY)
+
+(options, args) = parser.parse_args()
+
+if options.host == None or \
+        options.port == None or \
+        options.database == None or \
+        options.table == None or \
+        options.user == None or \
+        options.store == None:
+    parser.print_help()
+    exit(1)
+
+if options.password == None:
+    password = getpass.getpass("Password:")
+else:
+    password = options.password
+
+if os.path.exists(os.path.join(options.store, "meta.json")):
+    print("Store '%s' already exists." % options.store)
+    while True:
+        value = raw_input(
+            "Do you want to overwrite store '%s' (y/n)? [n]: " % options.store).lower()
+        if value == '' or value == 'n':
+            print("Cancelled by user.")
+            exit(0)
+        elif value == 'y':
+            break
+
+print("Export table '%s' to store '%s' ..." % (options.table, options.store))
+count = store.export(options.host, options.port, options.database, options.table,
+                     options.user, password, options.store, options.capacity)
+print("%s roads exported and indexed." % count)
+print("Done.")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import getpass
+import tiles
+import ways
+
+parser = optparse.OptionParser("bfmap2tiles.py [options]")
+parser.add_option("--host", dest="host", help="Hostname of the database.")
+parser.add_option("--port", dest="port", help="Port of the database.")
+parser.add_option("--database", dest="database", help="Name of the database.")
+parser.add_option("--table", dest="table", help="Name of the (bfmap) table.")
+parser.add_option("--user", dest="user", help="User of the database.")
+parser.add_option("--password", dest="password", help="User password.")
+parser.add_option("--zoom", type="int", dest="zoom", default=10,
+                  help="Zoom level of tiles, i.e. the table is split into a 2^zoom x 2^zoom grid. (default: 10)")
+parser.add_option("--buffer", type="float", dest="buffer", default=1000.0,
+                  help="Overlap of neighbouring tiles in meters. (default: 1000)")
+parser.add_option("--region", dest="region",
+                  help="""Instead of exporting tiles, create a view of all tiles covering the region
+                  given as bounding box 'xmin,ymin,xmax,ymax' (WGS-84).""")
+parser.add_option("--view", dest="view",
+                  help="Name of the view to be created for the region.")
+parser.add_option("--printonly", action="store_true",
+                  default=False, help="Do not execute commands, but print it.")
+
+(options, args) = parser.parse_args()
+
+if options.host == None or \
+        options.port == None or \
+        options.database == None or \
+        options.table == None or \
+        options.user == None or \
+        (options.region != None and options.view == None):
+    parser.print_help()
+    exit(1)
+
+if options.password == None:
+    password = getpass.getpass("Password:")
+else:
+    password = options.password
+
+if options.region != None:
+    try:
+        (xmin, ymin, xmax, ymax) = [float(x) for x in options.region.split(",")]
+    except ValueError:
+        parser.print_help()
+        exit(1)
+
+    print("Create view '%s' of region ..." % options.view)
+    names = tiles.region(options.host, options.port, options.database, options.table,
+                         options.view, xmin, ymin, xmax, ymax, options.user, password,
+                         options.printonly)
+    print("View '%s' covers %s tiles." % (options.view, len(names)))
+    print("Done.")
+    exit(0)
+
+if ways.exists(options.host, options.port, options.database, "%s_tiles" % options.table,
+               options.user, password):
+    print("Tiles of table '%s' already exist in database '%s'." %
+          (options.table, options.database))
+    while True:
+        value = raw_input(
+            "Do you want to remove tiles of table '%s' (y/n)? [n]: " % options.table).lower()
+        if value == '' or value == 'n':
+            print("Cancelled by user.")
+            exit(0)
+        elif value == 'y':
+            break
+    tiles.remove(options.host, options.port, options.database,
+                 options.table, options.user, password, options.printonly)
+    print("Tiles of table '%s' have been removed." % options.table)
+
+print("Create tile index '%s_tiles' ..." % options.table)
+tiles.schema(options.host, options.port, options.database,
+             options.table, options.user, password, options.printonly)
+print("Done.")
+
+print("Export tiles (zoom %s, buffer %s meters) ..." % (options.zoom, options.buffer))
+tiles.export(options.host, options.port, options.database, options.table,
+             options.user, password, options.zoom, options.buffer, options.printonly)
+print("Finished.")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import numpy
+import psycopg2
+
+# Quality indicators of map-matched routes
+#
+# Routes and GTFS points are given as projected coordinates (meters) in arrays, where rows of the
+# same shape are contiguous and shapes are numbered by their index in the sorted shape ids. Route
+# vertices additionally have a part id, consecutive vertices of the same part form a segment.
+# Points without coordinates (NaN) have no distance, as NULL distances in PostGIS.
+
+BLOCK = 1 << 22
+COLUMNS = ["total", "close", "mid", "far", "mid_rate", "far_rate", "avg_distance", "max_distance"]
+
+# Segments of route vertices as arrays of start and end coordinates and shape. Parts with a single
+# vertex are segments of zero length.
+
+
+def segments(xs, ys, parts, shapes):
+    (xs, ys) = (numpy.asarray(xs, dtype="float64"), numpy.asarray(ys, dtype="float64"))
+    (parts, shapes) = (numpy.asarray(parts), numpy.asarray(shapes, dtype="int64"))
+    if len(xs) == 0:
+        empty = numpy.zeros(0, dtype="float64")
+        return (empty, empty, empty, empty, numpy.zeros(0, dtype="int64"))
+    joined = parts[1:] == parts[:-1]
+    single = numpy.ones(len(xs), dtype=bool)
+    single[1:] &= ~joined
+    single[:-1] &= ~joined
+    starts = numpy.sort(numpy.concatenate((numpy.nonzero(joined)[0], numpy.nonzero(single)[0])))
+    ends = numpy.where(single[starts], starts, starts + 1)
+    return (xs[starts], ys[starts], xs[ends], ys[ends], shapes[starts])
+
+# Distance of each point to the nearest segment of its shape, NaN if the shape has no segments.
+# Distances are computed shape by shape, in blocks of points of at most BLOCK point-segment pairs.
+
+
+def distances(route, xs, ys, shapes, block=BLOCK):
+    (x0, y0, x1, y1, segment_shapes) = route
+    (xs, ys) = (numpy.asarray(xs, dtype="float64"), numpy.asarray(ys, dtype="float64"))
+    shapes = numpy.asarray(shapes, dtype="int64")
+    result = numpy.full(len(xs), numpy.nan)
+    if len(xs) == 0 or len(segment_shapes) == 0:
+        return result
+
+    n = max(shapes.max(), segment_shapes.max()) + 1
+    points = numpy.searchsorted(shapes, numpy.arange(n + 1))
+    lines = numpy.searchsorted(segment_shapes, numpy.arange(n + 1))
+    (dx, dy) = (x1 - x0, y1 - y0)
+    lengths = dx * dx + dy * dy
+    lengths[lengths == 0] = 1.0  # Zero length segments, projection of any point is the start
+
+    for shape in numpy.nonzero((numpy.diff(points) > 0) & (numpy.diff(lines) > 0))[0]:
+        lines_of_shape = slice(lines[shape], lines[shape + 1])
+        rows = max(block // (lines[shape + 1] - lines[shape]), 1)
+        for first in range(points[shape], points[shape + 1], rows):
+            block_of_points = slice(first, min(first + rows, points[shape + 1]))
+            (px, py) = (xs[block_of_points, None], ys[block_of_points, None])
+            (sx, sy) = (x0[lines_of_shape], y0[lines_of_shape])
+            (sdx, sdy) = (dx[lines_of_shape], dy[lines_of_shape])
+            fractions = numpy.clip(((px - sx) * sdx + (py - sy) * sdy) / lengths[lines_of_shape],
+                                   0.0, 1.0)
+            result[block_of_points] = numpy.hypot(px - sx - fractions * sdx,
+                                                  py - sy - fractions * sdy).min(axis=1)
+    return result
+
+# Indicators of n shapes from distances of points and their shapes, as a dict of arrays with keys
+# COLUMNS. Points are close if less than close meters away, far if at least mid meters away and mid
+# otherwise. Average and maximum distance of shapes without any distance are NaN.
+
+
+def indicators(values, shapes, n, close, mid):
+    (values, shapes) = (numpy.asarray(values, dtype="float64"), numpy.asarray(shapes, dtype="int64"))
+    valid = ~numpy.isnan(values)
+    (values, measured) = (values[valid], shapes[valid])
+
+    total = numpy.bincount(shapes, minlength=n)
+    counts = numpy.bincount(measured, minlength=n)
+    closes = numpy.bincount(measured[values < close], minlength=n)
+    fars = numpy.bincount(measured[values >= mid], minlength=n)
+    mids = numpy.bincount(measured[(values >= close) & (values < mid)], minlength=n)
+    maxima = numpy.full(n, -numpy.inf)
+    numpy.maximum.at(maxima, measured, values)
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return {"total": total, "close": closes, "mid": mids, "far": fars,
+                "mid_rate": mids / total.astype("float64"),
+                "far_rate": fars / total.astype("float64"),
+                "avg_distance": numpy.bincount(measured, weights=values, minlength=n) / counts,
+                "max_distance": numpy.where(counts > 0, maxima, numpy.nan)}
+
+
+def save(path, data):
+    numpy.savez(path, **data)
+
+
+def load(path):
+    arrays = numpy.load(path)
+    return dict((name, arrays[name]) for name in arrays.files)
+
+# Read projected route vertices, shape points and stops from tables
+#
+# Routes are read from a table of shape_id and projected (multi)line geometry geom, points and stops
+# from queries that select shape_id, x and y ordered by shape_id. Returns a dict of arrays with
+# the sorted shape ids and the coordinates, parts and shape numbers of vertices, points and stops.
+
+
+def export(host, port, database, user, password, routes, points, stops):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    queries = {
+        "route": "SELECT r.shape_id, ST_X(d.geom), ST_Y(d.geom), (d.path)[1] "
+                 "FROM %s r, ST_DumpPoints(ST_Multi(r.geom)) d "
+                 "ORDER BY r.shape_id, d.path;" % routes,
+        "point": points,
+        "stop": stops}
+    rows = {}
+    for (name, query) in queries.items():
+        cursor = dbcon.cursor("indicators_%s_cursor" % name)
+        try:
+            cursor.execute(query)
+        except Exception as e:
+            print("Database transaction failed. (%s)" % e.pgerror)
+            exit(1)
+        chunks = []
+        while True:
+            chunk = cursor.fetchmany(100000)
+            if len(chunk) == 0:
+                break
+            chunks.extend(chunk)
+        rows[name] = chunks
+        cursor.close()
+    dbcon.close()
+
+    shape_ids = numpy.array(sorted(set(r[0] for name in rows for r in rows[name])), dtype="S")
+    data = {"shape_id": shape_ids}
+    for (name, chunk) in rows.items():
+        shapes = numpy.searchsorted(shape_ids, numpy.array([r[0] for r in chunk], dtype="S"))
+        # The database may collate shape ids differently, rows keep their order within a shape.
+        order = numpy.argsort(shapes, kind="mergesort")
+        data["%s_shape" % name] = shapes[order].astype("int64")
+        data["%s_x" % name] = numpy.array([r[1] for r in chunk], dtype="float64")[order]
+        data["%s_y" % name] = numpy.array([r[2] for r in chunk], dtype="float64")[order]
+        if name == "route":
+            # Parts are numbered per shape, parts of different shapes must have different ids.
+            parts = numpy.array([r[3] for r in chunk], dtype="int64")[order]
+            data["route_part"] = data["route_shape"] * (parts.max() + 1 if len(parts) else 0) + parts
+    return data
+
+# Indicators of routes (shapes.txt points) and stops for all shapes of exported data
+
+
+def evaluate(data, close, mid, block=BLOCK):
+    route = segments(data["route_x"], data["route_y"], data["route_part"], data["route_shape"])
+    n = len(data["shape_id"])
+    result = {}
+    for name in ["point", "stop"]:
+        values = distances(route, data["%s_x" % name], data["%s_y" % name],
+                           data["%s_shape" % name], block)
+        result[name] = indicators(values, data["%s_shape" % name], n, close, mid)
+    return result
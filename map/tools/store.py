@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import os
+import json
+import struct
+import numpy
+import psycopg2
+
+# Columnar road store: a directory of numpy arrays (one file per column) that is opened memory
+# mapped, i.e. processes opening the same store share its pages without copying. Geometries are
+# stored in CSR layout: vertices of road i are vertices[offsets[i]:offsets[i + 1]]. A packed
+# STR-tree over the road bounding boxes supports nearest and radius queries for batches of points.
+
+VERSION = 1
+COLUMNS = [("gid", "int64"), ("osm_id", "int64"), ("class_id", "int16"),
+           ("source", "int64"), ("target", "int64"), ("reverse", "float32"),
+           ("maxspeed_forward", "int16"), ("maxspeed_backward", "int16"),
+           ("priority", "float32")]
+CAPACITY = 16
+EARTH_RADIUS = 6371000.0
+METERS_PER_DEGREE = EARTH_RADIUS * numpy.pi / 180.0
+
+# Parse WKB linestring into vertex array
+
+
+def linestring(wkb):
+    endian = "<" if struct.unpack_from("B", wkb, 0)[0] == 1 else ">"
+    (wkbtype, count) = struct.unpack_from(endian + "II", wkb, 1)
+    if wkbtype != 2:
+        raise ValueError("WKB geometry type %s is not a 2D linestring." % wkbtype)
+    return numpy.frombuffer(wkb, dtype=endian + "f8", count=2 * count, offset=9).reshape(-1, 2)
+
+# Bounding boxes of CSR geometries
+
+
+def boxes(offsets, vertices):
+    starts = offsets[:-1]
+    return numpy.column_stack((numpy.minimum.reduceat(vertices[:, 0], starts),
+                               numpy.minimum.reduceat(vertices[:, 1], starts),
+                               numpy.maximum.reduceat(vertices[:, 0], starts),
+                               numpy.maximum.reduceat(vertices[:, 1], starts)))
+
+# Sort-Tile-Recursive packing of bounding boxes
+#
+# Returns the permutation of items in leaf order and the bounding boxes of all tree levels
+# (leaves first), where node j of a level spans nodes [j * capacity, (j + 1) * capacity) of the
+# level below.
+
+
+def pack(bboxes, capacity=CAPACITY):
+    count = len(bboxes)
+    centers = (bboxes[:, 0:2] + bboxes[:, 2:4]) / 2.0
+    slabs = int(numpy.ceil(numpy.sqrt(numpy.ceil(count / float(capacity)))))
+    slab = max(slabs * capacity, 1)
+
+    order = numpy.argsort(centers[:, 0], kind="mergesort")
+    order = order[numpy.lexsort((centers[order, 1], numpy.arange(count) // slab))]
+
+    levels = [bboxes[order]]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        starts = numpy.arange(0, len(below), capacity)
+        levels.append(numpy.column_stack((numpy.minimum.reduceat(below[:, 0], starts),
+                                          numpy.minimum.reduceat(below[:, 1], starts),
+                                          numpy.maximum.reduceat(below[:, 2], starts),
+                                          numpy.maximum.reduceat(below[:, 3], starts))))
+    return (order, levels)
+
+# Write store to directory
+
+
+def write(path, columns, offsets, vertices, capacity=CAPACITY):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    for (name, dtype) in COLUMNS:
+        numpy.save(os.path.join(path, "%s.npy" % name),
+                   numpy.asarray(columns[name], dtype=dtype))
+    numpy.save(os.path.join(path, "offsets.npy"), numpy.asarray(offsets, dtype="int64"))
+    numpy.save(os.path.join(path, "vertices.npy"), numpy.asarray(vertices, dtype="float64"))
+
+    if len(offsets) > 1:
+        (order, levels) = pack(boxes(offsets, vertices), capacity)
+    else:
+        (order, levels) = (numpy.zeros(0, dtype="int64"), [numpy.zeros((0, 4))])
+    numpy.save(os.path.join(path, "order.npy"), order.astype("int64"))
+    numpy.save(os.path.join(path, "nodes.npy"), numpy.concatenate(levels).astype("float64"))
+
+    meta = {"version": VERSION, "count": len(offsets) - 1, "capacity": capacity,
+            "levels": [len(level) for level in levels],
+            "columns": [name for (name, dtype) in COLUMNS]}
+    with open(os.path.join(path, "meta.json"), "w") as metafile:
+        json.dump(meta, metafile)
+
+# Export table data to store
+
+
+def export(host, port, database, table, user, password, path, capacity=CAPACITY):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor("%s_store_cursor" % table)
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute(
+            """SELECT gid,osm_id,class_id,source,target,reverse,maxspeed_forward,
+            maxspeed_backward,priority,ST_AsBinary(geom) FROM %s ORDER BY gid;""" % table)
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    columns = dict((name, []) for (name, dtype) in COLUMNS)
+    geometries = []
+    offsets = [0]
+
+    while True:
+        rows = cursor.fetchmany(10000)
+        if len(rows) == 0:
+            break
+
+        for row in rows:
+            for (i, (name, dtype)) in enumerate(COLUMNS):
+                columns[name].append(-1 if row[i] is None else row[i])
+            geometry = linestring(row[9])
+            geometries.append(geometry)
+            offsets.append(offsets[-1] + len(geometry))
+
+        print("%s roads exported." % (len(offsets) - 1))
+
+    cursor.close()
+    dbcon.close()
+
+    if len(geometries) > 0:
+        vertices = numpy.concatenate(geometries)
+    else:
+        vertices = numpy.zeros((0, 2))
+    write(path, columns, offsets, vertices, capacity)
+
+    return len(offsets) - 1
+
+# Memory mapped road store with spatial queries
+
+
+class Store(object):
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as metafile:
+            meta = json.load(metafile)
+        if meta["version"] != VERSION:
+            raise ValueError("Store version %s is not supported." % meta["version"])
+
+        def load(name):
+            return numpy.load(os.path.join(path, "%s.npy" % name), mmap_mode="r")
+
+        self.count = meta["count"]
+        self.capacity = meta["capacity"]
+        self.columns = dict((name, load(name)) for name in meta["columns"])
+        self.offsets = load("offsets")
+        self.vertices = load("vertices")
+        self.order = load("order")
+        self.nodes = load("nodes")
+        self.levels = numpy.concatenate(([0], numpy.cumsum(meta["levels"])))
+
+    def __len__(self):
+        return self.count
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def geometry(self, i):
+        return self.vertices[self.offsets[i]:self.offsets[i + 1]]
+
+    def find(self, gids):
+        gids = numpy.asarray(gids)
+        if self.count == 0:
+            return numpy.full(gids.shape, -1, dtype="int64")
+        positions = numpy.searchsorted(self.columns["gid"], gids)
+        positions = numpy.minimum(positions, self.count - 1)
+        return numpy.where(self.columns["gid"][positions] == gids, positions, -1)
+
+    def distance(self, lons, lats, points, items):
+        # Distances of points to road geometries in meters, for pairs of point and road
+        # indices, using an equirectangular projection centered at the respective point.
+        starts = self.offsets[items]
+        ends = self.offsets[items + 1] - 1
+        counts = numpy.maximum(ends - starts, 1)
+        firsts = numpy.cumsum(counts) - counts
+
+        pairs = numpy.repeat(numpy.arange(len(items)), counts)
+        segments = numpy.repeat(starts - firsts, counts) + numpy.arange(len(pairs))
+        nexts = numpy.minimum(segments + 1, numpy.repeat(ends, counts))
+
+        x = lons[points][pairs]
+        y = lats[points][pairs]
+        scale = numpy.cos(numpy.radians(y))
+        ax = (self.vertices[segments, 0] - x) * scale
+        ay = self.vertices[segments, 1] - y
+        dx = (self.vertices[nexts, 0] - x) * scale - ax
+        dy = self.vertices[nexts, 1] - y - ay
+
+        length = dx * dx + dy * dy
+        t = numpy.clip(-(ax * dx + ay * dy) / numpy.where(length > 0, length, 1.0), 0.0, 1.0)
+        d = numpy.hypot(ax + t * dx, ay + t * dy) * METERS_PER_DEGREE
+
+        return numpy.minimum.reduceat(d, firsts) if len(d) > 0 else d
+
+    def radius(self, lons, lats, radius):
+        """Returns (points, items, distances) of all roads within radius meters of the points,
+        where points are indices of the query points and items are row indices of roads."""
+        lons = numpy.asarray(lons, dtype="float64").ravel()
+        lats = numpy.asarray(lats, dtype="float64").ravel()
+        empty = numpy.zeros(0, dtype="int64")
+        if self.count == 0 or len(lons) == 0:
+            return (empty, empty, numpy.zeros(0))
+
+        top = len(self.levels) - 2
+        points = numpy.arange(len(lons))
+        nodes = numpy.repeat(numpy.arange(self.levels[top + 1] - self.levels[top]), len(lons))
+        points = numpy.tile(points, self.levels[top + 1] - self.levels[top])
+
+        for level in range(top, -1, -1):
+            bbox = self.nodes[self.levels[level] + nodes]
+            x = lons[points]
+            y = lats[points]
+            dx = numpy.maximum(numpy.maximum(bbox[:, 0] - x, x - bbox[:, 2]), 0.0)
+            dy = numpy.maximum(numpy.maximum(bbox[:, 1] - y, y - bbox[:, 3]), 0.0)
+            d = numpy.hypot(dx * numpy.cos(numpy.radians(y)), dy) * METERS_PER_DEGREE
+            keep = d <= radius
+            (points, nodes) = (points[keep], nodes[keep])
+
+            if level > 0:
+                size = self.levels[level] - self.levels[level - 1]
+                firsts = nodes * self.capacity
+                counts = numpy.minimum(self.capacity, size - firsts)
+                points = numpy.repeat(points, counts)
+                nodes = numpy.repeat(firsts - (numpy.cumsum(counts) - counts), counts) + \
+                    numpy.arange(len(points))
+
+        items = self.order[nodes]
+        d = self.distance(lons, lats, points, items)
+        keep = d <= radius
+        return (points[keep], items[keep], d[keep])
+
+    def nearest(self, lons, lats, k=1, radius=100.0, limit=10000.0):
+        """Returns (items, distances) arrays of shape (points, k) with the k nearest roads of
+        each point within limit meters, padded with -1 and infinity. The search radius starts
+        at radius meters and is doubled for points with less than k results."""
+        lons = numpy.asarray(lons, dtype="float64").ravel()
+        lats = numpy.asarray(lats, dtype="float64").ravel()
+        items = numpy.full((len(lons), k), -1, dtype="int64")
+        distances = numpy.full((len(lons), k), numpy.inf)
+        pending = numpy.arange(len(lons))
+
+        while len(pending) > 0:
+            radius = min(radius, limit)
+            (points, found, d) = self.radius(lons[pending], lats[pending], radius)
+            order = numpy.lexsort((d, points))
+            (points, found, d) = (points[order], found[order], d[order])
+
+            counts = numpy.bincount(points, minlength=len(pending))
+            ranks = numpy.arange(len(points)) - (numpy.cumsum(counts) - counts)[points]
+            selected = ranks < k
+            items[pending[points[selected]], ranks[selected]] = found[selected]
+            distances[pending[points[selected]], ranks[selected]] = d[selected]
+
+            if radius >= limit:
+                break
+            pending = pending[counts < k]
+            radius *= 2.0
+
+        return (items, distances)
@@ -36,4 +36,4 @@ sudo -u postgres psql -q -c "GRANT ALL ON DATABASE ${database} TO ${user};"
 echo "Run bfmap test ..."
 sudo -u postgres psql -q -d ${database} -f /mnt/map/tools/test/${bfmap_table}
 sudo -u postgres psql -q -d ${database} -c "GRANT ALL ON TABLE temp_ways TO ${user};"
-python -m unittest test_bfmap
+python -m unittest test_bfmap test_tiles test_store test_adjacency test_indicators
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import unittest
+import adjacency
+
+
+class TestAdjacency(unittest.TestCase):
+
+    def setUp(self):
+        # Roads (gid: source -> target): 10: 100 -> 101, 11: 101 -> 102 (one-way),
+        # 12: 102 -> 103, 13: 104 -> 105
+        self.graph = adjacency.build([12, 10, 13, 11], [102, 100, 104, 101],
+                                     [103, 101, 105, 102], [1, 1, 1, -1])
+
+    def test_build(self):
+        self.assertEquals([10, 11, 12, 13], list(self.graph["gid"]))
+        self.assertEquals(6, len(self.graph["nodes"]))
+        self.assertEquals(7, len(self.graph["edges"]))
+        self.assertEquals([True, True, True, False, True, True, True, True],
+                          list(self.graph["valid"]))
+
+        # Node 101 (index 1) has edges to 100 (backward of 10) and to 102 (forward of 11).
+        edges = self.graph["edges"][self.graph["indptr"][1]:self.graph["indptr"][2]]
+        self.assertEquals([1, 2], sorted(edges))
+
+    def test_validate(self):
+        roads = [10, 11, 12, 12, 10, 12, 13, 10, 99, 11]
+        forwards = [True, True, True, False, True, True, True, True, True, False]
+        sequences = [1, 1, 1, 1, 2, 2, 2, 3, 3, 4]
+
+        (hops, status) = adjacency.validate(self.graph, roads, forwards, sequences)
+
+        self.assertEquals([0, 1, 2, 4, 5, 7], list(hops))
+        self.assertEquals([adjacency.CONNECTED, adjacency.CONNECTED, adjacency.UTURN,
+                           adjacency.GAP, adjacency.DISCONNECTED, adjacency.UNKNOWN],
+                          list(status))
+
+    def test_validate_empty(self):
+        graph = adjacency.build([], [], [], [])
+
+        (hops, status) = adjacency.validate(graph, [10, 11, 12], [True, True, False], [1, 1, 2])
+        self.assertEquals([0], list(hops))
+        self.assertEquals([adjacency.UNKNOWN], list(status))
+
+        (hops, status) = adjacency.validate(graph, [], [], [])
+        self.assertEquals([], list(hops))
+        self.assertEquals([], list(status))
+
+        (hops, status) = adjacency.validate(self.graph, [], [], [])
+        self.assertEquals([], list(status))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,8 @@ __license__ = "Apache-2.0"
 
 import unittest
 import binascii
+import os
+import tempfile
 import bfmap
 
 
@@ -126,6 +128,32 @@ class TestBfmap(unittest.TestCase):
         self.assertEquals("null", fwd)
         self.assertEquals("null", bwd)
 
+    def test_files(self):
+        config = bfmap.config("/mnt/map/tools/test/test-types.json")
+        (handle, path) = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            source = bfmap.FileSource("/mnt/map/tools/test/test_ways.json")
+            bfmap.process(source, bfmap.FileTarget(path), config)
+
+            expected = []
+            source.open()
+            for rows in source.chunks(10):
+                for row in rows:
+                    expected += bfmap.segment(config, row)
+            source.close()
+
+            lines = open(path).readlines()
+            self.assertEquals(len(expected), len(lines))
+            self.assertGreater(len(lines), 0)
+            for (segment, line) in zip(expected, lines):
+                fields = line.rstrip("\n").split("\t")
+                self.assertEquals(len(bfmap.COLUMNS), len(fields))
+                self.assertEquals(str(segment[0]), fields[0])
+                self.assertEquals("SRID=4326;%s" % segment[9], fields[9])
+        finally:
+            os.remove(path)
+
     def test_ways2bfmap(self):
         properties = dict(line.strip().split('=')
                           for line in open('/mnt/map/tools/test/test.properties'))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import math
+import unittest
+import numpy
+import indicators
+
+
+class TestIndicators(unittest.TestCase):
+
+    def setUp(self):
+        # Shape 0: L-shaped line (0 0) - (100 0) - (100 100) and a second part (200 0) - (200 50),
+        # shape 1: single vertex (0 0), shape 2: no route.
+        self.route = indicators.segments([0, 100, 100, 200, 200, 0], [0, 0, 100, 0, 50, 0],
+                                         [0, 0, 0, 1, 1, 2], [0, 0, 0, 0, 0, 1])
+
+    def test_segments(self):
+        (x0, y0, x1, y1, shapes) = self.route
+        self.assertEquals([0, 100, 200, 0], list(x0))
+        self.assertEquals([100, 100, 200, 0], list(x1))
+        self.assertEquals([0, 0, 0, 0], list(y0))
+        self.assertEquals([0, 100, 50, 0], list(y1))
+        self.assertEquals([0, 0, 0, 1], list(shapes))
+
+    def test_distances(self):
+        xs = [50, 110, -30, 200, 150, 3, float("nan"), 7]
+        ys = [5, 50, -40, 60, 0, 4, 0, 0]
+        shapes = [0, 0, 0, 0, 0, 1, 1, 2]
+
+        for block in [1, 2, indicators.BLOCK]:
+            values = indicators.distances(self.route, xs, ys, shapes, block)
+            self.assertEquals([5, 10, 50, 10, 50, 5], list(values[:6]))
+            self.assertTrue(math.isnan(values[6]))
+            self.assertTrue(math.isnan(values[7]))
+
+    def test_indicators(self):
+        values = [1, 4, 5, 12, float("nan"), 3, 20]
+        shapes = [0, 0, 0, 0, 0, 2, 2]
+
+        result = indicators.indicators(values, shapes, 3, 4, 10)
+
+        self.assertEquals([5, 0, 2], list(result["total"]))
+        self.assertEquals([1, 0, 1], list(result["close"]))
+        self.assertEquals([2, 0, 0], list(result["mid"]))
+        self.assertEquals([1, 0, 1], list(result["far"]))
+        self.assertAlmostEquals(0.4, result["mid_rate"][0])
+        self.assertAlmostEquals(0.5, result["far_rate"][2])
+        self.assertAlmostEquals(5.5, result["avg_distance"][0])
+        self.assertEquals([12, 20], list(result["max_distance"][[0, 2]]))
+        self.assertTrue(numpy.isnan(result["avg_distance"][1]))
+        self.assertTrue(numpy.isnan(result["max_distance"][1]))
+
+    def test_evaluate(self):
+        data = {"shape_id": numpy.array(["a", "b"]),
+                "route_x": numpy.array([0.0, 100.0]), "route_y": numpy.array([0.0, 0.0]),
+                "route_part": numpy.array([0, 0]), "route_shape": numpy.array([0, 0]),
+                "point_x": numpy.array([10.0, 20.0]), "point_y": numpy.array([3.0, 30.0]),
+                "point_shape": numpy.array([0, 0]),
+                "stop_x": numpy.array([50.0]), "stop_y": numpy.array([float("nan")]),
+                "stop_shape": numpy.array([0])}
+
+        result = indicators.evaluate(data, 4, 10)
+
+        self.assertEquals([1, 0], list(result["point"]["close"]))
+        self.assertEquals([1, 0], list(result["point"]["far"]))
+        self.assertEquals([1, 0], list(result["stop"]["total"]))
+        self.assertEquals([0, 0], list(result["stop"]["close"]))
+
+if __name__ == '__main__':
+    unittest.main()
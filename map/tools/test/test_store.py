@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import unittest
+import binascii
+import shutil
+import tempfile
+import numpy
+import store
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(42)
+        geometries = []
+        offsets = [0]
+        for i in range(1000):
+            start = numpy.array([11.5, 48.1]) + random.rand(2) * 0.1
+            geometry = start + numpy.cumsum(random.randn(random.randint(2, 6), 2) * 0.001, axis=0)
+            geometries.append(geometry)
+            offsets.append(offsets[-1] + len(geometry))
+
+        columns = dict((name, numpy.zeros(1000)) for (name, dtype) in store.COLUMNS)
+        columns["gid"] = numpy.arange(1, 2001, 2)
+        self.path = tempfile.mkdtemp()
+        store.write(self.path, columns, offsets, numpy.concatenate(geometries), 8)
+        self.store = store.Store(self.path)
+
+        self.lons = 11.5 + random.rand(50) * 0.1
+        self.lats = 48.1 + random.rand(50) * 0.1
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def distances(self):
+        points = numpy.repeat(numpy.arange(50), 1000)
+        items = numpy.tile(numpy.arange(1000), 50)
+        return self.store.distance(self.lons, self.lats, points, items).reshape(50, 1000)
+
+    def test_linestring(self):
+        wkb = binascii.unhexlify(
+            "010200000002000000831f306a523127404908a062e6144840"
+            "48567e198c31274092bd9470d7144840")
+        vertices = store.linestring(wkb)
+        self.assertEquals((2, 2), vertices.shape)
+        self.assertAlmostEquals(11.596332, vertices[0][0], places=6)
+        self.assertAlmostEquals(48.162825, vertices[1][1], places=6)
+
+    def test_pack(self):
+        self.assertEquals(1000, len(self.store))
+        self.assertEquals(1000, len(numpy.unique(self.store.order)))
+        self.assertEquals(1, self.store.levels[-1] - self.store.levels[-2])
+        self.assertEquals([0, 1, 999, -1], list(self.store.find([1, 3, 1999, 2])))
+
+    def test_radius(self):
+        expected = self.distances()
+        (points, items, distances) = self.store.radius(self.lons, self.lats, 100.0)
+
+        self.assertEquals(set(zip(*numpy.nonzero(expected <= 100.0))),
+                          set(zip(points, items)))
+        self.assertTrue(numpy.allclose(expected[points, items], distances))
+
+    def test_nearest(self):
+        expected = self.distances()
+        (items, distances) = self.store.nearest(self.lons, self.lats, k=3, radius=10.0)
+
+        self.assertTrue(numpy.allclose(numpy.sort(expected, axis=1)[:, 0:3], distances))
+        self.assertTrue(numpy.allclose(expected[numpy.arange(50)[:, None], items], distances))
+
+        (items, distances) = self.store.nearest(self.lons, self.lats, k=1, limit=0.001)
+        self.assertTrue((items[distances > 0.001] == -1).all())
+
+if __name__ == '__main__':
+    unittest.main()
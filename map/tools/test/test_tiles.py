@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import unittest
+import tiles
+
+
+class TestTiles(unittest.TestCase):
+
+    def test_tile(self):
+        (x, y) = tiles.tile(11.564, 48.139, 10)
+        self.assertEquals(544, x)
+        self.assertEquals(355, y)
+
+        (xmin, ymin, xmax, ymax) = tiles.bounds(x, y, 10)
+        self.assertTrue(xmin <= 11.564 < xmax)
+        self.assertTrue(ymin <= 48.139 < ymax)
+
+    def test_quadkey(self):
+        self.assertEquals("", tiles.quadkey(0, 0, 0))
+        self.assertEquals("213", tiles.quadkey(3, 5, 3))
+        self.assertEquals(10, len(tiles.quadkey(544, 355, 10)))
+
+    def test_envelope(self):
+        (xmin, ymin, xmax, ymax) = tiles.bounds(544, 355, 10)
+        (bxmin, bymin, bxmax, bymax) = tiles.envelope(544, 355, 10, 1000.0)
+
+        self.assertAlmostEquals(1000.0 / 111320.0, ymin - bymin)
+        self.assertAlmostEquals(1000.0 / 111320.0, bymax - ymax)
+        self.assertGreater(xmin - bxmin, ymin - bymin)
+        self.assertAlmostEquals(xmin - bxmin, bxmax - xmax)
+
+        self.assertEquals((xmin, ymin, xmax, ymax), tiles.envelope(544, 355, 10, 0.0))
+
+    def test_tiles(self):
+        (xmin, ymin, xmax, ymax) = tiles.bounds(544, 355, 10)
+        self.assertEquals([(544, 355)], tiles.tiles(
+            xmin + 0.001, ymin + 0.001, xmax - 0.001, ymax - 0.001, 10))
+
+        covered = tiles.tiles(11.0, 47.5, 12.5, 48.5, 10)
+        (x0, y0) = tiles.tile(11.0, 48.5, 10)
+        (x1, y1) = tiles.tile(12.5, 47.5, 10)
+        self.assertEquals((x1 - x0 + 1) * (y1 - y0 + 1), len(covered))
+        self.assertTrue(tiles.tile(11.564, 48.139, 10) in covered)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import math
+import psycopg2
+
+# Tile arithmetic (Web Mercator tiling scheme, tiles addressed by quadkey)
+
+MAX_LATITUDE = 85.0511287798
+METERS_PER_DEGREE = 111320.0
+PROGRESS = 100  # Number of candidate tiles per progress line
+
+
+def tile(lon, lat, zoom):
+    n = 2 ** zoom
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    rad = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n)
+    return (min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+def bounds(x, y, zoom):
+    n = 2 ** zoom
+
+    def latitude(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / n))))
+
+    return (x * 360.0 / n - 180.0, latitude(y + 1), (x + 1) * 360.0 / n - 180.0, latitude(y))
+
+
+def quadkey(x, y, zoom):
+    key = ""
+    for i in range(zoom, 0, -1):
+        digit = 0
+        mask = 1 << (i - 1)
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        key += str(digit)
+    return key
+
+
+def envelope(x, y, zoom, buffer):
+    (xmin, ymin, xmax, ymax) = bounds(x, y, zoom)
+    # Longitudinal degrees shrink towards the poles, so the buffer is converted at the tile's
+    # latitude most distant from the equator to cover at least 'buffer' meters everywhere.
+    lat = min(max(abs(ymin), abs(ymax)), MAX_LATITUDE)
+    dlat = buffer / METERS_PER_DEGREE
+    dlon = buffer / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    return (xmin - dlon, ymin - dlat, xmax + dlon, ymax + dlat)
+
+
+def tiles(xmin, ymin, xmax, ymax, zoom):
+    (x0, y0) = tile(xmin, ymax, zoom)
+    (x1, y1) = tile(xmax, ymin, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+# Extent of table data
+
+
+def extent(host, port, database, table, user, password):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute(
+            """SELECT ST_XMin(e),ST_YMin(e),ST_XMax(e),ST_YMax(e)
+            FROM (SELECT ST_Extent(geom) AS e FROM %s) AS extent;""" % table)
+        result = cursor.fetchone()
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    cursor.close()
+    dbcon.close()
+
+    if result[0] is None:
+        return None
+    return result
+
+# Create tile index table
+
+
+def schema(host, port, database, table, user, password, printonly):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        query = """CREATE TABLE %s_tiles(quadkey varchar PRIMARY KEY,
+            zoom integer NOT NULL,
+            x integer NOT NULL,
+            y integer NOT NULL,
+            buffer double precision NOT NULL,
+            tablename varchar NOT NULL,
+            count bigint NOT NULL);
+            SELECT AddGeometryColumn('%s_tiles','geom',4326,'POLYGON',2);
+            CREATE INDEX idx_%s_tiles_geom ON %s_tiles USING gist(geom);""" % (
+            table, table, table, table)
+        if printonly == True:
+            print(query)
+        else:
+            cursor.execute(query)
+            dbcon.commit()
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    cursor.close()
+    dbcon.close()
+
+# Clear tile tables and tile index
+
+
+def remove(host, port, database, table, user, password, printonly):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute("SELECT tablename FROM %s_tiles;" % table)
+        tables = [row[0] for row in cursor.fetchall()]
+        query = "".join("DROP TABLE IF EXISTS %s;" % name for name in tables)
+        query += "DROP TABLE %s_tiles;" % table
+        if printonly == True:
+            print(query)
+        else:
+            cursor.execute(query)
+            dbcon.commit()
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    cursor.close()
+    dbcon.close()
+
+# Partition table into tiles
+
+
+def export(host, port, database, table, user, password, zoom, buffer, printonly):
+    box = extent(host, port, database, table, user, password)
+    if box is None:
+        print("Table '%s' is empty." % table)
+        return 0
+
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    candidates = tiles(box[0], box[1], box[2], box[3], zoom)
+    count = 0
+
+    for (i, (x, y)) in enumerate(candidates, 1):
+        key = quadkey(x, y, zoom)
+        name = "%s_%s" % (table, key)
+        env = "ST_MakeEnvelope(%s,%s,%s,%s,4326)" % envelope(x, y, zoom, buffer)
+
+        # Rows are stored ordered by gid, which keeps reading of a tile a sequential scan and
+        # makes merging of neighbouring tiles cheap.
+        try:
+            query = """CREATE TABLE %s AS SELECT * FROM %s
+                WHERE ST_Intersects(geom, %s) ORDER BY gid;""" % (name, table, env)
+            if printonly == True:
+                print(query)
+                continue
+            cursor.execute(query)
+            rows = cursor.rowcount
+            if rows < 1:
+                cursor.execute("DROP TABLE %s;" % name)
+            else:
+                cursor.execute(
+                    """INSERT INTO %s_tiles (quadkey,zoom,x,y,buffer,tablename,count,geom)
+                    VALUES ('%s',%s,%s,%s,%s,'%s',%s,%s);""" % (
+                        table, key, zoom, x, y, buffer, name, rows, env))
+                count += 1
+            dbcon.commit()
+        except Exception as e:
+            print("Database transaction failed. (%s)" % e.pgerror)
+            exit(1)
+
+        if i % PROGRESS == 0:
+            print("%s tiles of %s candidates exported (%.0f%%)." % (
+                count, i, 100.0 * i / len(candidates)))
+
+    print("%s tiles of %s candidates exported and finished." % (count, len(candidates)))
+
+    cursor.close()
+    dbcon.close()
+
+    return count
+
+# Create view of tiles covering a region
+
+
+def region(host, port, database, table, view, xmin, ymin, xmax, ymax, user, password,
+           printonly):
+    try:
+        dbcon = psycopg2.connect(
+            host=host, port=port, database=database, user=user, password=password)
+        cursor = dbcon.cursor()
+    except:
+        print("Connection to database failed.")
+        exit(1)
+
+    try:
+        cursor.execute(
+            """SELECT tablename FROM %s_tiles
+            WHERE geom && ST_MakeEnvelope(%s,%s,%s,%s,4326) ORDER BY quadkey;""" % (
+                table, xmin, ymin, xmax, ymax))
+        tables = [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    if len(tables) == 0:
+        print("No tiles of table '%s' cover the region." % table)
+        exit(1)
+
+    # Roads within the overlap buffer are contained in several tiles and must not be duplicated.
+    try:
+        query = """CREATE OR REPLACE VIEW %s AS SELECT DISTINCT ON (gid) * FROM (%s) AS tiles
+            ORDER BY gid;""" % (view, " UNION ALL ".join(
+            "SELECT * FROM %s" % name for name in tables))
+        if printonly == True:
+            print(query)
+        else:
+            cursor.execute(query)
+            dbcon.commit()
+    except Exception as e:
+        print("Database transaction failed. (%s)" % e.pgerror)
+        exit(1)
+
+    cursor.close()
+    dbcon.close()
+
+    return tables
@@ -19,6 +19,7 @@ __license__ = "Apache-2.0"
 
 import optparse
 import getpass
+import os
 import bfmap
 
 parser = optparse.OptionParser("ways2bfmap.py [options]")
@@ -46,72 +47,101 @@ parser.add_option(
     "--target-user", dest="target_user", help="User of target database.")
 parser.add_option("--target-password", dest="target_password",
                   help="User password of target database.")
+parser.add_option("--source-file", dest="source_file",
+                  help="File of ways to be used instead of the source database. (see ways2file.py)")
+parser.add_option("--target-file", dest="target_file",
+                  help="""File to write segments to instead of the target database. (PostgreSQL
+                  COPY text format, loadable with psql's \\copy command)""")
 parser.add_option("--config", dest="config",
                   help="Configuration file for OSM data interpretation. (XML)")
 parser.add_option("--append", action="store_true",
-                  default=False, help="Append data if target table exists.")
+                  default=False, help="Append data if target table (or file) exists.")
 parser.add_option("--printonly", action="store_true",
                   default=False, help="Do not execute commands, but print it.")
 
 (options, args) = parser.parse_args()
 
-if options.source_host == None or \
-        options.source_port == None or \
-        options.source_database == None or \
-        options.source_table == None or \
-        options.source_user == None or \
-        options.target_host == None or \
-        options.target_port == None or \
-        options.target_database == None or \
-        options.target_table == None or \
-        options.target_user == None or \
+if (options.source_file == None and (
+        options.source_host == None or
+        options.source_port == None or
+        options.source_database == None or
+        options.source_table == None or
+        options.source_user == None)) or \
+        (options.target_file == None and (
+            options.target_host == None or
+            options.target_port == None or
+            options.target_database == None or
+            options.target_table == None or
+            options.target_user == None)) or \
         options.config == None:
     parser.print_help()
     exit(1)
 
-if options.source_password == None:
-    source_password = getpass.getpass("Password (source database):")
-else:
-    source_password = options.source_password
-
-if options.target_password == None:
-    target_password = getpass.getpass("Password (target database):")
-else:
-    target_password = options.target_password
-
 config = bfmap.config(options.config)
 print("Configuration imported.")
 
-if not bfmap.exists(options.target_host, options.target_port, options.target_database,
-                    options.target_table, options.target_user, target_password):
-    print("Table '%s' does not exist in database '%s'." % 
-          (options.target_table, options.target_database))
-    bfmap.schema(options.target_host, options.target_port, options.target_database,
-                options.target_table, options.target_user, target_password, options.printonly)
-    print("Table '%s' has been created." % options.target_table)
+if options.source_file != None:
+    source = bfmap.FileSource(options.source_file)
 else:
-    print("Table '%s' already exists in database '%s'." % 
-          (options.target_table, options.target_database))
-    if not options.append:
+    if options.source_password == None:
+        source_password = getpass.getpass("Password (source database):")
+    else:
+        source_password = options.source_password
+
+    source = bfmap.PostGISSource(options.source_host, options.source_port,
+                                 options.source_database, options.source_table,
+                                 options.source_user, source_password)
+
+if options.target_file != None:
+    append = options.append
+    if os.path.exists(options.target_file) and not options.append:
+        print("File '%s' already exists." % options.target_file)
         while True:
             value = raw_input(
-                            "Do you want to remove table '%s' (y/n)?: " % options.target_table).lower()
+                "Do you want to overwrite file '%s' (y/n)?: " % options.target_file).lower()
             if value == 'n':
-                print("Append data to table '%s'." % options.target_table)
+                print("Append data to file '%s'." % options.target_file)
+                append = True
                 break
             elif value == 'y':
-                bfmap.remove(options.target_host, options.target_port, options.target_database,
-                            options.target_table, options.target_user, target_password, options.printonly)
-                print("Table '%s' has been removed." % options.target_table)
-                bfmap.schema(options.target_host, options.target_port, options.target_database,
-                            options.target_table, options.target_user, target_password, options.printonly)
-                print("Table '%s' has been recreated." % options.target_table)
                 break
+    target = bfmap.FileTarget(options.target_file, append)
+else:
+    if options.target_password == None:
+        target_password = getpass.getpass("Password (target database):")
+    else:
+        target_password = options.target_password
+
+    if not bfmap.exists(options.target_host, options.target_port, options.target_database,
+                        options.target_table, options.target_user, target_password):
+        print("Table '%s' does not exist in database '%s'." %
+              (options.target_table, options.target_database))
+        bfmap.schema(options.target_host, options.target_port, options.target_database,
+                     options.target_table, options.target_user, target_password, options.printonly)
+        print("Table '%s' has been created." % options.target_table)
+    else:
+        print("Table '%s' already exists in database '%s'." %
+              (options.target_table, options.target_database))
+        if not options.append:
+            while True:
+                value = raw_input(
+                    "Do you want to remove table '%s' (y/n)?: " % options.target_table).lower()
+                if value == 'n':
+                    print("Append data to table '%s'." % options.target_table)
+                    break
+                elif value == 'y':
+                    bfmap.remove(options.target_host, options.target_port, options.target_database,
+                                 options.target_table, options.target_user, target_password, options.printonly)
+                    print("Table '%s' has been removed." % options.target_table)
+                    bfmap.schema(options.target_host, options.target_port, options.target_database,
+                                 options.target_table, options.target_user, target_password, options.printonly)
+                    print("Table '%s' has been recreated." % options.target_table)
+                    break
+
+    target = bfmap.PostGISTarget(options.target_host, options.target_port,
+                                 options.target_database, options.target_table,
+                                 options.target_user, target_password, options.printonly)
 
 print("Inserting data ...")
-bfmap.ways2bfmap(options.source_host, options.source_port, options.source_database,
-                 options.source_table, options.source_user, source_password,
-                 options.target_host, options.target_port, options.target_database,
-                 options.target_table, options.target_user, target_password, config,
-                 options.printonly)
+bfmap.process(source, target, config)
 print("Done.")
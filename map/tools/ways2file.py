@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import getpass
+import bfmap
+
+parser = optparse.OptionParser("ways2file.py [options]")
+parser.add_option("--host", dest="host", help="Hostname of the database.")
+parser.add_option("--port", dest="port", help="Port of the database.")
+parser.add_option("--database", dest="database", help="Name of the database.")
+parser.add_option("--table", dest="table", help="Name of the (ways) table.")
+parser.add_option("--user", dest="user", help="User of the database.")
+parser.add_option("--password", dest="password", help="User password.")
+parser.add_option("--file", dest="file",
+                  help="File to write ways to, one JSON object per line.")
+
+(options, args) = parser.parse_args()
+
+if options.host == None or \
+        options.port == None or \
+        options.database == None or \
+        options.table == None or \
+        options.user == None or \
+        options.file == None:
+    parser.print_help()
+    exit(1)
+
+if options.password == None:
+    password = getpass.getpass("Password:")
+else:
+    password = options.password
+
+print("Write table '%s' to file '%s' ..." % (options.table, options.file))
+source = bfmap.PostGISSource(options.host, options.port, options.database, options.table,
+                             options.user, password)
+count = bfmap.dump(source, options.file)
+print("%s ways written and finished." % count)
+print("Done.")
@@ -18,74 +18,113 @@ __copyright__ = "Copyright 2016 BMW Car IT GmbH"
 __license__ = "Apache-2.0"
 
 import optparse
-import json
-import random
-import socket
-import os
 import sys
+import shutil
+import client
+import readers
+import cache
+import windows
+import thin
+import endpoints
 
 parser = optparse.OptionParser("batch.py [options]")
 parser.add_option("--host", dest="host", help="IP address of matcher.")
 parser.add_option("--port", type="int", dest="port", help="Port of matcher.")
-parser.add_option("--input_file_name", dest="input_file_name", help="JSON file with sample data.")
+parser.add_option("--endpoints", dest="endpoints", help="Comma separated list of matcher instances 'host:port', instead of --host and --port.")
+parser.add_option("--balance", dest="balance", default="least", help="Routing of requests to matcher instances: least (outstanding requests, default) | hash (consistent hashing of object id)")
+parser.add_option("--retries", type="int", dest="retries", default=0, help="Number of retries of failed requests on other matcher instances. (default: 0)")
+parser.add_option("--input_file_name", dest="input_file_name", help="JSON, NDJSON or CSV file with sample data, optionally gzip compressed.")
 parser.add_option("--id", dest="id", help="Object id.")
 parser.add_option("--zone", dest="zone", default="+0000", help="Time zone in '(+/-)HHMM' format.")
 parser.add_option("--format", dest="format", default="geojson", help="Output format: geojson (default) | slimjson | debug")
 parser.add_option("--output_file_name", dest="output_file_name", help="Map-matching output file name")
+parser.add_option("--quiet", action="store_true", dest="quiet", default=False, help="Do not echo map-matching output to stdout.")
+parser.add_option("--window", type="float", dest="window", help="Split trace into time windows of given length in seconds that are matched concurrently and stitched.")
+parser.add_option("--overlap", type="float", dest="overlap", default=60.0, help="Overlap of windows in seconds. (default: 60)")
+parser.add_option("--connections", type="int", dest="connections", default=4, help="Number of concurrent window requests. (default: 4)")
+parser.add_option("--thin", action="store_true", dest="thin", default=False, help="Remove speed outliers, collapse stationary samples and drop samples below minimum interval and distance before submission.")
+parser.add_option("--properties", dest="properties", help="Server properties file with thresholds 'matcher.interval.min' and 'matcher.distance.min' for thinning.")
+parser.add_option("--speed", type="float", dest="speed", default=thin.SPEED, help="Maximum speed in meters per second for thinning, faster samples are outliers. (default: %s)" % thin.SPEED)
+parser.add_option("--stationary", type="float", dest="stationary", default=thin.STATIONARY, help="Maximum step in meters of stationary samples for thinning. (default: %s)" % thin.STATIONARY)
+parser.add_option("--cache", dest="cache", help="Directory of response cache, responses of unchanged requests are read from cache.")
+parser.add_option("--cache_size", type="int", dest="cache_size", default=1024, help="Maximum size of response cache in MB. (default: 1024)")
+parser.add_option("--map", dest="map", help="Road map properties file, its database settings, the content of its ways table and the matcher settings of server properties are part of cache keys.")
+parser.add_option("--buffer", type="int", dest="buffer", default=client.BUFFER_SIZE, help="Size of socket buffers in bytes. (default: %s)" % client.BUFFER_SIZE)
 
 (options, args) = parser.parse_args()
 
-if options.input_file_name is None or options.output_file_name is None or options.host is None or options.port is None:
+matchers = endpoints.addresses(options.endpoints, options.host, options.port)
+if options.input_file_name is None or options.output_file_name is None or len(matchers) == 0:
     parser.print_help()
     exit(1)
 
-if options.format not in ["geojson", "slimjson", "debug"]:
+if options.format not in ["geojson", "slimjson", "debug"] or options.balance not in endpoints.POLICIES or \
+        (options.window is not None and options.overlap >= options.window):
     parser.print_help()
     exit(1)
 
-with open(options.input_file_name) as jsonfile:
-    samples = json.load(jsonfile)
+# Samples are read lazily and streamed into the request, unless the whole trace is needed.
+samples = readers.samples(options.input_file_name)
 
-previous = None
+if options.id is not None:
+    samples = readers.identify(samples, options.id)
 
-for sample in samples:
-    if options.id is not None:
-        sample["id"] = options.id
+if options.thin or options.window is not None or options.cache is not None:
+    samples = list(samples)
 
-tmp = "batch-%s" % random.randint(0, sys.maxint)
-file = open(tmp, "w")
+if options.thin:
+    if options.properties is not None:
+        (interval, distance) = thin.thresholds(client.properties(options.properties))
+    else:
+        (interval, distance) = (1000, 0)
+    (samples, stats) = thin.thin(samples, interval, distance, options.speed, options.stationary)
+    print(thin.report(stats))
+
+responses = None
+if options.cache is not None:
+    responses = cache.Cache(options.cache, options.cache_size * 1048576)
+    paths = [path for path in [options.properties, options.map] if path is not None]
+    parameters = [] if options.window is None else [options.window, options.overlap]
+    request_key = cache.key(samples, options.format, cache.fingerprint(paths), *parameters)
+
+matcher = endpoints.Endpoints(matchers, options.balance, options.retries)
 
 # Stores the results of map-matching to file
-mapmatched_file = open(options.output_file_name, 'w+')
-
-try:
-    try:
-        file.write(
-            "{\"format\": \"%s\", \"request\": %s}\n" %
-            (options.format, json.dumps(samples))
-        )
-    finally:
-        file.close()
-
-    output = ''
-
-    s = socket.create_connection((options.host, options.port))
-    try:
-        with open(tmp) as f:
-            s.sendall(f.read())
-        s.shutdown(socket.SHUT_WR)
-        buf = s.recv(4096)
-        while buf:
-            if len(output) < 16:
-                output += buf
-            sys.stdout.write(buf)
-            mapmatched_file.write(buf)
-            buf = s.recv(4096)
-    finally:
-        s.close()
-finally:
-    os.remove(tmp)
-    mapmatched_file.close()
-
-if not output.startswith('SUCCESS\n'):
+if responses is not None and responses.load(request_key, options.output_file_name):
+    success = True
+    if not options.quiet:
+        with open(options.output_file_name, "rb") as mapmatched_file:
+            shutil.copyfileobj(mapmatched_file, sys.stdout)
+else:
+    with open(options.output_file_name, "w+b") as mapmatched_file:
+        if options.window is None and len(matchers) == 1:
+            # A single matcher responds deterministically, so there is nothing to retry.
+            success = client.request(matchers[0][0], matchers[0][1], samples, options.format,
+                                     mapmatched_file, echo=None if options.quiet else sys.stdout,
+                                     size=options.buffer)
+        elif options.window is None:
+            # With retries, responses of failed attempts are discarded and output is echoed when
+            # complete.
+            success = matcher.request(samples, options.format, mapmatched_file,
+                                      size=options.buffer, key=options.id,
+                                      echo=None if options.quiet else sys.stdout)
+        else:
+            (success, seams) = windows.request(
+                matcher, samples, options.format, mapmatched_file,
+                int(options.window * 1000), int(options.overlap * 1000), options.connections,
+                echo=None if options.quiet else sys.stdout)
+            for seam in seams:
+                print("Seam at %s: %s of %s overlapping samples disagree%s." % (
+                    seam["time"], seam["disagreements"], seam["compared"],
+                    "" if seam["agreed"] else ", no consistent road"))
+    if success and responses is not None:
+        responses.store(request_key, options.output_file_name)
+
+if len(matchers) > 1:
+    print(matcher.report())
+
+if responses is not None:
+    print(responses.report())
+
+if not success:
     sys.exit(1)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import json
+import random
+import socket
+import time
+import threading
+import Queue
+import client
+import readers
+
+# Load generation and latency benchmark for the matcher server
+#
+# Requests are drawn from a corpus of traces with a seeded random generator and scheduled open loop:
+# with a target rate, request i is due at i / rate seconds (or at exponentially distributed
+# intervals with --poisson) regardless of when earlier requests complete, and its latency is
+# measured from the scheduled time, so queueing in client and server is part of the latency.
+# Without a rate, a fixed number of requests is kept in flight (closed loop). Latencies, errors
+# and timeouts are reported per output format.
+
+
+class Header(object):
+    """Output that discards the response except for its status header."""
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        if len(self.data) < 16:
+            self.data += data[:16].tobytes()
+
+    def status(self):
+        return self.data.split(b"\n", 1)[0]
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+def summary(records, elapsed):
+    latencies = [r["latency"] for r in records if r["status"] == "SUCCESS"]
+    count = len(records)
+    result = {"requests": count,
+              "success": len(latencies),
+              "errors": sum(1 for r in records if r["status"] == "ERROR"),
+              "timeouts": sum(1 for r in records if r["status"] == "TIMEOUT"),
+              "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0}
+    result["error_rate"] = result["errors"] / float(max(count, 1))
+    result["timeout_rate"] = result["timeouts"] / float(max(count, 1))
+    for p in [50, 95, 99]:
+        result["p%s" % p] = percentile(latencies, p)
+    result["max"] = max(latencies) if len(latencies) > 0 else None
+    return result
+
+
+parser = optparse.OptionParser("benchmark.py [options] input [input ...]",
+                               description="""Drives the matcher server with traces of the inputs
+                               (JSON files, directories, glob patterns or NDJSON files) at a target
+                               rate or concurrency and reports latency percentiles, error and
+                               timeout rates and throughput per output format.""")
+parser.add_option("--host", dest="host", help="IP address of matcher.")
+parser.add_option("--port", type="int", dest="port", help="Port of matcher.")
+parser.add_option("--formats", dest="formats", default="geojson", help="Comma separated output formats to benchmark one after another. (default: geojson)")
+parser.add_option("--requests", type="int", dest="requests", default=100, help="Number of requests per format. (default: 100)")
+parser.add_option("--rate", type="float", dest="rate", help="Target request rate per second (open loop).")
+parser.add_option("--poisson", action="store_true", dest="poisson", default=False, help="Exponentially distributed request intervals instead of fixed intervals.")
+parser.add_option("--concurrency", type="int", dest="concurrency", default=4, help="Requests in flight without target rate (closed loop). (default: 4)")
+parser.add_option("--workers", type="int", dest="workers", default=64, help="Maximum number of concurrent connections with target rate. (default: 64)")
+parser.add_option("--timeout", type="float", dest="timeout", default=60.0, help="Client socket timeout in seconds, counted as timeout. (default: 60)")
+parser.add_option("--seed", type="int", dest="seed", default=0, help="Seed of random trace selection and intervals. (default: 0)")
+parser.add_option("--properties", dest="properties", help="Server properties file, recorded with results.")
+parser.add_option("--output", dest="output", help="JSON file of results.")
+
+(options, args) = parser.parse_args()
+
+if len(args) == 0 or options.host is None or options.port is None:
+    parser.print_help()
+    exit(1)
+
+formats = options.formats.split(",")
+if any(format not in ["json", "geojson", "slimjson", "debug"] for format in formats):
+    parser.print_help()
+    exit(1)
+
+corpus = list(readers.traces(args))
+if len(corpus) == 0:
+    print("No traces found.")
+    exit(1)
+print("%s traces loaded." % len(corpus))
+
+results = {"host": options.host, "port": options.port, "traces": len(corpus),
+           "requests": options.requests, "rate": options.rate, "poisson": options.poisson,
+           "concurrency": None if options.rate is not None else options.concurrency,
+           "timeout": options.timeout, "seed": options.seed, "formats": {}}
+if options.properties is not None:
+    results["properties"] = client.properties(options.properties)
+
+for format in formats:
+    generator = random.Random(options.seed)
+    selection = [generator.randrange(len(corpus)) for i in range(options.requests)]
+    if options.rate is not None:
+        due = 0.0
+        schedule = []
+        for i in range(options.requests):
+            schedule.append(due)
+            due += generator.expovariate(options.rate) if options.poisson else 1.0 / options.rate
+    else:
+        schedule = [0.0] * options.requests
+
+    pending = Queue.Queue()
+    records = []
+    lock = threading.Lock()
+    start = time.time()
+
+    def submit():
+        while True:
+            try:
+                i = pending.get_nowait()
+            except Queue.Empty:
+                break
+            scheduled = start + schedule[i]
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif options.rate is None:
+                scheduled = time.time()
+            sent = time.time()
+            try:
+                header = Header()
+                client.request(options.host, options.port, corpus[selection[i]][1], format,
+                               header, options.timeout)
+                status = header.status() if header.status() in ["SUCCESS", "TIMEOUT"] else "ERROR"
+            except socket.timeout:
+                status = "TIMEOUT"
+            except Exception:
+                status = "ERROR"
+            record = {"trace": corpus[selection[i]][0], "scheduled": schedule[i],
+                      "latency": time.time() - scheduled, "lag": sent - scheduled,
+                      "status": status}
+            with lock:
+                records.append(record)
+
+    for i in range(options.requests):
+        pending.put(i)
+    # Requests are taken in schedule order, so with enough workers each request is sent when due
+    # and slow responses only occupy a worker instead of delaying subsequent requests.
+    workers = [threading.Thread(target=submit) for i in range(
+        options.concurrency if options.rate is None else options.workers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    result = summary(records, elapsed)
+    result["elapsed"] = elapsed
+    # Delay of sending behind schedule, if all workers are busy the target rate is not achieved.
+    result["lag_p99"] = percentile([r["lag"] for r in records], 99)
+    results["formats"][format] = result
+
+    print("%s: %s requests in %.2f s, %.2f req/s, %s errors (%.1f%%), %s timeouts (%.1f%%)" % (
+        format, result["requests"], elapsed, result["throughput"], result["errors"],
+        100.0 * result["error_rate"], result["timeouts"], 100.0 * result["timeout_rate"]))
+    if result["success"] > 0:
+        print("%s: latency p50 %.3f s, p95 %.3f s, p99 %.3f s, max %.3f s" % (
+            format, result["p50"], result["p95"], result["p99"], result["max"]))
+    if options.rate is not None and result["lag_p99"] > 0.1:
+        print("%s: requests sent up to %.3f s (p99) behind schedule, increase --workers." % (
+            format, result["lag_p99"]))
+
+if options.output is not None:
+    with open(options.output, "w") as outputfile:
+        json.dump(results, outputfile, indent=2, sort_keys=True)
+    print("Results written to %s." % options.output)
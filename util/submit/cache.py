@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import client
+
+# Content-addressed cache of matcher responses
+#
+# Responses are stored as files named by the SHA-1 hash of the normalized request (samples in time
+# order with sorted keys, output format and further parameters) and a fingerprint of road map and
+# matcher settings. Only successful responses are stored. The cache is bounded in size and evicts
+# least recently used responses, where a hit updates the modification time of its file.
+
+SIZE = 1024 * 1024 * 1024
+PREFIXES = ("database.", "matcher.")
+
+# Fingerprint of road map and matcher settings
+#
+# Hashes all properties with prefix 'database.' (road map) and 'matcher.' (matcher settings) of
+# the given properties files, so unrelated settings and comments do not invalidate the cache, and
+# the content of the road map of the database settings (see content).
+
+
+def fingerprint(paths, prefixes=PREFIXES):
+    settings = {}
+    for path in paths:
+        for (key, value) in client.properties(path).items():
+            if key.startswith(prefixes):
+                settings[key] = value
+    return hashlib.sha1(json.dumps([settings, content(settings)], sort_keys=True)).hexdigest()
+
+# Fingerprint of road map content
+#
+# Identifies the ways table of the database settings by its OID and file node, which change when
+# the map is imported again, and its number of rows and maximum gid. If the matcher's map buffer
+# file '<database.name>.bfmap' exists in the working directory, its size and modification time
+# are part of it, too. Returns None for parts that cannot be read, e.g. without database access.
+
+
+def content(settings):
+    if "database.name" not in settings:
+        return None
+    result = {"table": None, "file": None}
+    buffer = "%s.bfmap" % settings["database.name"]
+    if os.path.exists(buffer):
+        stat = os.stat(buffer)
+        result["file"] = [stat.st_size, stat.st_mtime]
+    if "database.table" not in settings:
+        return result
+    try:
+        import psycopg2
+        dbcon = psycopg2.connect(
+            host=settings.get("database.host"), port=settings.get("database.port"),
+            database=settings["database.name"], user=settings.get("database.user"),
+            password=settings.get("database.password"))
+        try:
+            cursor = dbcon.cursor()
+            cursor.execute("SELECT %%s::regclass::oid, pg_relation_filenode(%%s::regclass), "
+                           "count(*), max(gid) FROM %s;" % settings["database.table"],
+                           (settings["database.table"], settings["database.table"]))
+            result["table"] = [str(value) for value in cursor.fetchone()]
+        finally:
+            dbcon.close()
+    except Exception as e:
+        print("Road map content not fingerprinted, database not readable. (%s)" % str(e).strip())
+    return result
+
+
+def key(samples, format, fingerprint, *parameters):
+    samples = sorted(samples, key=lambda sample: client.timestamp(sample["time"]))
+    digest = hashlib.sha1()
+    digest.update(json.dumps([format, fingerprint] + list(parameters), sort_keys=True))
+    for sample in samples:
+        digest.update(json.dumps(sample, sort_keys=True, separators=(",", ":")))
+        digest.update("\n")
+    return digest.hexdigest()
+
+
+class Cache(object):
+
+    def __init__(self, path, size=SIZE):
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.usage = sum(size for (mtime, size, name) in self.entries())
+
+    def entries(self):
+        entries = []
+        for directory in os.listdir(self.path):
+            directory = os.path.join(self.path, directory)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                name = os.path.join(directory, name)
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(name)
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def load(self, key, path):
+        """Copies cached response to file path and returns True, if the key is cached."""
+        name = self.file(key)
+        try:
+            shutil.copyfile(name, path)
+            os.utime(name, None)
+        except (IOError, OSError):
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, path):
+        """Stores response of file path for key and evicts least recently used responses."""
+        name = self.file(key)
+        if not os.path.exists(os.path.dirname(name)):
+            try:
+                os.makedirs(os.path.dirname(name))
+            except OSError:
+                pass
+        # Writes to temporary file and renames it, so concurrent readers never see partial files.
+        tmp = "%s.%s.%s.tmp" % (name, os.getpid(), threading.current_thread().ident)
+        shutil.copyfile(path, tmp)
+        os.rename(tmp, name)
+
+        with self.lock:
+            self.stores += 1
+            self.usage += os.path.getsize(name)
+            if self.usage > self.size:
+                self.evict()
+
+    def evict(self):
+        entries = sorted(self.entries())
+        self.usage = sum(size for (mtime, size, name) in entries)
+        for (mtime, size, name) in entries:
+            if self.usage <= self.size:
+                break
+            try:
+                os.remove(name)
+            except OSError:
+                continue
+            self.usage -= size
+            self.evictions += 1
+
+    def report(self):
+        requests = self.hits + self.misses
+        return "Cache: %s hits, %s misses (%.1f%% hit rate), %s stored, %s evicted, %.1f MB used." % (
+            self.hits, self.misses, 100.0 * self.hits / max(requests, 1), self.stores,
+            self.evictions, self.usage / 1048576.0)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import json
+import socket
+import calendar
+import time
+
+# Read Java properties file (key=value lines) into a dictionary
+
+
+def properties(path):
+    result = {}
+    with open(path) as propfile:
+        for line in propfile:
+            line = line.strip()
+            if len(line) == 0 or line[0] in "#!" or "=" not in line:
+                continue
+            (key, value) = line.split("=", 1)
+            result[key.strip()] = value.strip()
+    return result
+
+# Convert sample time to epoch milliseconds
+#
+# Sample times are either epoch milliseconds or strings in 'yyyy-MM-dd HH:mm:ssX' format with time
+# zone 'Z', '+HH', '+HHMM' or '+HH:MM', as accepted by the matcher.
+
+
+def timestamp(value):
+    if isinstance(value, (int, long, float)):
+        return int(value)
+    seconds = calendar.timegm(time.strptime(value[:19], "%Y-%m-%d %H:%M:%S"))
+    zone = value[19:].strip().replace(":", "")
+    if len(zone) > 1 and zone[0] in "+-":
+        offset = int(zone[1:3]) * 3600 + int(zone[3:5] or 0) * 60
+        seconds -= offset if zone[0] == "+" else -offset
+    return seconds * 1000
+
+# Submit samples to matcher server and write response to output file
+#
+# The request is serialized sample by sample into a buffered socket writer and the response is
+# received into a reusable buffer, so neither is held in memory as a whole. The status header
+# (SUCCESS, ERROR or TIMEOUT) is taken from the first line of the response and the response is
+# written as is to output and, if given, echo. Returns True if the server responded with SUCCESS.
+
+BUFFER_SIZE = 65536
+
+
+def request(host, port, samples, format, output, timeout=None, echo=None, size=BUFFER_SIZE):
+    header = b""
+    s = socket.create_connection((host, port), timeout)
+    try:
+        writer = s.makefile("wb", size)
+        try:
+            writer.write(b"{\"format\": \"%s\", \"request\": [" % format.encode("ascii"))
+            for (i, sample) in enumerate(samples):
+                if i > 0:
+                    writer.write(b", ")
+                writer.write(json.dumps(sample).encode("utf-8"))
+            writer.write(b"]}\n")
+        finally:
+            writer.close()
+        s.shutdown(socket.SHUT_WR)
+
+        buf = bytearray(size)
+        view = memoryview(buf)
+        n = s.recv_into(buf)
+        while n > 0:
+            if len(header) < 16:
+                header += view[:min(n, 16 - len(header))].tobytes()
+            output.write(view[:n])
+            if echo is not None:
+                echo.write(view[:n].tobytes())
+            n = s.recv_into(buf)
+    finally:
+        s.close()
+    return header.startswith(b"SUCCESS\n")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import bisect
+import hashlib
+import shutil
+import socket
+import threading
+import time
+import client
+
+# Sharding and failover across matcher instances
+#
+# Requests are routed to the endpoint with least outstanding requests or, with policy 'hash', to the
+# endpoint of the object id on a consistent hash ring, so that traces of an object go to the same
+# instance and adding an instance moves only a share of the objects. Connection failures, socket
+# timeouts and ERROR or TIMEOUT responses are retried on another endpoint, an endpoint that was
+# already tried is tried again only after a connection failure or socket timeout, as its responses
+# are deterministic. Endpoints with connection failures or socket timeouts are skipped for a
+# cool-down period that doubles with each further failure and are used again after a success.
+
+POLICIES = ["least", "hash"]
+REPLICAS = 100
+COOLDOWN = 5.0
+
+
+def addresses(endpoints, host=None, port=None):
+    """Parses comma separated 'host:port' list or, if not given, returns [(host, port)]."""
+    if endpoints is None:
+        return [(host, int(port))] if host is not None and port is not None else []
+    result = []
+    for address in endpoints.split(","):
+        (name, number) = address.strip().rsplit(":", 1)
+        result.append((name, int(number)))
+    return result
+
+
+def position(value):
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class Status(object):
+    """Output that forwards the response and keeps its status header."""
+
+    def __init__(self, output):
+        self.output = output
+        self.header = b""
+
+    def write(self, data):
+        if len(self.header) < 16:
+            self.header += data[:16 - len(self.header)].tobytes()
+        self.output.write(data)
+
+    def status(self):
+        return self.header.split(b"\n", 1)[0]
+
+
+class Endpoint(object):
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.responses = 0
+        self.failures = 0
+        self.retries = 0
+        self.latencies = []
+        self.consecutive = 0
+        self.down = 0.0
+
+    def __str__(self):
+        return "%s:%s" % (self.host, self.port)
+
+
+class Endpoints(object):
+
+    def __init__(self, addresses, policy="least", retries=0, cooldown=COOLDOWN,
+                 replicas=REPLICAS):
+        self.endpoints = [Endpoint(host, port) for (host, port) in addresses]
+        self.policy = policy
+        self.retries = retries
+        self.cooldown = cooldown
+        self.ring = sorted((position("%s#%s" % (endpoint, i)), n)
+                           for (n, endpoint) in enumerate(self.endpoints) for i in range(replicas))
+        self.lock = threading.Lock()
+        self.start = time.time()
+
+    def walk(self, key):
+        """Endpoints in order of the hash ring starting at position of key."""
+        order = []
+        i = bisect.bisect(self.ring, (position(key),))
+        for j in range(len(self.ring)):
+            endpoint = self.endpoints[self.ring[(i + j) % len(self.ring)][1]]
+            if endpoint not in order:
+                order.append(endpoint)
+                if len(order) == len(self.endpoints):
+                    break
+        return order
+
+    def select(self, key, tried, again=True):
+        """Endpoint for a request, preferably one not tried yet. Returns None if all endpoints
+        were tried and, with again False, none of them may be tried again."""
+        with self.lock:
+            now = time.time()
+            if self.policy == "hash" and key is not None:
+                candidates = self.walk(str(key))
+            else:
+                candidates = list(self.endpoints)
+            candidates = [e for e in candidates if e not in tried] or \
+                (candidates if again else [])
+            if len(candidates) == 0:
+                return None
+            healthy = [e for e in candidates if e.down <= now]
+            if len(healthy) == 0:
+                # All endpoints are cooling down, use the one that recovers first.
+                endpoint = min(candidates, key=lambda e: e.down)
+            elif self.policy == "hash" and key is not None:
+                endpoint = healthy[0]
+            else:
+                endpoint = min(healthy, key=lambda e: (e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            if len(tried) > 0:
+                endpoint.retries += 1
+            return endpoint
+
+    def complete(self, endpoint, latency, status, failed):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if status == b"SUCCESS":
+                endpoint.successes += 1
+                endpoint.latencies.append(latency)
+            elif failed:
+                endpoint.failures += 1
+            else:
+                endpoint.responses += 1
+            if failed:
+                endpoint.consecutive += 1
+                endpoint.down = time.time() + self.cooldown * 2 ** min(endpoint.consecutive - 1, 6)
+            else:
+                endpoint.consecutive = 0
+                endpoint.down = 0.0
+
+    def request(self, samples, format, output, timeout=None, size=client.BUFFER_SIZE, key=None,
+                echo=None):
+        """Submits samples like client.request to one of the endpoints and retries on others. Key
+        defaults to the id of the first sample. Output must be seekable, it is truncated before a
+        retry. Without retries, samples are streamed and the response is written to echo as it
+        arrives, otherwise the response of the last attempt is written to echo when complete.
+        Raises the exception of the last attempt if it failed with a connection failure or socket
+        timeout."""
+        if self.retries > 0 and not isinstance(samples, list):
+            samples = list(samples)
+        if key is None and isinstance(samples, list) and len(samples) > 0:
+            key = samples[0].get("id")
+        tried = []
+        error = None
+        success = False
+        for attempt in range(self.retries + 1):
+            endpoint = self.select(key, tried, error is not None)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            if attempt > 0:
+                output.seek(0)
+                output.truncate()
+            response = Status(output)
+            error = None
+            start = time.time()
+            try:
+                client.request(endpoint.host, endpoint.port, samples, format, response, timeout,
+                               echo=echo if self.retries == 0 else None, size=size)
+            except socket.error as e:
+                error = e
+            self.complete(endpoint, time.time() - start, response.status(), error is not None)
+            if response.status() == b"SUCCESS":
+                success = True
+                break
+        if echo is not None and self.retries > 0 and len(tried) > 0:
+            output.seek(0)
+            shutil.copyfileobj(output, echo)
+        if error is not None:
+            raise error
+        return success
+
+    def report(self):
+        elapsed = max(time.time() - self.start, 1e-9)
+        total = max(sum(endpoint.requests for endpoint in self.endpoints), 1)
+        lines = []
+        for endpoint in self.endpoints:
+            latencies = sorted(endpoint.latencies)
+            lines.append(("%s: %s requests (%.1f%%), %s succeeded, %s error responses, %s failed, "
+                          "%s retries, %.2f req/s, latency p50 %.3f s, p95 %.3f s%s") % (
+                endpoint, endpoint.requests, 100.0 * endpoint.requests / total,
+                endpoint.successes, endpoint.responses, endpoint.failures, endpoint.retries,
+                endpoint.successes / elapsed,
+                latencies[int(0.50 * (len(latencies) - 1))] if len(latencies) > 0 else 0.0,
+                latencies[int(0.95 * (len(latencies) - 1))] if len(latencies) > 0 else 0.0,
+                "" if endpoint.down <= time.time() else ", down"))
+        return "\n".join(lines)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import json
+import time
+import threading
+import Queue
+import client
+import readers
+import replay
+import subscriber
+
+# End-to-end latency of the tracker
+#
+# Traces are replayed to the tracker (see replay.py) while a subscriber listens on the tracker's
+# publisher port. The send time of each sample is recorded and published updates are correlated
+# with samples by object id and sample time, which gives the latency from sending a sample to its
+# update being published. Samples below the tracker's interval or distance thresholds and updates
+# suppressed as insensitive are not published and counted as unpublished.
+
+BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0]
+
+
+class Collector(threading.Thread):
+    """Consumes received updates and keeps the receive time of the first update of each
+    (id, time)."""
+
+    def __init__(self, receiver):
+        super(Collector, self).__init__()
+        self.daemon = True
+        self.receiver = receiver
+        self.updates = {}
+        self.errors = 0
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set() or not self.receiver.queue.empty():
+            try:
+                (received, message) = self.receiver.queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            try:
+                (id, timestamp, lon, lat, candidates) = subscriber.decode(message)
+            except (ValueError, KeyError, TypeError):
+                self.errors += 1
+                continue
+            if lon is not None:
+                self.updates.setdefault((id, timestamp), received)
+
+
+def histogram(latencies, buckets=BUCKETS):
+    counts = [0] * (len(buckets) + 1)
+    for latency in latencies:
+        i = 0
+        while i < len(buckets) and latency > buckets[i]:
+            i += 1
+        counts[i] += 1
+    return counts
+
+
+def correlate(sends, updates):
+    latencies = {}
+    for (key, sent) in sends.items():
+        if key in updates:
+            latencies[key] = updates[key] - sent
+    return latencies
+
+
+def objects(latencies):
+    lags = {}
+    for ((id, timestamp), latency) in latencies.items():
+        lags.setdefault(id, []).append(latency)
+    return dict((id, {"count": len(values), "mean": sum(values) / len(values),
+                      "max": max(values)}) for (id, values) in lags.items())
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser("latency.py [options] input [input ...]",
+                                   description="""Replays traces to the tracker and measures the
+                                   latency from sending samples to the publication of the
+                                   corresponding updates.""")
+    parser.add_option("--host", dest="host", help="IP address of tracker.")
+    parser.add_option("--port", type="int", dest="port", help="Port of tracker.")
+    parser.add_option("--publisher_port", type="int", dest="publisher_port", help="Publisher port of tracker. (default: 'tracker.port' of properties or 1235)")
+    parser.add_option("--properties", dest="properties", help="Tracker properties file.")
+    parser.add_option("--speedup", type="float", dest="speedup", default=1.0, help="Speed-up factor of replay. (default: 1)")
+    parser.add_option("--align", action="store_true", dest="align", default=False, help="Start all traces at the same time instead of replaying them at their absolute times.")
+    parser.add_option("--connections", type="int", dest="connections", help="Maximum number of concurrent connections. (default: 'server.connections' of properties or 100)")
+    parser.add_option("--drain", type="float", dest="drain", default=5.0, help="Time in seconds to wait for updates after the replay. (default: 5)")
+    parser.add_option("--objects", type="int", dest="objects", default=10, help="Number of objects with highest lag to report. (default: 10)")
+    parser.add_option("--output", dest="output", help="JSON file of results.")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) == 0 or options.host is None or options.port is None or options.speedup <= 0:
+        parser.print_help()
+        exit(1)
+
+    properties = client.properties(options.properties) if options.properties is not None else {}
+    if options.publisher_port is None:
+        options.publisher_port = int(properties.get("tracker.port", 1235))
+    if options.connections is None:
+        options.connections = int(properties.get("server.connections", 100))
+
+    fleet = [(name, samples) for (name, samples) in readers.traces(args) if len(samples) > 0]
+    if len(fleet) == 0:
+        print("No traces found.")
+        exit(1)
+    for (name, samples) in fleet:
+        samples.sort(key=lambda sample: sample["time"])
+
+    receiver = subscriber.Receiver(options.host, options.publisher_port, 1000000)
+    receiver.start()
+    collector = Collector(receiver)
+    collector.start()
+    # Subscriptions take effect asynchronously, updates published before are lost.
+    time.sleep(1.0)
+
+    simulation = replay.Replay(options.host, options.port, fleet, options.speedup, options.align,
+                               options.connections, record=True)
+    print("Replay %s vehicles with %s samples over %.2f s ..." % (
+        len(fleet), simulation.count, simulation.duration))
+    simulation.run()
+    print(simulation.summary())
+
+    time.sleep(options.drain)
+    collector.stop.set()
+    collector.join()
+
+    latencies = correlate(simulation.sends, collector.updates)
+    values = sorted(latencies.values())
+    lags = objects(latencies)
+    counts = histogram(values)
+
+    print("%s samples sent, %s updates received, %s correlated, %s unpublished, %s dropped." % (
+        len(simulation.sends), receiver.received, len(latencies),
+        len(simulation.sends) - len(latencies), receiver.dropped))
+    if len(values) > 0:
+        print("Latency (s): p50 %.4f, p95 %.4f, p99 %.4f, max %.4f" % (
+            replay.percentile(values, 50), replay.percentile(values, 95),
+            replay.percentile(values, 99), values[-1]))
+        bounds = ["<= %gs" % bound for bound in BUCKETS] + ["> %gs" % BUCKETS[-1]]
+        for (bound, count) in zip(bounds, counts):
+            print("%10s %8s %s" % (bound, count, "#" * int(round(50.0 * count / len(values)))))
+        print("Objects with highest mean lag:")
+        for (id, lag) in sorted(lags.items(), key=lambda item: -item[1]["mean"])[:options.objects]:
+            print("%s: %s updates, mean %.4f s, max %.4f s" % (
+                id, lag["count"], lag["mean"], lag["max"]))
+
+    if options.output is not None:
+        results = {"vehicles": len(fleet), "samples": len(simulation.sends),
+                   "updates": receiver.received, "correlated": len(latencies),
+                   "dropped": receiver.dropped, "speedup": options.speedup,
+                   "connections": options.connections, "properties": properties,
+                   "buckets": BUCKETS, "histogram": counts,
+                   "percentiles": dict(("p%s" % p, replay.percentile(values, p))
+                                       for p in [50, 95, 99]),
+                   "objects": lags}
+        with open(options.output, "w") as outputfile:
+            json.dump(results, outputfile, indent=2, sort_keys=True)
+        print("Results written to %s." % options.output)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import os
+import sys
+import time
+import threading
+import Queue
+import client
+import readers
+import cache
+import endpoints
+
+parser = optparse.OptionParser("multibatch.py [options] input [input ...]",
+                               description="""Submits many traces to the matcher with a bounded
+                               number of concurrent requests. Inputs are JSON files, directories
+                               of JSON files, glob patterns or NDJSON files (.ndjson, .jsonl) with
+                               one trace per line.""")
+parser.add_option("--host", dest="host", help="IP address of matcher.")
+parser.add_option("--port", type="int", dest="port", help="Port of matcher.")
+parser.add_option("--endpoints", dest="endpoints", help="Comma separated list of matcher instances 'host:port', instead of --host and --port.")
+parser.add_option("--balance", dest="balance", default="least", help="Routing of requests to matcher instances: least (outstanding requests, default) | hash (consistent hashing of object id)")
+parser.add_option("--retries", type="int", dest="retries", default=0, help="Number of retries of failed requests on other matcher instances. (default: 0)")
+parser.add_option("--format", dest="format", default="geojson", help="Output format: geojson (default) | slimjson | debug")
+parser.add_option("--output_directory", dest="output_directory", help="Directory of map-matching output files.")
+parser.add_option("--input_prefix", dest="input_prefix", default="", help="Prefix removed from trace names of input files.")
+parser.add_option("--output_prefix", dest="output_prefix", default="", help="Prefix of map-matching output file names.")
+parser.add_option("--properties", dest="properties", help="Server properties file, sets the number of concurrent requests to 'server.connections'.")
+parser.add_option("--connections", type="int", dest="connections", help="Number of concurrent requests. (default: 'server.connections' of properties or 20)")
+parser.add_option("--cache", dest="cache", help="Directory of response cache, responses of unchanged traces are read from cache.")
+parser.add_option("--cache_size", type="int", dest="cache_size", default=1024, help="Maximum size of response cache in MB. (default: 1024)")
+parser.add_option("--map", dest="map", help="Road map properties file, its database settings, the content of its ways table and the matcher settings of server properties are part of cache keys.")
+parser.add_option("--timeout", type="float", dest="timeout", help="Socket timeout in seconds.")
+parser.add_option("--skip_existing", action="store_true", dest="skip_existing", default=False, help="Skip traces whose output file holds a SUCCESS response.")
+
+(options, args) = parser.parse_args()
+
+matchers = endpoints.addresses(options.endpoints, options.host, options.port)
+if len(args) == 0 or options.output_directory is None or len(matchers) == 0:
+    parser.print_help()
+    exit(1)
+
+if options.format not in ["geojson", "slimjson", "debug"] or options.balance not in endpoints.POLICIES:
+    parser.print_help()
+    exit(1)
+
+if options.connections is None:
+    if options.properties is not None:
+        options.connections = int(client.properties(options.properties).get("server.connections", 20))
+    else:
+        options.connections = 20
+
+if not os.path.exists(options.output_directory):
+    os.makedirs(options.output_directory)
+
+responses = None
+if options.cache is not None:
+    responses = cache.Cache(options.cache, options.cache_size * 1048576)
+    fingerprint = cache.fingerprint(
+        [path for path in [options.properties, options.map] if path is not None])
+
+matcher = endpoints.Endpoints(matchers, options.balance, options.retries)
+pending = Queue.Queue(options.connections)
+lock = threading.Lock()
+latencies = []
+failures = []
+skipped = []
+count = 0
+
+
+def matched(path):
+    """True if output file exists and starts with a SUCCESS response."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as output:
+        return output.readline() == b"SUCCESS\n"
+
+
+def submit():
+    while True:
+        trace = pending.get()
+        if trace is None:
+            break
+        (name, samples) = trace
+        if name.startswith(options.input_prefix):
+            name = name[len(options.input_prefix):]
+        path = os.path.join(options.output_directory, "%s%s.json" % (options.output_prefix, name))
+        if options.skip_existing and matched(path):
+            with lock:
+                skipped.append(name)
+            continue
+
+        start = time.time()
+        if responses is not None:
+            key = cache.key(samples, options.format, fingerprint)
+        if responses is not None and responses.load(key, path):
+            success = True
+        else:
+            try:
+                with open(path, "w+b") as output:
+                    # Routed by trace name, sample ids may be numbered per trace.
+                    success = matcher.request(samples, options.format, output, options.timeout,
+                                              key=name)
+            except Exception as e:
+                print("Trace %s failed. (%s)" % (name, e))
+                success = False
+            if success and responses is not None:
+                responses.store(key, path)
+        latency = time.time() - start
+
+        with lock:
+            latencies.append(latency)
+            if not success:
+                failures.append(name)
+            print("Trace %s (%s samples) %s in %.3f s (%s/%s done)." % (
+                name, len(samples), "matched" if success else "failed", latency,
+                len(latencies) + len(skipped), count))
+
+workers = [threading.Thread(target=submit) for i in range(options.connections)]
+for worker in workers:
+    worker.daemon = True
+    worker.start()
+
+start = time.time()
+for trace in readers.traces(args):
+    count += 1
+    pending.put(trace)
+for worker in workers:
+    pending.put(None)
+for worker in workers:
+    worker.join()
+elapsed = time.time() - start
+
+if len(skipped) > 0:
+    print("%s traces skipped, output is a SUCCESS response." % len(skipped))
+if len(latencies) > 0:
+    latencies.sort()
+    print("%s traces in %.3f s (%.2f traces/s), %s failed." % (
+        len(latencies), elapsed, len(latencies) / max(elapsed, 1e-9), len(failures)))
+    print("Latency (s): min %.3f, median %.3f, mean %.3f, max %.3f" % (
+        latencies[0], latencies[len(latencies) // 2], sum(latencies) / len(latencies),
+        latencies[-1]))
+
+if len(matchers) > 1:
+    print(matcher.report())
+
+if responses is not None:
+    print(responses.report())
+
+if len(failures) > 0:
+    sys.exit(1)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import os
+import re
+import csv
+import glob
+import gzip
+import json
+import client
+
+# Streaming readers of trace files
+#
+# Samples are read lazily from JSON arrays (.json), NDJSON (.ndjson, .jsonl) and CSV (.csv) files,
+# each optionally gzip compressed (.gz), so memory does not grow with the size of the file. Sample
+# times are converted once into epoch milliseconds while reading. CSV files have a header with
+# columns 'id', 'time' and either 'point' (WKT, also 'wkt' or 'geom') or 'lon' and 'lat'.
+
+SIZE = 65536
+SEPARATOR = re.compile(r"[\s,]*")
+EXTENSIONS = [".json", ".ndjson", ".jsonl", ".csv"]
+
+# Open file, decompressing gzip files, and split name into base name and extension
+
+
+def source(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def split(path):
+    name = os.path.basename(path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return os.path.splitext(name)
+
+
+def parse(sample):
+    sample["time"] = client.timestamp(sample["time"])
+    return sample
+
+# Read elements of a JSON array incrementally
+
+
+def array(fileobj, size=SIZE):
+    decoder = json.JSONDecoder()
+    buf = ""
+    started = False
+    while True:
+        chunk = fileobj.read(size)
+        buf += chunk
+        pos = 0
+        if not started:
+            pos = len(buf) - len(buf.lstrip())
+            if pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError("JSON array expected.")
+                started = True
+                pos += 1
+        while started:
+            pos = SEPARATOR.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                (element, end) = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Element is incomplete, more data is needed.
+                break
+            yield element
+            pos = end
+        buf = buf[pos:]
+        if len(chunk) == 0:
+            raise ValueError("Unexpected end of JSON array.")
+
+
+def ndjson(fileobj):
+    for line in fileobj:
+        if len(line.strip()) > 0:
+            yield json.loads(line)
+
+
+def table(fileobj):
+    reader = csv.DictReader(fileobj)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    point = [name for name in ["point", "wkt", "geom"] if name in reader.fieldnames]
+    for row in reader:
+        if len(point) > 0:
+            geometry = row[point[0]]
+        else:
+            geometry = "POINT(%s %s)" % (row["lon"], row["lat"])
+        value = row["time"].strip()
+        yield {"id": row["id"], "time": int(value) if value.isdigit() else value,
+               "point": geometry}
+
+# Read samples of a file
+
+
+def samples(path):
+    extension = split(path)[1]
+    with source(path) as fileobj:
+        if extension in [".ndjson", ".jsonl"]:
+            elements = ndjson(fileobj)
+        elif extension == ".csv":
+            elements = table(fileobj)
+        else:
+            elements = array(fileobj)
+        for sample in elements:
+            yield parse(sample)
+
+
+def identify(samples, id):
+    for sample in samples:
+        sample["id"] = id
+        yield sample
+
+# Group consecutive samples of the same id into traces
+
+
+def group(samples):
+    (current, trace) = (None, [])
+    for sample in samples:
+        if sample.get("id") != current and len(trace) > 0:
+            yield (str(current), trace)
+            trace = []
+        current = sample.get("id")
+        trace.append(sample)
+    if len(trace) > 0:
+        yield (str(current), trace)
+
+# Read traces from files, directories, glob patterns or NDJSON files
+#
+# Yields (name, samples) for each trace. JSON files contain one trace (an array of samples) that
+# is named after the file. NDJSON files contain one trace per line, either an array of samples or
+# an object with 'id' and 'request' (array of samples), named after the id or, if missing, the
+# file and line number, or one sample per line. Samples of NDJSON and CSV files are grouped into
+# traces of consecutive samples with the same id.
+
+
+def traces(inputs):
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = sorted(sum([glob.glob(os.path.join(pattern, "*%s%s" % (extension, gz)))
+                                for extension in EXTENSIONS for gz in ["", ".gz"]], []))
+        else:
+            paths = sorted(glob.glob(pattern))
+        for path in paths:
+            (name, extension) = split(path)
+            if extension in [".ndjson", ".jsonl"]:
+                for trace in lines(path, name):
+                    yield trace
+            elif extension == ".csv":
+                for trace in group(samples(path)):
+                    yield trace
+            else:
+                yield (name, list(samples(path)))
+
+
+def lines(path, name):
+    (current, trace) = (None, [])
+    with source(path) as fileobj:
+        for (number, element) in enumerate(ndjson(fileobj)):
+            if isinstance(element, dict) and "request" not in element:
+                sample = parse(element)
+                if sample.get("id") != current and len(trace) > 0:
+                    yield (str(current), trace)
+                    trace = []
+                current = sample.get("id")
+                trace.append(sample)
+                continue
+            if len(trace) > 0:
+                yield (str(current), trace)
+                trace = []
+            if isinstance(element, dict):
+                yield (str(element.get("id", "%s-%s" % (name, number + 1))),
+                       [parse(sample) for sample in element["request"]])
+            else:
+                yield ("%s-%s" % (name, number + 1), [parse(sample) for sample in element])
+    if len(trace) > 0:
+        yield (str(current), trace)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import errno
+import heapq
+import json
+import select
+import socket
+import time
+import client
+import readers
+
+# Fleet replay for the tracker
+#
+# Samples of all vehicles are replayed from a single event loop: a heap ordered by due time holds
+# the next sample of each vehicle and non-blocking sockets are multiplexed with select. A vehicle's
+# next sample is scheduled when the response to its previous sample has been received, so samples
+# of a vehicle never overtake each other (the tracker rejects out of order samples). The tracker
+# closes the connection after each response, so every sample uses its own connection.
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+class Replay(object):
+
+    def __init__(self, host, port, fleet, speedup=1.0, align=False, connections=100,
+                 record=False):
+        self.host = host
+        self.port = port
+        self.fleet = fleet
+        self.speedup = speedup
+        self.connections = connections
+        self.heap = []
+        self.active = {}
+        self.lags = []
+        self.sent = 0
+        # Send times of samples by (id, time), if recorded
+        self.record = record
+        self.sends = {}
+        self.responses = {"SUCCESS": 0, "ERROR": 0, "TIMEOUT": 0, "FAILED": 0}
+        self.times = [[client.timestamp(sample["time"]) for sample in samples]
+                      for (name, samples) in fleet]
+        origin = min(times[0] for times in self.times if len(times) > 0)
+        self.origins = [times[0] if align else origin for times in self.times]
+        self.count = sum(len(times) for times in self.times)
+        self.duration = max((times[-1] - self.origins[v]) / 1000.0 / speedup
+                            for (v, times) in enumerate(self.times) if len(times) > 0)
+
+    def due(self, vehicle, index):
+        return self.start + (self.times[vehicle][index] - self.origins[vehicle]) / 1000.0 / \
+            self.speedup
+
+    def schedule(self, vehicle, index):
+        if index < len(self.times[vehicle]):
+            heapq.heappush(self.heap, (self.due(vehicle, index), vehicle, index))
+
+    def open(self, due, vehicle, index, now):
+        (name, samples) = self.fleet[vehicle]
+        sample = samples[index]
+        if "id" not in sample:
+            sample = dict(sample, id=name)
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(0)
+        code = s.connect_ex((self.host, self.port))
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            s.close()
+            self.finish(None, vehicle, index, "FAILED")
+            return
+        self.lags.append(now - due)
+        self.active[s] = {"vehicle": vehicle, "index": index, "header": "",
+                          "payload": json.dumps(sample) + "\n", "writing": True,
+                          "key": (str(sample["id"]), self.times[vehicle][index])}
+
+    def finish(self, s, vehicle, index, status):
+        if s is not None:
+            s.close()
+            del self.active[s]
+        self.responses[status] += 1
+        self.schedule(vehicle, index + 1)
+
+    def write(self, s):
+        connection = self.active[s]
+        if s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+            self.finish(s, connection["vehicle"], connection["index"], "FAILED")
+            return
+        try:
+            n = s.send(connection["payload"])
+        except socket.error:
+            self.finish(s, connection["vehicle"], connection["index"], "FAILED")
+            return
+        connection["payload"] = connection["payload"][n:]
+        if len(connection["payload"]) == 0:
+            s.shutdown(socket.SHUT_WR)
+            connection["writing"] = False
+            self.sent += 1
+            if self.record:
+                self.sends[connection["key"]] = time.time()
+
+    def read(self, s):
+        connection = self.active[s]
+        try:
+            data = s.recv(4096)
+        except socket.error:
+            self.finish(s, connection["vehicle"], connection["index"], "FAILED")
+            return
+        if data:
+            if len(connection["header"]) < 16:
+                connection["header"] += data[:16]
+            return
+        status = connection["header"].split("\n", 1)[0]
+        self.finish(s, connection["vehicle"], connection["index"],
+                    status if status in self.responses else "FAILED")
+
+    def run(self, interval=10.0):
+        self.start = time.time()
+        for vehicle in range(len(self.fleet)):
+            self.schedule(vehicle, 0)
+        report = self.start + interval
+
+        while len(self.heap) > 0 or len(self.active) > 0:
+            now = time.time()
+            while len(self.heap) > 0 and self.heap[0][0] <= now and \
+                    len(self.active) < self.connections:
+                (due, vehicle, index) = heapq.heappop(self.heap)
+                self.open(due, vehicle, index, now)
+
+            if len(self.heap) > 0 and len(self.active) < self.connections:
+                timeout = max(min(self.heap[0][0] - now, 1.0), 0.0)
+            else:
+                timeout = 1.0
+
+            if len(self.active) == 0:
+                time.sleep(timeout)
+            else:
+                receiving = [s for (s, c) in self.active.items() if not c["writing"]]
+                sending = [s for (s, c) in self.active.items() if c["writing"]]
+                (readable, writable, failed) = select.select(receiving, sending, [], timeout)
+                for s in writable:
+                    self.write(s)
+                for s in readable:
+                    self.read(s)
+
+            if time.time() >= report:
+                print(self.status())
+                report += interval
+
+        self.elapsed = time.time() - self.start
+
+    def status(self):
+        elapsed = time.time() - self.start
+        return "%.1f s: %s of %s samples sent, %s in flight, lag p50 %.3f s, max %.3f s" % (
+            elapsed, self.sent, self.count, len(self.active), percentile(self.lags, 50),
+            max(self.lags) if len(self.lags) > 0 else 0.0)
+
+    def summary(self):
+        scheduled = self.count / self.duration if self.duration > 0 else float(self.count)
+        achieved = self.sent / self.elapsed if self.elapsed > 0 else float(self.sent)
+        lines = ["%s vehicles, %s samples replayed in %.2f s (scheduled %.2f s)." % (
+            len(self.fleet), self.sent, self.elapsed, self.duration),
+            "Send rate: %.2f samples/s achieved, %.2f samples/s scheduled." % (
+                achieved, scheduled),
+            "Lag (s): p50 %.3f, p95 %.3f, p99 %.3f, max %.3f" % (
+                percentile(self.lags, 50), percentile(self.lags, 95), percentile(self.lags, 99),
+                max(self.lags) if len(self.lags) > 0 else 0.0),
+            "Responses: %s" % ", ".join("%s %s" % (status, count) for (status, count) in sorted(
+                self.responses.items()))]
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser("replay.py [options] input [input ...]",
+                                   description="""Replays traces of many vehicles to the tracker
+                                   according to their sample times. Inputs are JSON files,
+                                   directories, glob patterns or NDJSON files with one trace per
+                                   line; samples without id get the trace name as id.""")
+    parser.add_option("--host", dest="host", help="IP address of tracker.")
+    parser.add_option("--port", type="int", dest="port", help="Port of tracker.")
+    parser.add_option("--speedup", type="float", dest="speedup", default=1.0, help="Speed-up factor of replay. (default: 1)")
+    parser.add_option("--align", action="store_true", dest="align", default=False, help="Start all traces at the same time instead of replaying them at their absolute times.")
+    parser.add_option("--properties", dest="properties", help="Tracker properties file, sets the number of concurrent connections to 'server.connections'.")
+    parser.add_option("--connections", type="int", dest="connections", help="Maximum number of concurrent connections. (default: 'server.connections' of properties or 100)")
+    parser.add_option("--interval", type="float", dest="interval", default=10.0, help="Interval of progress reports in seconds. (default: 10)")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) == 0 or options.host is None or options.port is None or options.speedup <= 0:
+        parser.print_help()
+        exit(1)
+
+    if options.connections is None:
+        if options.properties is not None:
+            options.connections = int(
+                client.properties(options.properties).get("server.connections", 100))
+        else:
+            options.connections = 100
+
+    fleet = [(name, samples) for (name, samples) in readers.traces(args) if len(samples) > 0]
+    if len(fleet) == 0:
+        print("No traces found.")
+        exit(1)
+    for (name, samples) in fleet:
+        samples.sort(key=lambda sample: sample["time"])
+
+    replay = Replay(options.host, options.port, fleet, options.speedup, options.align,
+                    options.connections)
+    print("Replay %s vehicles with %s samples over %.2f s ..." % (
+        len(fleet), replay.count, replay.duration))
+    replay.run(options.interval)
+    print(replay.summary())
@@ -19,15 +19,22 @@ __license__ = "Apache-2.0"
 
 import optparse
 import json
-import subprocess
+import socket
+import sys
 import time
-import datetime
+import client
+import thin
+import readers
 
 parser = optparse.OptionParser("stream.py [options]")
 parser.add_option("--host", dest="host", help="IP address of tracker.")
 parser.add_option("--port", dest="port", help="Port of tracker.")
-parser.add_option("--file", dest="file", help="JSON file with sample data.")
+parser.add_option("--file", dest="file", help="JSON, NDJSON or CSV file with sample data, optionally gzip compressed.")
 parser.add_option("--id", dest="id", help="Object id.")
+parser.add_option("--thin", action="store_true", dest="thin", default=False, help="Remove speed outliers, collapse stationary samples and drop samples below minimum interval and distance before submission.")
+parser.add_option("--properties", dest="properties", help="Server properties file with thresholds 'matcher.interval.min' and 'matcher.distance.min' for thinning.")
+parser.add_option("--speed", type="float", dest="speed", default=thin.SPEED, help="Maximum speed in meters per second for thinning, faster samples are outliers. (default: %s)" % thin.SPEED)
+parser.add_option("--stationary", type="float", dest="stationary", default=thin.STATIONARY, help="Maximum step in meters of stationary samples for thinning. (default: %s)" % thin.STATIONARY)
 parser.add_option("--step", action="store_true", dest="step", default=False, help="Send stepwise.")
 
 (options, args) = parser.parse_args()
@@ -36,22 +43,36 @@ if options.file == None or options.host == None or options.port == None:
     parser.print_help()
     exit(1)
 
-with open(options.file) as jsonfile:
-    samples = json.load(jsonfile)
+samples = readers.samples(options.file)
 
 previous = None
 
-for sample in samples:
-    if options.id != None:
-        sample["id"] = options.id
-    if isinstance(sample['time'], (int, long)):
-        current = time.mktime(datetime.datetime.fromtimestamp(sample['time'] / 1000).timetuple())
+if options.id != None:
+    samples = readers.identify(samples, options.id)
+
+if options.thin:
+    if options.properties is not None:
+        (interval, distance) = thin.thresholds(client.properties(options.properties))
     else:
-        current = time.mktime(datetime.datetime.strptime(sample['time'][:-5], "%Y-%m-%d %H:%M:%S").timetuple())
+        (interval, distance) = (1000, 0)
+    (samples, stats) = thin.thin(samples, interval, distance, options.speed, options.stationary)
+    print(thin.report(stats))
+
+for sample in samples:
+    current = sample['time'] / 1000.0
     if options.step == True:
         raw_input("Press Enter to continue...")
     elif previous != None:
         time.sleep(current - previous)
     previous = current
     print(json.dumps(sample))
-    subprocess.call("echo '%s' | netcat %s %s" % (json.dumps(sample), options.host, options.port), shell=True)
+    s = socket.create_connection((options.host, int(options.port)))
+    try:
+        s.sendall(json.dumps(sample) + "\n")
+        s.shutdown(socket.SHUT_WR)
+        buf = s.recv(4096)
+        while buf:
+            sys.stdout.write(buf)
+            buf = s.recv(4096)
+    finally:
+        s.close()
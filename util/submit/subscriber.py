@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import optparse
+import getpass
+import os
+import re
+import json
+import time
+import threading
+import collections
+import Queue
+import StringIO
+import numpy
+import psycopg2
+import zmq
+import client
+
+# Subscriber of tracker updates
+#
+# A receiver thread reads updates from the tracker's ZeroMQ publisher port into a bounded queue;
+# if the queue is full, updates are dropped and counted, which shows that the consumer does not
+# keep up. The consumer decodes updates, keeps the latest state of each object in a bounded table
+# (least recently updated objects are evicted) and flushes updates in batches to a sink, i.e. a
+# PostgreSQL table (COPY) or a directory of columnar numpy files.
+
+POINT = re.compile(r"POINT\s*\(\s*(\S+)\s+(\S+)\s*\)", re.IGNORECASE)
+
+
+class Receiver(threading.Thread):
+
+    def __init__(self, host, port, size=100000):
+        super(Receiver, self).__init__()
+        self.daemon = True
+        self.queue = Queue.Queue(size)
+        self.received = 0
+        self.dropped = 0
+        self.depth = 0
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt(zmq.SUBSCRIBE, b"")
+        self.socket.connect("tcp://%s:%s" % (host, port))
+
+    def run(self):
+        while True:
+            message = self.socket.recv()
+            self.received += 1
+            try:
+                self.queue.put_nowait((time.time(), message))
+            except Queue.Full:
+                self.dropped += 1
+            self.depth = max(self.depth, self.queue.qsize())
+
+
+def decode(message):
+    """Decodes an update into (id, time, lon, lat, candidates), where lon and lat are None and
+    candidates is zero for delete messages."""
+    update = json.loads(message)
+    point = POINT.match(update.get("point", ""))
+    if point is None:
+        return (str(update["id"]), int(update["time"]), None, None, 0)
+    return (str(update["id"]), int(update["time"]), float(point.group(1)),
+            float(point.group(2)), len(update.get("candidates", [])))
+
+
+class States(object):
+    """Latest state of each object, bounded to size objects."""
+
+    def __init__(self, size=100000):
+        self.size = size
+        self.objects = collections.OrderedDict()
+        self.evicted = 0
+        self.outdated = 0
+
+    def update(self, row):
+        previous = self.objects.pop(row[0], None)
+        if previous is not None and previous[1] > row[1]:
+            self.outdated += 1
+            self.objects[row[0]] = previous
+            return False
+        if row[2] is not None:
+            self.objects[row[0]] = row
+            if len(self.objects) > self.size:
+                self.objects.popitem(last=False)
+                self.evicted += 1
+        return True
+
+    def __len__(self):
+        return len(self.objects)
+
+# Batch sinks
+
+
+def field(value):
+    """Value as field of COPY text format, with backslashes and row and column delimiters escaped."""
+    return ("%s" % value).replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r") \
+        .replace("\t", "\\t")
+
+
+class PostGISSink(object):
+
+    def __init__(self, host, port, database, table, user, password):
+        try:
+            self.dbcon = psycopg2.connect(
+                host=host, port=port, database=database, user=user, password=password)
+            self.cursor = self.dbcon.cursor()
+        except:
+            print("Connection to database failed.")
+            exit(1)
+        self.table = table
+        try:
+            self.cursor.execute("""CREATE TABLE IF NOT EXISTS %s(id varchar NOT NULL,
+                time bigint NOT NULL,
+                candidates integer NOT NULL,
+                geom geometry(Point,4326));""" % table)
+            self.dbcon.commit()
+        except Exception as e:
+            print("Database transaction failed. (%s)" % e.pgerror)
+            exit(1)
+
+    def write(self, rows):
+        buf = StringIO.StringIO()
+        for (id, timestamp, lon, lat, candidates) in rows:
+            geom = "\\N" if lon is None else "SRID=4326;POINT(%r %r)" % (lon, lat)
+            buf.write("%s\t%s\t%s\t%s\n" % (field(id), field(timestamp), field(candidates), geom))
+        buf.seek(0)
+        try:
+            self.cursor.copy_from(buf, self.table, columns=("id", "time", "candidates", "geom"))
+            self.dbcon.commit()
+        except Exception as e:
+            print("Database transaction failed. (%s)" % e.pgerror)
+            exit(1)
+
+    def close(self):
+        self.cursor.close()
+        self.dbcon.close()
+
+
+class ColumnarSink(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def write(self, rows):
+        nan = float("nan")
+        numpy.savez(os.path.join(self.path, "updates-%08d.npz" % self.count),
+                    id=numpy.array([row[0] for row in rows]),
+                    time=numpy.array([row[1] for row in rows], dtype="int64"),
+                    lon=numpy.array([nan if row[2] is None else row[2] for row in rows]),
+                    lat=numpy.array([nan if row[3] is None else row[3] for row in rows]),
+                    candidates=numpy.array([row[4] for row in rows], dtype="int32"))
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+class Subscriber(object):
+
+    def __init__(self, receiver, sink, objects=100000, size=10000, interval=1.0):
+        self.receiver = receiver
+        self.sink = sink
+        self.states = States(objects)
+        self.size = size
+        self.interval = interval
+        self.batch = []
+        self.errors = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.flushtime = 0.0
+        self.delay = 0.0
+
+    def flush(self):
+        if len(self.batch) > 0:
+            start = time.time()
+            self.sink.write(self.batch)
+            self.flushtime += time.time() - start
+            self.flushed += len(self.batch)
+            self.flushes += 1
+            self.batch = []
+        self.deadline = time.time() + self.interval
+
+    def run(self, duration=None, report=10.0, stop=None):
+        start = time.time()
+        self.deadline = start + self.interval
+        following = None if report is None else start + report
+        while True:
+            now = time.time()
+            if (duration is not None and now - start >= duration) or \
+                    (stop is not None and stop.is_set()):
+                break
+            try:
+                (received, message) = self.receiver.queue.get(
+                    timeout=max(min(self.deadline - now, 0.5), 0.0))
+                try:
+                    row = decode(message)
+                except (ValueError, KeyError, TypeError):
+                    self.errors += 1
+                    continue
+                self.delay = max(self.delay, time.time() - received)
+                if self.states.update(row):
+                    self.batch.append(row)
+            except Queue.Empty:
+                pass
+            if len(self.batch) >= self.size or time.time() >= self.deadline:
+                self.flush()
+            if following is not None and time.time() >= following:
+                print(self.status())
+                following += report
+        self.flush()
+
+    def status(self):
+        return ("%s received, %s dropped, %s errors, %s flushed in %s batches (%.3f s), "
+                "queue %s (max %s), delay max %.3f s, %s objects (%s evicted, %s outdated)") % (
+            self.receiver.received, self.receiver.dropped, self.errors, self.flushed,
+            self.flushes, self.flushtime, self.receiver.queue.qsize(), self.receiver.depth,
+            self.delay, len(self.states), self.states.evicted, self.states.outdated)
+
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser("subscriber.py [options]",
+                                   description="""Subscribes to updates of the tracker and stores
+                                   them in batches in a PostgreSQL table or a directory of
+                                   columnar numpy files.""")
+    parser.add_option("--tracker_host", dest="tracker_host", default="localhost", help="Hostname of the tracker. (default: localhost)")
+    parser.add_option("--tracker_port", type="int", dest="tracker_port", help="Publisher port of the tracker. (default: 'tracker.port' of properties or 1235)")
+    parser.add_option("--properties", dest="properties", help="Tracker properties file.")
+    parser.add_option("--host", dest="host", help="Hostname of the database.")
+    parser.add_option("--port", dest="port", help="Port of the database.")
+    parser.add_option("--database", dest="database", help="Name of the database.")
+    parser.add_option("--table", dest="table", help="Name of the table of updates.")
+    parser.add_option("--user", dest="user", help="User of the database.")
+    parser.add_option("--password", dest="password", help="User password.")
+    parser.add_option("--directory", dest="directory", help="Directory of columnar files, instead of database table.")
+    parser.add_option("--flush_size", type="int", dest="flush_size", default=10000, help="Number of updates per batch. (default: 10000)")
+    parser.add_option("--flush_interval", type="float", dest="flush_interval", default=1.0, help="Maximum time in seconds between batches. (default: 1)")
+    parser.add_option("--queue", type="int", dest="queue", default=100000, help="Size of receive queue, further updates are dropped. (default: 100000)")
+    parser.add_option("--objects", type="int", dest="objects", default=100000, help="Maximum number of objects in latest state table. (default: 100000)")
+    parser.add_option("--duration", type="float", dest="duration", help="Stop after given number of seconds.")
+    parser.add_option("--report", type="float", dest="report", default=10.0, help="Interval of status reports in seconds. (default: 10)")
+
+    (options, args) = parser.parse_args()
+
+    database = options.host is not None and options.port is not None and \
+        options.database is not None and options.table is not None and options.user is not None
+    if database == (options.directory is not None):
+        parser.print_help()
+        exit(1)
+
+    if options.tracker_port is None:
+        options.tracker_port = 1235
+        if options.properties is not None:
+            options.tracker_port = int(
+                client.properties(options.properties).get("tracker.port", 1235))
+
+    if database:
+        if options.password is None:
+            password = getpass.getpass("Password:")
+        else:
+            password = options.password
+        sink = PostGISSink(options.host, options.port, options.database, options.table,
+                           options.user, password)
+    else:
+        sink = ColumnarSink(options.directory)
+
+    receiver = Receiver(options.tracker_host, options.tracker_port, options.queue)
+    receiver.start()
+    subscriber = Subscriber(receiver, sink, options.objects, options.flush_size,
+                            options.flush_interval)
+    print("Subscribed to tracker %s:%s." % (options.tracker_host, options.tracker_port))
+    try:
+        subscriber.run(options.duration, options.report)
+    except KeyboardInterrupt:
+        subscriber.flush()
+    sink.close()
+    print(subscriber.status())
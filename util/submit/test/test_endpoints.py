@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import io
+import socket
+import time
+import unittest
+import endpoints
+
+ADDRESSES = [("a", 1), ("b", 2), ("c", 3)]
+
+
+class TestEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        # Responses of stub matchers by port, a response is an exception or written as it is
+        self.responses = {}
+        self.calls = []
+        self.request = endpoints.client.request
+
+        def request(host, port, samples, format, output, timeout=None, echo=None, size=None):
+            self.calls.append(port)
+            for response in self.responses[port]:
+                if isinstance(response, Exception):
+                    raise response
+                output.write(memoryview(response))
+                if echo is not None:
+                    echo.write(response)
+            return self.responses[port][0].startswith(b"SUCCESS\n")
+
+        endpoints.client.request = request
+
+    def tearDown(self):
+        endpoints.client.request = self.request
+
+    def test_addresses(self):
+        self.assertEquals([("a", 1), ("b", 2)], endpoints.addresses("a:1, b:2"))
+        self.assertEquals([("a", 1)], endpoints.addresses(None, "a", "1"))
+        self.assertEquals([], endpoints.addresses(None))
+
+    def test_walk(self):
+        matcher = endpoints.Endpoints(ADDRESSES, "hash")
+        smaller = endpoints.Endpoints(ADDRESSES[:2], "hash")
+        moved = 0
+        for i in range(300):
+            order = matcher.walk(str(i))
+            self.assertEquals(3, len(set(order)))
+            self.assertEquals(order, matcher.walk(str(i)))
+            first = smaller.walk(str(i))[0]
+            # Only objects of the removed endpoint move to another endpoint.
+            if order[0].port != 3:
+                self.assertEquals(order[0].port, first.port)
+            else:
+                moved += 1
+                self.assertEquals([e.port for e in order if e.port != 3][0], first.port)
+        self.assertTrue(50 < moved < 150)
+
+    def test_select(self):
+        matcher = endpoints.Endpoints(ADDRESSES, "hash")
+        order = matcher.walk("x")
+        self.assertEquals(order[0], matcher.select("x", []))
+        self.assertEquals(order[1], matcher.select("x", [order[0]]))
+        self.assertEquals(order[2], matcher.select("x", order[:2]))
+        self.assertEquals(None, matcher.select("x", order, again=False))
+        self.assertEquals(order[0], matcher.select("x", order, again=True))
+        self.assertEquals(1, order[1].retries)
+
+        matcher = endpoints.Endpoints(ADDRESSES, "least")
+        (a, b, c) = matcher.endpoints
+        self.assertEquals(a, matcher.select(None, []))
+        self.assertEquals(b, matcher.select(None, []))
+        matcher.complete(a, 0.1, b"SUCCESS", False)
+        self.assertEquals(c, matcher.select(None, []))
+        self.assertEquals(a, matcher.select(None, [c]))
+
+    def test_cooldown(self):
+        matcher = endpoints.Endpoints(ADDRESSES[:2], "least", cooldown=60.0)
+        (a, b) = matcher.endpoints
+        now = time.time()
+        matcher.complete(matcher.select(None, []), 0.1, b"", True)
+        self.assertTrue(now + 59.0 < a.down < now + 61.0)
+        self.assertEquals(b, matcher.select(None, []))
+        matcher.complete(b, 0.1, b"ERROR", False)
+        self.assertEquals(b, matcher.select(None, []))
+        matcher.complete(b, 0.1, b"", True)
+        # All endpoints cooling down, the one that recovers first is used.
+        self.assertEquals(a, matcher.select(None, []))
+        matcher.complete(a, 0.1, b"", True)
+        self.assertTrue(now + 119.0 < a.down < now + 121.0)
+        self.assertEquals(b, matcher.select(None, []))
+        matcher.complete(b, 0.1, b"SUCCESS", False)
+        self.assertEquals((0, 0.0), (b.consecutive, b.down))
+        self.assertEquals((1, 1, 1, 2), (b.successes, b.responses, b.failures, a.failures))
+
+    def test_request(self):
+        matcher = endpoints.Endpoints(ADDRESSES[:2], "least", retries=2)
+        self.responses = {1: [b"SUCC", socket.error("reset")], 2: [b"SUCCESS\n[]\n[]"]}
+        output = io.BytesIO()
+        echo = io.BytesIO()
+
+        self.assertTrue(matcher.request(iter([{"id": "x"}]), "debug", output, echo=echo))
+        # Output of the failed attempt is truncated before the retry.
+        self.assertEquals(b"SUCCESS\n[]\n[]", output.getvalue())
+        self.assertEquals(b"SUCCESS\n[]\n[]", echo.getvalue())
+        self.assertEquals([1, 2], self.calls)
+
+    def test_request_error(self):
+        matcher = endpoints.Endpoints(ADDRESSES[:2], "least", retries=5)
+        self.responses = {1: [b"ERROR\n"], 2: [b"TIMEOUT\n"]}
+        output = io.BytesIO()
+
+        self.assertFalse(matcher.request([{"id": "x"}], "debug", output))
+        # Error responses are deterministic, tried endpoints are not tried again.
+        self.assertEquals([1, 2], self.calls)
+        self.assertEquals(b"TIMEOUT\n", output.getvalue())
+
+    def test_request_failure(self):
+        matcher = endpoints.Endpoints(ADDRESSES[:1], "least", retries=2, cooldown=0.0)
+        self.responses = {1: [socket.error("refused")]}
+
+        self.assertRaises(socket.error, matcher.request, [{"id": "x"}], "debug", io.BytesIO())
+        # Connection failures are retried on the same endpoint.
+        self.assertEquals([1, 1, 1], self.calls)
+        self.assertEquals(3, matcher.endpoints[0].failures)
+
+    def test_request_streamed(self):
+        matcher = endpoints.Endpoints(ADDRESSES[:1])
+        self.responses = {1: [b"SUCCESS\n", b"[]\n[]"]}
+        samples = iter([{"id": "x"}])
+        echo = io.BytesIO()
+
+        self.assertTrue(matcher.request(samples, "debug", io.BytesIO(), echo=echo))
+        self.assertEquals(b"SUCCESS\n[]\n[]", echo.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import unittest
+import numpy
+import thin
+
+# Longitude difference of about 10 meters at the equator
+STEP = 10.0 / (thin.EARTH_RADIUS * numpy.pi / 180.0)
+
+
+def sample(time, lon, lat=0.0):
+    return {"id": "x", "time": time, "point": "POINT(%r %r)" % (lon, lat)}
+
+
+class TestThin(unittest.TestCase):
+
+    def test_arrays(self):
+        (times, lons, lats) = thin.arrays([sample(1000, 11.5, 48.1),
+                                           sample("1970-01-01 00:00:02+0000", 11.6, 48.2)])
+        self.assertEquals([1000, 2000], list(times))
+        self.assertEquals([11.5, 11.6], list(lons))
+        self.assertEquals([48.1, 48.2], list(lats))
+
+    def test_distance(self):
+        self.assertAlmostEquals(10.0, thin.distance(0.0, 0.0, STEP, 0.0), places=6)
+
+    def test_outliers(self):
+        times = numpy.array([0, 1000, 2000, 3000, 4000])
+        lons = numpy.array([0, 1, 20, 3, 4]) * STEP
+        lats = numpy.zeros(5)
+        # 10 m/s, except for the jump to and back from the third sample with 170 m/s.
+        self.assertEquals([False, False, True, False, False],
+                          list(thin.outliers(times, lons, lats, 70.0)))
+        self.assertEquals([False] * 5, list(thin.outliers(times, lons, lats, 200.0)))
+        self.assertEquals([False, False], list(thin.outliers(times[:2], lons[:2], lats[:2])))
+
+    def test_stationary(self):
+        lons = numpy.array([0, 1, 1.1, 1.2, 1.3, 2, 3]) * STEP
+        lats = numpy.zeros(7)
+        # Steps of 1 m between the second and fifth sample collapse to their first and last.
+        self.assertEquals([True, True, False, False, True, True, True],
+                          list(thin.stationary(lons, lats, 5.0)))
+        self.assertEquals([True] * 7, list(thin.stationary(lons, lats, 0.5)))
+
+    def test_minimum(self):
+        times = numpy.array([0, 500, 1000, 1200, 2500, 3000])
+        lons = numpy.array([0, 1, 2, 2.1, 3, 4]) * STEP
+        lats = numpy.zeros(6)
+        self.assertEquals([True, False, True, False, True, False],
+                          list(thin.minimum(times, lons, lats, 1000, 0)))
+        self.assertEquals([True, False, False, False, True, False],
+                          list(thin.minimum(times, lons, lats, 1000, 25)))
+        self.assertEquals([True] * 6, list(thin.minimum(times, lons, lats, 0, 0)))
+        self.assertEquals([], list(thin.minimum(times[:0], lons[:0], lats[:0], 1000, 0)))
+
+    def test_thin(self):
+        samples = [sample(t * 1000, x * STEP) for (t, x) in
+                   [(0, 0), (1, 1), (2, 50), (3, 3), (4, 3.1), (5, 3.2), (6, 3.3), (7, 5)]]
+
+        (kept, stats) = thin.thin(list(reversed(samples)), 1000, 0, 70.0, 5.0)
+
+        self.assertEquals([0, 1000, 3000, 6000, 7000], [s["time"] for s in kept])
+        self.assertEquals(8, stats["samples"])
+        self.assertEquals(5, stats["kept"])
+        self.assertEquals(1, stats["outliers"])
+        self.assertEquals(2, stats["stationary"])
+        self.assertTrue(stats["kept_bytes"] < stats["bytes"])
+
+    def test_thresholds(self):
+        self.assertEquals((1000, 0.0), thin.thresholds({}))
+        self.assertEquals((5000, 10.0), thin.thresholds(
+            {"matcher.interval.min": "5000", "matcher.distance.min": "10"}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import json
+import unittest
+import windows
+
+
+def sample(time, x):
+    return {"id": "x", "time": time, "geom": "POINT(%s 0)" % x}
+
+
+def candidate(time, road, transition=True):
+    result = {"time": time, "point": {"road": road, "frac": 0.5, "heading": "forward"},
+              "geom": "LINESTRING(%s 0, %s 1)" % (road, road)}
+    if transition:
+        result["transition"] = {}
+    return result
+
+
+def window(times, roads, xs=None):
+    xs = xs if xs is not None else times
+    return ([sample(t, x) for (t, x) in zip(times, xs)],
+            [candidate(t, r) for (t, r) in zip(times, roads)])
+
+
+class TestWindows(unittest.TestCase):
+
+    def test_split(self):
+        self.assertEquals([], windows.split([], 10, 2))
+        self.assertEquals([(0, 3)], windows.split([0, 5, 10], 10, 2))
+        self.assertEquals([(0, 3), (2, 5), (4, 6)], windows.split([0, 5, 8, 12, 16, 20], 10, 2))
+        self.assertEquals([(0, 1), (1, 2)], windows.split([0, 100], 10, 2))
+        # Windows start at least one millisecond after their predecessor.
+        self.assertEquals([(0, 2), (2, 3)], windows.split([0, 0, 100], 10, 10))
+
+    def test_stitch_agreeing(self):
+        first = window([0, 1, 2, 3, 4], [1, 1, 2, 2, 3])
+        second = window([2, 3, 4, 5, 6], [9, 2, 3, 3, 4])
+
+        (samples, candidates, seams) = windows.stitch([first, second])
+
+        self.assertEquals([0, 1, 2, 3, 4, 5, 6], [s["time"] for s in samples])
+        self.assertEquals([1, 1, 2, 2, 3, 3, 4], [c["point"]["road"] for c in candidates])
+        self.assertEquals([{"time": 3, "compared": 3, "disagreements": 1, "agreed": True}], seams)
+
+    def test_stitch_disagreeing(self):
+        first = window([0, 1, 2, 3], [1, 1, 2, 2])
+        second = window([1, 2, 3, 4], [7, 8, 9, 9])
+
+        (samples, candidates, seams) = windows.stitch([first, second])
+
+        self.assertEquals([0, 1, 2, 3, 4], [s["time"] for s in samples])
+        self.assertEquals([1, 1, 2, 9, 9], [c["point"]["road"] for c in candidates])
+        self.assertEquals([{"time": 2, "compared": 3, "disagreements": 3, "agreed": False}], seams)
+
+    def test_stitch_without_overlap(self):
+        first = window([0, 1, 2], [1, 1, 2])
+        second = window([5, 6], [3, 4])
+
+        (samples, candidates, seams) = windows.stitch([first, second, ([], [])])
+
+        self.assertEquals([0, 1, 2, 5, 6], [s["time"] for s in samples])
+        self.assertEquals([1, 1, 2, 3, 4], [c["point"]["road"] for c in candidates])
+        self.assertEquals([{"time": 4, "compared": 0, "disagreements": 0, "agreed": False}], seams)
+
+    def test_stitch_same_second(self):
+        # Samples within the same second are told apart by their points.
+        first = window([0, 0, 1, 1, 1], [1, 2, 3, 4, 5], [0, 1, 2, 3, 4])
+        second = window([1, 1, 1, 2, 2], [3, 4, 5, 6, 7], [2, 3, 4, 5, 6])
+
+        (samples, candidates, seams) = windows.stitch([first, second])
+
+        self.assertEquals(["POINT(%s 0)" % x for x in range(7)], [s["geom"] for s in samples])
+        self.assertEquals([1, 2, 3, 4, 5, 6, 7], [c["point"]["road"] for c in candidates])
+        self.assertEquals(3, seams[0]["compared"])
+        self.assertEquals(0, seams[0]["disagreements"])
+
+    def test_coordinates(self):
+        self.assertEquals([[1.5, 2.0], [3.0, 4.0]], windows.coordinates("LINESTRING(1.5 2, 3 4)"))
+        self.assertEquals([[1.0, 2.0]], windows.coordinates("POINT (1 2)"))
+        self.assertEquals([], windows.coordinates("LINESTRING EMPTY"))
+
+    def test_render(self):
+        (samples, candidates) = window([0, 1], [1, 2])
+        candidates[0] = candidate(0, 1, transition=False)
+        candidates.append(dict(candidate(2, 3), geom="LINESTRING EMPTY"))
+
+        self.assertEquals((samples, candidates), windows.parse(
+            windows.render(samples, candidates, "debug")))
+        self.assertEquals({"type": "MultiLineString", "coordinates": [[[2.0, 0.0], [2.0, 1.0]]]},
+                          json.loads(windows.render(samples, candidates, "geojson")))
+        slim = json.loads(windows.render(samples, candidates, "slimjson"))
+        self.assertEquals([1, 2, 3], [point["road"] for point in slim])
+        self.assertFalse("route" in slim[0])
+        self.assertEquals("LINESTRING(2 0, 2 1)", slim[1]["route"])
+        self.assertRaises(ValueError, windows.render, samples, candidates, "json")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import re
+import json
+import numpy
+import client
+
+# Client-side thinning of traces
+#
+# Samples are loaded into numpy arrays and filtered in three stages: speed outliers (samples
+# reached and left with more than the maximum speed) are removed, runs of stationary samples are
+# collapsed to their first and last sample, and samples closer than the minimum interval or
+# distance to the previously kept sample are dropped, as the matcher would do anyway.
+
+EARTH_RADIUS = 6371000.0
+SPEED = 70.0
+STATIONARY = 5.0
+BLOCK = 1024
+
+POINT = re.compile(r"POINT\s*\(\s*(\S+)\s+(\S+)\s*\)", re.IGNORECASE)
+
+# Load samples into arrays of time (epoch milliseconds), longitude and latitude
+
+
+def arrays(samples):
+    times = numpy.array([client.timestamp(sample["time"]) for sample in samples], dtype="int64")
+    points = numpy.array([POINT.match(sample["point"]).groups() for sample in samples],
+                         dtype="float64").reshape(-1, 2)
+    return (times, points[:, 0], points[:, 1])
+
+
+def distance(lons1, lats1, lons2, lats2):
+    (lons1, lats1, lons2, lats2) = [numpy.radians(a) for a in (lons1, lats1, lons2, lats2)]
+    a = numpy.sin((lats2 - lats1) / 2.0) ** 2 + \
+        numpy.cos(lats1) * numpy.cos(lats2) * numpy.sin((lons2 - lons1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+# Mask of samples that are reached and left with more than speed meters per second
+
+
+def outliers(times, lons, lats, speed=SPEED):
+    mask = numpy.zeros(len(times), dtype=bool)
+    if len(times) < 3:
+        return mask
+    steps = distance(lons[:-1], lats[:-1], lons[1:], lats[1:])
+    speeds = steps / numpy.maximum(numpy.diff(times) / 1000.0, 1e-3)
+    mask[1:-1] = (speeds[:-1] > speed) & (speeds[1:] > speed)
+    return mask
+
+# Mask of samples to keep after collapsing runs of steps shorter than radius meters
+
+
+def stationary(lons, lats, radius=STATIONARY):
+    mask = numpy.ones(len(lons), dtype=bool)
+    if len(lons) < 3:
+        return mask
+    still = distance(lons[:-1], lats[:-1], lons[1:], lats[1:]) < radius
+    # Sample i is inside a run if it is reached and left with a stationary step.
+    mask[1:-1] = ~(still[:-1] & still[1:])
+    return mask
+
+# Mask of samples to keep with the matcher's rule: a sample is kept if it is at least interval
+# milliseconds and distance meters apart from the previously kept sample.
+
+
+def minimum(times, lons, lats, interval, distance_min):
+    mask = numpy.zeros(len(times), dtype=bool)
+    if len(times) == 0:
+        return mask
+    # First sample that is at least interval milliseconds after each sample
+    following = numpy.searchsorted(times, times + max(interval, 0), side="left")
+    current = 0
+    while current < len(times):
+        mask[current] = True
+        candidate = max(following[current], current + 1)
+        # Searches blockwise for the next sample far enough from the current one.
+        while distance_min > 0 and candidate < len(times):
+            block = slice(candidate, candidate + BLOCK)
+            far = distance(lons[current], lats[current], lons[block], lats[block]) >= distance_min
+            if far.any():
+                candidate += numpy.argmax(far)
+                break
+            candidate += len(far)
+        current = candidate
+    return mask
+
+# Filter samples and return kept samples and statistics
+
+
+def thin(samples, interval=1000, distance_min=0, speed=SPEED, radius=STATIONARY):
+    samples = sorted(samples, key=lambda sample: client.timestamp(sample["time"]))
+    (times, lons, lats) = arrays(samples)
+
+    keep = ~outliers(times, lons, lats, speed)
+    removed = len(times) - numpy.count_nonzero(keep)
+    indices = numpy.nonzero(keep)[0]
+    indices = indices[stationary(lons[indices], lats[indices], radius)]
+    collapsed = len(times) - removed - len(indices)
+    indices = indices[minimum(times[indices], lons[indices], lats[indices], interval,
+                              distance_min)]
+
+    kept = [samples[i] for i in indices]
+    stats = {"samples": len(samples), "kept": len(kept), "outliers": removed,
+             "stationary": collapsed, "bytes": len(json.dumps(samples)),
+             "kept_bytes": len(json.dumps(kept))}
+    return (kept, stats)
+
+# Thresholds from server properties
+
+
+def thresholds(properties):
+    return (int(properties.get("matcher.interval.min", 1000)),
+            float(properties.get("matcher.distance.min", 0)))
+
+
+def report(stats):
+    return "Thinned %s to %s samples (%s outliers, %s stationary), %s to %s bytes (%.1f%%)." % (
+        stats["samples"], stats["kept"], stats["outliers"], stats["stationary"], stats["bytes"],
+        stats["kept_bytes"], 100.0 * stats["kept_bytes"] / max(stats["bytes"], 1))
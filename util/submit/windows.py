@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable law or agreed to in
+# writing, software distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+#
+
+__license__ = "Apache-2.0"
+
+import io
+import json
+import threading
+import Queue
+import client
+
+# Windowed matching of long traces
+#
+# A trace is split into time windows of given length that overlap their successor, windows are
+# matched concurrently in debug format and the results are stitched at one sample of each overlap.
+# The seam is the sample (closest to the middle of the overlap) where both windows agree on the
+# matched road, as the beginning and the end of a window lack context of the other part of the
+# trace. Stitched results are rendered into the requested output format.
+
+# Split samples into windows
+#
+# Returns list of (first, last) sample index ranges (last exclusive) of windows of 'window'
+# milliseconds, where each window starts 'window - overlap' milliseconds after its predecessor.
+
+
+def split(times, window, overlap):
+    if len(times) == 0:
+        return []
+    step = max(window - overlap, 1)
+    ranges = []
+    first = 0
+    while True:
+        begin = times[first]
+        last = first
+        while last < len(times) and times[last] <= begin + window:
+            last += 1
+        ranges.append((first, last))
+        if last >= len(times):
+            return ranges
+        following = first
+        while times[following] < begin + step:
+            following += 1
+        first = max(following, first + 1)
+
+# Parse debug output into samples and candidates
+
+
+def parse(body):
+    lines = body.split("\n")
+    return (json.loads(lines[0]), json.loads(lines[1]))
+
+
+def road(candidate):
+    point = candidate["point"]
+    return (point["road"], point.get("heading"))
+
+# Stitch window results
+#
+# Results are (samples, candidates) of debug output in window order, where candidates are matched
+# to samples by position. Returns stitched samples and candidates and a list of seams with time
+# (seconds) of the seam, number of samples compared in the overlap and number of samples with
+# disagreeing roads.
+
+
+def identify(samples):
+    """Keys of samples in the same order. Times of debug output are whole seconds, so samples are
+    identified by time, point and occurrence of both."""
+    counts = {}
+    keys = []
+    for sample in samples:
+        key = (sample["time"], sample.get("geom"))
+        counts[key] = counts.get(key, -1) + 1
+        keys.append(key + (counts[key],))
+    return keys
+
+
+def stitch(results):
+    (samples, candidates) = (list(results[0][0]), list(results[0][1]))
+    seams = []
+
+    for (following_samples, following_candidates) in results[1:]:
+        if len(following_candidates) == 0:
+            continue
+        if len(candidates) == 0:
+            (samples, candidates) = (list(following_samples), list(following_candidates))
+            continue
+
+        begin = following_samples[0]["time"]
+        start = next((i for (i, s) in enumerate(samples) if s["time"] >= begin), len(samples))
+        previous = dict((key, start + i) for (i, key) in enumerate(identify(samples[start:])))
+        # Pairs of indices of samples of the overlap in both windows
+        overlap = [(previous[key], j) for (j, key) in enumerate(identify(following_samples))
+                   if key in previous]
+
+        if len(overlap) == 0:
+            (cut, following_cut) = (start - 1, -1)
+            seams.append({"time": begin - 1, "compared": 0, "disagreements": 0, "agreed": False})
+        else:
+            agreeing = [k for (k, (i, j)) in enumerate(overlap)
+                        if road(candidates[i]) == road(following_candidates[j])]
+            middle = len(overlap) // 2
+            if len(agreeing) > 0:
+                (cut, following_cut) = overlap[min(agreeing, key=lambda k: abs(k - middle))]
+            else:
+                (cut, following_cut) = overlap[middle]
+            seams.append({"time": samples[cut]["time"], "compared": len(overlap),
+                          "disagreements": len(overlap) - len(agreeing),
+                          "agreed": len(agreeing) > 0})
+
+        samples = samples[:cut + 1] + list(following_samples[following_cut + 1:])
+        candidates = candidates[:cut + 1] + list(following_candidates[following_cut + 1:])
+
+    return (samples, candidates, seams)
+
+# Render stitched results in output format
+
+
+def coordinates(wkt):
+    if "(" not in wkt:
+        return []  # Empty geometry, e.g. 'LINESTRING EMPTY'
+    points = wkt[wkt.index("(") + 1:wkt.rindex(")")].split(",")
+    return [[float(x) for x in point.split()] for point in points]
+
+
+def render(samples, candidates, format):
+    if format == "debug":
+        return "%s\n%s" % (json.dumps(samples), json.dumps(candidates))
+    elif format == "slimjson":
+        output = []
+        for candidate in candidates:
+            point = dict(candidate["point"])
+            if "transition" in candidate:
+                point["route"] = candidate["geom"]
+            output.append(point)
+        return json.dumps(output)
+    elif format == "geojson":
+        lines = [coordinates(c["geom"]) for c in candidates if "transition" in c]
+        return json.dumps({"type": "MultiLineString",
+                           "coordinates": [line for line in lines if len(line) > 0]})
+    raise ValueError("Output format %s is not supported for windowed matching." % format)
+
+# Match samples in windows and write stitched response to output file
+#
+# Windows are submitted to matcher endpoints (see endpoints.py). Returns (success, seams), where
+# success is True if all windows have been matched.
+
+
+def request(endpoints, samples, format, output, window, overlap, connections, timeout=None,
+            echo=None):
+    times = [client.timestamp(sample["time"]) for sample in samples]
+    ranges = split(times, window, overlap)
+    results = [None] * len(ranges)
+    pending = Queue.Queue()
+    for i in range(len(ranges)):
+        pending.put(i)
+
+    def submit():
+        while True:
+            try:
+                i = pending.get_nowait()
+            except Queue.Empty:
+                break
+            response = io.BytesIO()
+            try:
+                if endpoints.request(samples[ranges[i][0]:ranges[i][1]], "debug", response,
+                                     timeout):
+                    results[i] = parse(response.getvalue()[len("SUCCESS\n"):].strip())
+            except Exception as e:
+                print("Window %s failed. (%s)" % (i, e))
+
+    workers = [threading.Thread(target=submit) for i in range(min(connections, len(ranges)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if len(ranges) == 0 or None in results:
+        response = "ERROR\n"
+        seams = []
+    else:
+        (stitched_samples, stitched_candidates, seams) = stitch(results)
+        response = "SUCCESS\n%s\n" % render(stitched_samples, stitched_candidates, format)
+
+    output.write(response)
+    if echo is not None:
+        echo.write(response)
+    return (response.startswith("SUCCESS\n"), seams)